@@ -1,14 +1,32 @@
 import sys
+import os
 import pandas as pd
+import numpy as np
 import pickle
+import random
+import multiprocessing
+from functools import partial
 
 # add path to load own functions from .py files in other dirs
 project_path = "d:\\PYTHON\\CS_Bootcamp\\programs\\cs-intrusion-detection-system"
 sys.path.insert(0, project_path + '\scripts')
 sys.path.insert(0, project_path + '\model')
 
+import preprocessing
 from preprocessing import *
 from model_evaluation import *
+from feature_cache import get_feature_cache_key, load_feature_entry, save_feature_entry
+from cascade import apply_cascade, get_cascade_stats, load_cascade, merge_cascade_stats, new_cascade_state, \
+    print_cascade_stats
+from prediction_writer import close_prediction_writer, open_prediction_writer, write_prediction_file, \
+    write_predictions
+from prediction_cache import CACHE_MAX_ENTRIES, load_prediction_cache, merge_dedup_stats, new_dedup_state, \
+    predict_unique_rows, print_dedup_stats, save_prediction_cache
+from stage_metrics import PROFILE_STAGE, STAGES, add_stage_rows, measure_iteration, measure_stage, merge_stage_metrics, \
+    new_stage_metrics, print_stage_metrics, save_profile, summarize_stage_metrics, write_metrics_file
+import tree_engine
+from tree_engine import EARLY_EXIT_MODES, compile_pipeline, encode_categories, get_compiled_model_path, is_compiled_model, \
+    load_compiled_model, merge_early_exit_stats, predict_proba_compiled, print_early_exit_stats
 
 # ------------------------------------------ Variables ------------------------------
 
@@ -40,10 +58,56 @@ filename = "KDDTest+.txt"
 # Models avaiable for prediction (saved as pkl files, or as functions when starting with BM)
 MODELS = {
      "RF": 'model/random_forest_model.pkl',
+     "RF_compressed": 'model/random_forest_model_compressed.pkl', # smaller forest, see scripts/compress_model.py
      "BM_mal": baseline_model_malicious,
      "BM_rand": baseline_model_random,
      "BM_protocol": baseline_model_risky_protocol,
      } 
+# columns read for the baseline models (BM_mal and BM_rand only need the nr of rows)
+MODEL_INPUT_COLUMNS = {
+     "BM_mal": ["duration"],
+     "BM_rand": ["duration"],
+     "BM_protocol": ["protocol_type"],
+     }
+# optional CLI arguments '--name value' with their default values (flags are False by default)
+CLI_OPTIONS = {
+     "--chunk-size": 0,     # nr of rows read, predicted and written at once, 0 reads the whole file
+     "--serve": False,      # keep the model loaded and answer prediction requests via HTTP
+     "--port": 8000,        # port of the prediction server (localhost only)
+     "--batch-window-ms": 5.0,  # max. time the server waits to predict requests together
+     "--follow": False,     # predict the lines appended to the input file (or stdin for '-') until stopped
+     "--max-batch-rows": 20000, # --follow: max. nr of rows predicted at once (the batch size adapts to the load)
+     "--idle-exit": 0.0,    # --follow: stop after this many seconds without new lines, 0: follow until Ctrl+C
+     "--alerts-file": "",   # --follow: also append the row nr and score of every malicious row to this file
+     "--engine": "sklearn", # predict with "sklearn" or the compiled model ("numpy", see scripts/tree_engine.py)
+     "--workers": 1,        # nr of processes that predict parts (shards) of the input file in parallel
+     "--plot-file": "",     # mode 2: save the confusion matrix to this image file (e.g. confusion_matrix.png)
+     "--profile": False,    # print time, rows and memory of every step of the prediction
+     "--metrics-file": "",  # write the metrics of --profile to this file (.json, otherwise Prometheus text format)
+     "--cprofile": "",      # save cProfile stats of one step to this file (e.g. predict.prof)
+     "--cprofile-stage": PROFILE_STAGE, # step profiled with --cprofile (load_model, read, preprocess, predict, write)
+     "--dedup": False,      # predict identical rows only once (models from pickle files)
+     "--cache-dir": "",     # keep the predictions of --dedup across runs in this directory (implies --dedup)
+     "--cache-size": CACHE_MAX_ENTRIES, # max. nr of rows in the cache of a model, the least recently used are removed
+     "--cascade": False,    # decide easy rows with the rules fitted by scripts/cascade.py, the model predicts the rest
+     "--threshold": -1.0,   # predict malicious if its probability is >= threshold, -1: the class with the highest probability
+     "--scores": False,     # write the probability of malicious after each prediction ("label,score")
+     "--target-recall": -1.0,   # mode 2: find the threshold with at least this recall (e.g. 0.99), -1: no search
+     "--target-fpr": -1.0,  # mode 2: find the threshold with at most this false positive rate (e.g. 0.01), -1: no search
+     "--feature-cache": "", # keep the encoded features of input files in this directory (e.g. .cache/features)
+     "--output": "",        # output file instead of prediction.txt, the format follows from the extension 
+                            # (.txt, .gz, .zst, .npy, .parquet, see scripts/prediction_writer.py)
+     "--alerts-only": False,    # only write the row nr and score of the malicious rows
+     "--compact": False,    # read the input with the narrower data types of COMPACT_DTYPES (less memory)
+     "--memory-report": False,  # print the memory of every column of the input after the preprocessing
+     "--early-exit": "",    # --engine numpy: stop evaluating the trees for a row when its class is decided,
+                            # "exact" (same classes as all trees) or "bound" (stops earlier, see scripts/tree_engine.py)
+     }
+SHARDS_PER_WORKER = 4       # more shards than workers, so that workers finishing early get more work
+MAX_SHARD_BYTES = 64 * 1024**2  # limits the memory per worker for large files
+worker_state = {}           # model, loaded model and schema of a worker process (see init_worker)
+ENGINES = ["sklearn", "numpy"]
+CLASS_NAMES = ["genuine", "malicious"] # names of the labels 0 and 1 in the evaluation
 # path = "d:/PYTHON/CS_Bootcamp/programs/cs-intrusion-detection-system/data/KDDTest+.txt"
 # ---------------------------------------------------------------------------------------
 
@@ -73,74 +137,808 @@ def find_model(input_arg:str, models:dict) -> tuple | None:
     return
 
 
-def write_prediction_output(output_file, predictions):
-    # write predictions to a text file with one line per prediction
-    with open(output_file, "w", encoding="utf-8", newline="") as f: 
-            
-            for prediction in predictions: 
-                    f.write(str(prediction) + "\n")
+def parse_options(arguments:list, options:dict) -> tuple | None:
+    """
+    Separate optional '--name value' arguments from the positional CLI arguments.
+
+    - Values are converted to the type of the default value in options.
+    - Options with a boolean default are flags and take no value.
+
+    Args:
+        arguments (list):   CLI arguments (sys.argv)
+        options (dict):     where the keys are the option names and values the defaults
+
+    Returns:
+        tuple | None:   list of positional arguments and dict with all option values, 
+                        or None if an option is unknown or its value is invalid.
+    """
+    positional = []
+    values = dict(options)
+    remaining = iter(arguments)
+
+    for argument in remaining:
+        if not argument.startswith("--"):
+            positional.append(argument)
+            continue
+
+        if argument not in options:
+            print(f"- Error: Unknown option {argument}. Expects one of {list(options.keys())}.")
+            return
+        
+        default = options[argument]
+        if isinstance(default, bool):
+            values[argument] = True
+            continue
+
+        value = next(remaining, None)
+        try:
+            values[argument] = type(default)(value)
+        except (TypeError, ValueError):
+            print(f"- Error: Option {argument} expects a value of type {type(default).__name__}, got {value}.")
+            return
+
+    return positional, values
+
+
+def write_prediction_output(output_file, predictions, scores=None, alerts_only=False):
+    # write all predictions at once with one line per prediction (and its score, if given),
+    # or in the format of the file extension (see scripts/prediction_writer.py)
+    write_prediction_file(output_file, predictions, scores, alerts_only)
+
+
+def load_model(model:tuple, engine="sklearn"):
+    """
+    Return the model object for a model tuple from find_model(): 
+    the function for baseline models, or the model loaded from its pickle file.
+
+    With engine "numpy" the compiled model (.npz next to the pickle file, see scripts/tree_engine.py)
+    is returned instead. If it does not exist, the pickled model is compiled in memory.
+    """
+    if model[0].startswith('BM'):
+        # use baseline model function
+        return model[1]
+
+    if engine == "numpy":
+        compiled = load_compiled_model(get_compiled_model_path(model[1]))
+        if compiled is not None:
+            return compiled
+        print(f"- Compiling {model[1]} (save the compiled model with: python scripts/tree_engine.py {model[1]})")
+
+    # load model from pickle file 
+    with open(model[1], 'rb') as f:
+        loaded_model = pickle.load(f)
+
+    if engine == "numpy":
+        compiled = compile_pipeline(loaded_model)
+        if compiled is not None:
+            return compiled
+        print("- Using sklearn to predict.")
+    return loaded_model
+
+
+def load_model_schema(model:tuple, loaded_model) -> dict | None:
+    """
+    Return the feature schema (categories of the training data) for a model loaded from a pickle file.
+    The schema is read from the json file next to the model file, 
+    otherwise it is taken from the encoder of the loaded model. Baseline models have no schema.
+    The recoding statistics of the training data (see fit_recoding_statistics), if stored next to 
+    the model file, are added to the schema with the key "recoding".
+    """
+    if model[0].startswith('BM'):
+        return
+
+    schema = load_feature_schema(get_schema_path(model[1]))
+    if schema is None and is_compiled_model(loaded_model):
+        schema = {"version": FEATURE_SCHEMA_VERSION, 
+                  "categories": dict(zip(loaded_model["features"], loaded_model["categories"]))}
+    elif schema is None:
+        schema = get_feature_schema(loaded_model)
+
+    recoding = load_recoding_statistics(get_recoding_path(model[1]))
+    if recoding is not None:
+        schema = dict(schema or {"version": FEATURE_SCHEMA_VERSION, "categories": {}}, recoding=recoding)
+    return schema
+
+
+def get_model_input_columns(model:tuple, loaded_model, cascade=None) -> list | None:
+    """
+    Return the raw columns of the input data that the model needs, so that only these are read.
+    With cascade, the columns of its rules are added.
+    Returns None (read all columns) if the columns of the model cannot be found.
+    """
+    if model[0].startswith('BM'):
+        return MODEL_INPUT_COLUMNS.get(model[0])
+
+    if is_compiled_model(loaded_model):
+        features = list(loaded_model["features"])
+    else:
+        features = get_model_features(loaded_model)
+        if features is None:
+            return
+
+    if cascade is not None:
+        rule_columns = cascade["cascade"]["rule_features"] + [column for stage in cascade["cascade"]["baseline_stages"] 
+                                                              for column in MODEL_INPUT_COLUMNS.get(stage["name"], [])]
+        features += [column for column in rule_columns if column not in features]
+    return get_input_columns(features)
+
+
+def predict_data(model:tuple, loaded_model, df_test:pd.DataFrame, schema=None, metrics=None, dedup=None, cascade=None):
+    """
+    Preprocess the data in df_test (if needed) and return the predictions of the loaded model. 
+    Baseline models predict from the raw data, models loaded from a pickle file 
+    need the preprocessed features they were trained on (with the categories from schema).
+    With metrics, the time of the preprocessing and the prediction is measured (see scripts/stage_metrics.py).
+    With dedup, identical rows are only predicted once (see scripts/prediction_cache.py).
+    With cascade, the rows decided by the rules of the cascade are not predicted by the model (see scripts/cascade.py).
+    """
+    if model[0].startswith('BM'):
+        with measure_stage(metrics, "predict", len(df_test)):
+            return loaded_model(df_test)
+
+    return predict_data_proba(model, loaded_model, df_test, schema, metrics, dedup, cascade)[0]
+
+
+def predict_labels(model:tuple, loaded_model, df_test:pd.DataFrame, schema=None, metrics=None, dedup=None, 
+                   cascade=None, threshold=None) -> tuple:
+    """
+    Return the predictions and the probabilities for class 1 (malicious) from a single run of the model 
+    (see predict_data_proba). With threshold, a row is predicted as malicious if its probability is >= threshold,
+    otherwise the class with the highest probability is predicted (threshold 0.5, but genuine for a tie).
+    """
+    predictions, probabilities = predict_data_proba(model, loaded_model, df_test, schema, metrics, dedup, cascade)
+    return apply_threshold(predictions, probabilities, threshold)
+
+
+def apply_threshold(predictions, probabilities:np.ndarray, threshold=None) -> tuple:
+    # see predict_labels(), the predictions are only changed with a threshold
+    if threshold is not None:
+        predictions = (probabilities >= threshold).astype(np.int64)
+    return predictions, probabilities
+
+
+def predict_data_proba(model:tuple, loaded_model, df_test:pd.DataFrame, schema=None, metrics=None, dedup=None, 
+                       cascade=None) -> tuple:
+    """
+    Same as predict_data(), but return the predictions and the probabilities for class 1 (malicious).
+    
+    - The predictions are derived from the probabilities, so the model is only run once.
+    - Baseline models have no probabilities, their predictions are used instead. 
+    - Compiled models (engine "numpy") predict from the category codes of the features, without sklearn.
+    """
+    if model[0].startswith('BM'):
+        with measure_stage(metrics, "predict", len(df_test)):
+            predictions = np.asarray(loaded_model(df_test)).astype(int)
+        return predictions, predictions.astype(float)
+
+    if cascade is not None:
+        return predict_with_cascade(model, loaded_model, df_test, schema, metrics, dedup, cascade)
+
+    # Preprocessing / feature engineering
+    with measure_stage(metrics, "preprocess", len(df_test)):
+        categorial_features = preprocessing_categories(df_test, schema)
+
+    with measure_stage(metrics, "predict", len(df_test)):
+        return predict_features(loaded_model, df_test, categorial_features, dedup)
+
+
+def predict_with_cascade(model:tuple, loaded_model, df_test:pd.DataFrame, schema, metrics, dedup, cascade:dict) -> tuple:
+    # see predict_data_proba(): the rules of the cascade decide first, the model predicts the remaining rows
+    with measure_stage(metrics, "cascade", len(df_test)):
+        decided, predictions, probabilities = apply_cascade(cascade, df_test)
+
+    if not decided.all():
+        model_predictions, model_probabilities = predict_data_proba(model, loaded_model, df_test.iloc[np.flatnonzero(~decided)].copy(), 
+                                                                    schema, metrics, dedup)
+        predictions = predictions.astype(np.result_type(predictions, model_predictions))
+        predictions[~decided] = model_predictions
+        probabilities[~decided] = model_probabilities
+    return predictions, probabilities
+
+
+def predict_features(loaded_model, df_test:pd.DataFrame, categorial_features:list, dedup=None) -> tuple:
+    # predictions and probabilities for class 1 of a model from a pickle file (or compiled) for preprocessed data
+    df_X = select_model_features(loaded_model, df_test, categorial_features)
+    if dedup is None:
+        return predict_model_input(loaded_model, df_X)
+    return predict_unique_rows(partial(predict_model_input, loaded_model), df_X, dedup)
+
+
+def select_model_features(loaded_model, df_test:pd.DataFrame, categorial_features:list) -> pd.DataFrame:
+    # DF with the features the model was trained on
+    if is_compiled_model(loaded_model):
+        return df_test[list(loaded_model["features"])]
+    # numerical features are only read if the model uses them, see get_model_input_columns
+    return df_test[[feature for feature in numerical_features if feature in df_test] + categorial_features]
+
+
+def predict_model_input(loaded_model, df_X:pd.DataFrame) -> tuple:
+    # see predict_features(), df_X has the features the model was trained on
+    return predict_encoded_input(loaded_model, encode_model_input(loaded_model, df_X))
+
+
+def encode_model_input(loaded_model, df_X:pd.DataFrame):
+    # input of the model after its encoding: the category codes of a compiled model, 
+    # or the output of all steps of the pipeline before the last one (e.g. the one-hot encoded matrix)
+    if is_compiled_model(loaded_model):
+        return encode_categories(loaded_model, df_X)
+    if hasattr(loaded_model, "steps"):
+        return loaded_model[:-1].transform(df_X)
+    return df_X
+
+
+def predict_encoded_input(loaded_model, encoded_X) -> tuple:
+    # see predict_model_input(), encoded_X from encode_model_input()
+    if is_compiled_model(loaded_model):
+        probabilities = predict_proba_compiled(loaded_model, encoded_X)
+        classes = loaded_model["classes"]
+    else:
+        estimator = loaded_model[-1] if hasattr(loaded_model, "steps") else loaded_model
+        probabilities = estimator.predict_proba(encoded_X)
+        classes = estimator.classes_
+
+    # same as loaded_model.predict(df_X), which takes the class with the highest probability
+    predictions = classes[np.argmax(probabilities, axis=1)]
+    return predictions, probabilities[:, 1]
+
+
+def get_encoder_parts(loaded_model, schema=None) -> list:
+    """
+    Return the description of how a model encodes its input for the key of the feature cache 
+    (see get_feature_cache_key in scripts/feature_cache.py): the features and categories of a compiled model
+    or the pickled steps of the pipeline before the model, and the feature schema used by the preprocessing.
+    Models with the same encoding share their cache entries.
+    """
+    if is_compiled_model(loaded_model):
+        return ["numpy", list(loaded_model["features"]), list(loaded_model["categories"]), schema]
+    if hasattr(loaded_model, "steps"):
+        return ["sklearn", pickle.dumps(loaded_model[:-1]), schema]
+    return ["sklearn", schema]
+
+
+def predict_with_feature_cache(model:tuple, loaded_model, filepath:str, schema:dict, cache_dir:str, metrics=None, 
+                               threshold=None) -> tuple | None:
+    """
+    Same as reading the file and predict_labels(), but the encoded input of the model (see encode_model_input)
+    is loaded from the feature cache in cache_dir (memory-mapped, see scripts/feature_cache.py).
+    If it is not there yet, the file is read, preprocessed and encoded, and the result is saved in the cache.
+    Returns None if the file cannot be read.
+    """
+    with measure_stage(metrics, "read"):
+        key = get_feature_cache_key(filepath, get_encoder_parts(loaded_model, schema))
+        entry = load_feature_entry(cache_dir, key)
+
+    if entry is not None:
+        encoded_X = entry["arrays"]["X"]
+        add_stage_rows(metrics, "read", encoded_X.shape[0])
+        print(f"- Using the encoded features from the cache {os.path.join(cache_dir, key)}")
+    else:
+        with measure_stage(metrics, "read"):
+            df_test = read_data_to_df(filepath, get_model_input_columns(model, loaded_model))
+        if df_test is None:
+            return
+        add_stage_rows(metrics, "read", len(df_test))
+
+        with measure_stage(metrics, "preprocess", len(df_test)):
+            categorial_features = preprocessing_categories(df_test, schema)
+            encoded_X = encode_model_input(loaded_model, select_model_features(loaded_model, df_test, categorial_features))
+        save_feature_entry(cache_dir, key, {"X": encoded_X})
+
+    with measure_stage(metrics, "predict", encoded_X.shape[0]):
+        predictions, probabilities = predict_encoded_input(loaded_model, encoded_X)
+    return apply_threshold(predictions, probabilities, threshold)
+
+
+def serve_model(model:tuple, port:int, batch_window_ms:float, engine="sklearn", threshold=None):
+    """
+    Load the model once and answer prediction requests until the server is stopped.
+    See scripts/prediction_server.py for the endpoints. With threshold, see predict_labels().
+    """
+    from prediction_server import run_server
+
+    loaded_model = load_model(model, engine)
+    schema = load_model_schema(model, loaded_model)
+    run_server(partial(predict_labels, model, loaded_model, schema=schema, threshold=threshold), 
+               port=port, 
+               batch_window_ms=batch_window_ms)
+
+
+def init_worker(model:tuple, engine:str, settings:dict):
+    """
+    Load the model once per worker process (Pool initializer). settings of run_sharded_prediction():
+    - measure:      measure the stages (True/False)
+    - dedup:        predict identical rows of a shard once (True/False)
+    - cascade:      rules of load_cascade() that decide first, or None
+    - threshold:    see predict_labels()
+    - compact:      read the shards with COMPACT_DTYPES (True/False)
+    - early_exit:   mode of the early exit of the compiled model ("" for all trees)
+    """
+    random.seed() # otherwise forked workers draw the same random numbers for BM_rand
+    preprocessing.COMPACT_MODE = settings["compact"] # not inherited by spawned workers
+    tree_engine.EARLY_EXIT_MODE = settings["early_exit"]
+    tree_engine.EARLY_EXIT_THRESHOLD = settings["threshold"]
+    worker_state.update(settings)
+    worker_state["model"] = model
+    worker_state["loaded_model"] = load_model(model, engine)
+    worker_state["schema"] = load_model_schema(model, worker_state["loaded_model"])
+    worker_state["columns"] = get_model_input_columns(model, worker_state["loaded_model"], 
+                                                      settings["cascade"] and new_cascade_state(settings["cascade"]))
+
+
+def predict_shard(shard:tuple) -> tuple:
+    """
+    Read, preprocess and predict the lines of one shard (filepath, start, end, column_names) in a worker process.
+    Returns the nr of rows, the predictions as compact array and the scores (for the output file and 
+    the evaluation in mode 2), the stage metrics and the counts of the dedup, the cascade and the early exit (or None).
+    """
+    filepath, start, end, column_names = shard
+    tree_engine.early_exit_stats.update(rows=0, tree_evaluations=0) # counts of this shard
+    metrics = new_stage_metrics(worker_state["model"][0]) if worker_state["measure"] else None
+    dedup = new_dedup_state() if worker_state["dedup"] else None
+    cascade = new_cascade_state(worker_state["cascade"]) if worker_state["cascade"] else None
 
+    with measure_stage(metrics, "read"):
+        df_shard = read_data_range(filepath, start, end, column_names, worker_state["columns"])
+    add_stage_rows(metrics, "read", len(df_shard))
 
-def run_prediction():
+    y_prediction, scores = predict_labels(worker_state["model"], worker_state["loaded_model"], df_shard, 
+                                          worker_state["schema"], metrics, dedup, cascade, worker_state["threshold"])
+
+    return (len(df_shard), np.asarray(y_prediction).astype(np.int8), scores, metrics and metrics["stages"], 
+            dedup, cascade and get_cascade_stats(cascade), dict(tree_engine.early_exit_stats))
+
+
+def run_sharded_prediction(model:tuple, filepath:str, workers:int, engine="sklearn", evaluation=None, metrics=None, 
+                           dedup=None, cascade=None, threshold=None, write_scores=False, alerts_only=False):
+    """
+    Predict the input file with several worker processes: the file is split into shards 
+    (byte ranges aligned on line boundaries), each shard is read, preprocessed and predicted 
+    by a worker, and the results are written to the output file in the original row order.
+    The output file is identical to the one written by a single process.
+    The predictions of each shard are added to the evaluation (see update_evaluation), if given.
+    With metrics, the stages are measured in the workers and summed up (the times are the sum of all workers).
+    With dedup, the workers predict the identical rows of their shards once (without the cache of dedup).
+    With cascade, the workers apply its rules first and the counts of the decided rows are added to cascade.
+    threshold, write_scores and alerts_only: see run_prediction().
+    """
+    column_names = get_column_names(filepath)
+    if column_names is None:
+        return
+
+    nr_shards = max(workers * SHARDS_PER_WORKER, os.path.getsize(filepath) // MAX_SHARD_BYTES + 1)
+    shards = [(filepath, start, end, column_names) for start, end in find_line_shards(filepath, nr_shards)]
+    print(f"- Predicting {len(shards)} shards with {workers} workers, writing results to {output_file_name} ...")
+
+    settings = {"measure": metrics is not None, "dedup": dedup is not None, "cascade": cascade and cascade["cascade"],
+                "threshold": threshold, "compact": preprocessing.COMPACT_MODE, "early_exit": tree_engine.EARLY_EXIT_MODE}
+    writer = open_prediction_writer(output_file_name, write_scores, alerts_only)
+    if writer is None:
+        return
+    nr_rows = 0
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(model, engine, settings)) as pool:
+        # imap returns the results in the order of the shards, while later shards are still predicted
+        for shard_rows, y_prediction, scores, shard_stages, shard_dedup, shard_cascade, shard_early_exit \
+                in pool.imap(predict_shard, shards):
+            with measure_stage(metrics, "write", shard_rows):
+                write_predictions(writer, y_prediction, scores)
+            update_evaluation(evaluation, y_prediction, metrics, scores)
+            merge_stage_metrics(metrics, shard_stages or {})
+            merge_dedup_stats(dedup, shard_dedup)
+            merge_cascade_stats(cascade, shard_cascade)
+            merge_early_exit_stats(shard_early_exit)
+            nr_rows += shard_rows
+    close_prediction_writer(writer)
+
+    print(f"- Predicted {nr_rows} rows.")
+    return
+
+
+def follow_prediction(model:tuple, filepath:str, engine="sklearn", max_batch_rows=20000, idle_exit=0.0, 
+                      alerts_file="", metrics=None, dedup=None, cascade=None, threshold=None, write_scores=False, 
+                      alerts_only=False) -> dict | None:
+    """
+    Load the model once and predict the lines of filepath (or stdin for "-") as they are appended,
+    in batches that grow under load (see scripts/follow_input.py). The predictions of every batch are 
+    appended to the output file at once, with alerts_file the row nr (from 0) and score of malicious rows too
+    (in the format of its extension, see scripts/prediction_writer.py).
+    The other arguments are the same as for run_prediction(). Returns the stats with the latency percentiles.
+    """
+    from follow_input import follow_input, print_follow_stats
+
+    with measure_stage(metrics, "load_model"):
+        loaded_model = load_model(model, engine)
+        schema = load_model_schema(model, loaded_model)
+
+    writers = [open_prediction_writer(output_file_name, write_scores, alerts_only)]
+    if alerts_file:
+        writers.append(open_prediction_writer(alerts_file, alerts_only=True))
+    if None in writers:
+        for writer in writers:
+            close_prediction_writer(writer)
+        return
+
+    def handle_batch(first_row:int, predictions, probabilities):
+        # first_row counts the skipped lines too, so the row nrs of the alerts are the line nrs of the input
+        with measure_stage(metrics, "write", len(predictions)):
+            for writer in writers:
+                write_predictions(writer, predictions, probabilities, flush=True, first_row=first_row)
+
+    print(f"- Following {'stdin' if filepath == '-' else filepath}, writing results to {output_file_name}" 
+          + (f" and alerts to {alerts_file}" if alerts_file else "") + " (stop with Ctrl+C) ...")
+    try:
+        summary = follow_input(filepath, partial(predict_labels, model, loaded_model, schema=schema, metrics=metrics, 
+                                                 dedup=dedup, cascade=cascade, threshold=threshold),
+                               handle_batch, max_batch_rows, idle_exit, metrics)
+    finally:
+        for writer in writers:
+            close_prediction_writer(writer)
+    if summary is not None:
+        print_follow_stats(summary)
+    return summary
+
+
+def run_prediction(model:tuple, filepath:str, chunk_size=0, engine="sklearn", workers=1, evaluation=None, metrics=None,
+                   dedup=None, cascade=None, threshold=None, write_scores=False, feature_cache_dir="", memory_report=False,
+                   alerts_only=False):
     """
     Wrapper function for the whole 5 step prediction process. 
 
-    Step 1: Read data 
-    Step 2: Load model
+    Step 1: Load model
+    Step 2: Read data (only the columns the model needs)
     Step 3: Preprocessing
     Step 4: Prediciton
     Step 5: Write output file
     
-    Note: Steps 2 to 4 are different for baseline models 
+    Note: Steps 1, 3 and 4 are different for baseline models 
     and models loaded from a pickle file. 
+
+    With chunk_size > 0 the steps 2 to 5 are repeated for chunks of chunk_size rows,
+    so the memory needed stays the same for any file size. The output file is identical 
+    to the one written when the whole file is read at once.
+
+    Args:
+        model (tuple):              model name and model, as returned from find_model()
+        filepath (str):             path to X_test data (KDD text file or a file written by write_data(), see read_data_to_df)
+        chunk_size (int, optional): nr of rows per chunk, 0 reads the whole file. Defaults to 0.
+        engine (str, optional):     "sklearn" or "numpy" (compiled model, see load_model). Defaults to "sklearn".
+        workers (int, optional):    nr of processes, with more than 1 see run_sharded_prediction(). Defaults to 1.
+        evaluation (dict, optional):    mode 2: compare the predictions of every chunk with the true labels,
+                                        see start_evaluation(). Defaults to None.
+        metrics (dict, optional):   measure time, rows and memory of every step, 
+                                    see new_stage_metrics() in scripts/stage_metrics.py. Defaults to None.
+        dedup (dict, optional):     predict identical rows only once and use the cache of dedup, 
+                                    see start_dedup(). Defaults to None.
+        cascade (dict, optional):   decide easy rows with the rules of the cascade before the model,
+                                    see start_cascade(). Defaults to None.
+        threshold (float, optional):    predict malicious if its probability is >= threshold, 
+                                        None: the class with the highest probability (see predict_labels). Defaults to None.
+        write_scores (bool, optional):  write the probability of malicious after each prediction. Defaults to False.
+        feature_cache_dir (str, optional):  load the encoded features of the file from this directory
+                                            (see predict_with_feature_cache), steps 2 to 4 at once.
+                                            Not used for baseline models, chunks, workers, dedup and cascade
+                                            (see check_feature_cache). Defaults to "".
+        memory_report (bool, optional): print the memory of every column of the input DF after the preprocessing,
+                                        of the first chunk with chunk_size. Not with workers. Defaults to False.
+        alerts_only (bool, optional):   only write the row nr (from 0) and score of the malicious rows. Defaults to False.
+                                        The format of the output file follows from its extension, see scripts/prediction_writer.py.
+
+    Returns:
+        predictions for all rows, or None in chunked or sharded mode (predictions are only written to the output file)
     """ 
+    if workers > 1 and get_data_format(filepath) == "csv":
+        return run_sharded_prediction(model, filepath, workers, engine, evaluation, metrics, dedup, cascade, 
+                                      threshold, write_scores, alerts_only)
+    elif workers > 1:
+        print("- Only KDD text files are split for --workers, other formats are predicted in one process.")
+
     # ------------------------------------------------------------
-    # Step 1: Read data 
-    # read 3nd argument as path to X_test data 
-    filepath = arguments[2]
-    df_test = read_data_to_df(filepath) 
+    # Step 1: Load model
+    with measure_stage(metrics, "load_model"):
+        loaded_model = load_model(model, engine)
+        schema = load_model_schema(model, loaded_model)
     # ------------------------------------------------------------
+    if feature_cache_dir:
+        # Step 2, 3 & 4: encoded features from the cache and prediction
+        print("- Predicting ... ")
+        result = predict_with_feature_cache(model, loaded_model, filepath, schema, feature_cache_dir, metrics, threshold)
+        if result is None:
+            return
+        y_prediction, scores = result
+        update_evaluation(evaluation, y_prediction, metrics, scores)
+        # Step 5: Write output file
+        print(f"- Writing results to {output_file_name} ")
+        with measure_stage(metrics, "write", len(y_prediction)):
+            write_prediction_output(output_file_name, y_prediction, scores if write_scores or alerts_only else None, 
+                                    alerts_only)
+        return y_prediction
+    # ------------------------------------------------------------
+    # Step 2: Read data 
+    columns = get_model_input_columns(model, loaded_model, cascade)
+    with measure_stage(metrics, "read"):
+        if chunk_size > 0:
+            data_chunks = read_data_in_chunks(filepath, chunk_size, columns)
+        else:
+            data_chunks = read_data_to_df(filepath, columns)
     
-    if model[0].startswith('BM'):
-        # Step 2: Load model
-        # use baseline model function
-        # ------------------------------------------------------------
-        # Step 4: Prediction
+    if data_chunks is None:
+        return
+    # ------------------------------------------------------------
+    
+    if chunk_size == 0:
+        # Step 3 & 4: Preprocessing and prediction
+        add_stage_rows(metrics, "read", len(data_chunks))
         print("- Predicting ... ")
-        y_prediction =  model[1](df_test)
-        # ------------------------------------------------------------
-    else:
-        # Step 2: Load model
-        # load model from pickle file 
-        loaded_model = pickle.load(open(model[1], 'rb'))
+        y_prediction, scores = predict_labels(model, loaded_model, data_chunks, schema, metrics, dedup, cascade, threshold)
+        update_evaluation(evaluation, y_prediction, metrics, scores)
+        if memory_report:
+            print_memory_report(data_chunks)
         # ------------------------------------------------------------
-        # step 3: Preprocessing / feature engineering
-        print("- Data preprocessing ...")
-        categorial_features = preprocessing_categories(df_test)
+        # Step 5: Write output file
+        print(f"- Writing results to {output_file_name} ")
+        with measure_stage(metrics, "write", len(y_prediction)):
+            write_prediction_output(output_file_name, y_prediction, scores if write_scores or alerts_only else None, 
+                                    alerts_only)
         # ------------------------------------------------------------
-        # select features (must be the same the model was trained on)
-        df_X = df_test[ numerical_features + categorial_features]
+        return y_prediction
+
+    print(f"- Predicting and writing results to {output_file_name} in chunks of {chunk_size} rows ...")
+    # every chunk is appended to the output file
+    writer = open_prediction_writer(output_file_name, write_scores, alerts_only)
+    if writer is None:
+        return
+    nr_rows = 0
+    for df_chunk in measure_iteration(metrics, "read", data_chunks):
+        # Step 3 & 4: Preprocessing and prediction
+        y_prediction, scores = predict_labels(model, loaded_model, df_chunk, schema, metrics, dedup, cascade, threshold)
+        update_evaluation(evaluation, y_prediction, metrics, scores)
+        if memory_report and nr_rows == 0:
+            print_memory_report(df_chunk)
         # ------------------------------------------------------------
-        # Step 4: Prediction 
-        print("- Predicting ... ")
-        y_prediction = loaded_model.predict(df_X)
+        # Step 5: Append to output file
+        with measure_stage(metrics, "write", len(y_prediction)):
+            write_predictions(writer, y_prediction, scores)
+        nr_rows += len(df_chunk)
+    close_prediction_writer(writer)
 
-    # ------------------------------------------------------------
-    # Step 5: Write output file
-    print(f"- Writing results to {output_file_name} ")
-    write_prediction_output(output_file_name, y_prediction)
-    # ------------------------------------------------------------
-    
-    return y_prediction
+    print(f"- Predicted {nr_rows} rows.")
+    return
+
+
+def start_evaluation(labels_path:str, score_bins=0) -> dict | None:
+    """
+    Start the evaluation of mode 2: open the file with the true labels (y values, see read_labels)
+    and create the confusion counts, which are updated for every chunk of predictions (update_evaluation).
+    With score_bins > 0, the scores are also counted per true label (see get_score_counts), 
+    to find the threshold for a target recall or false positive rate in finish_evaluation().
+    Returns None if the labels cannot be read.
+    """
+    label_reader = read_labels(labels_path)
+    if label_reader is None:
+        return
+    return {"label_reader": label_reader, "counts": np.zeros((2, 2), dtype=np.int64), "nr_rows": 0, "error": None,
+            "score_counts": np.zeros((2, score_bins), dtype=np.int64) if score_bins else None}
+
+
+def update_evaluation(evaluation:dict | None, y_prediction, metrics=None, scores=None):
+    """
+    Compare the predictions (and scores) of a chunk with the next labels of the y values 
+    and add them to the confusion counts. Only the labels of the current chunk are held in memory.
+    With metrics, the time is measured as stage "evaluate".
+    """
+    if evaluation is None or evaluation["error"]:
+        return
+
+    with measure_stage(metrics, "evaluate", len(y_prediction)):
+        compare_with_labels(evaluation, y_prediction, scores)
+
+
+def compare_with_labels(evaluation:dict, y_prediction, scores=None):
+    # see update_evaluation()
+    try:
+        labels = evaluation["label_reader"].get_chunk(len(y_prediction))["attack_type"]
+    except StopIteration:
+        labels = []
+
+    if len(labels) < len(y_prediction):
+        evaluation["error"] = f"Got fewer y values than predictions ({evaluation['nr_rows'] + len(labels)} labels)."
+        return
+
+    y_true = recode_binary_target(labels)
+    evaluation["counts"] += get_confusion_counts(y_true, y_prediction)
+    if evaluation["score_counts"] is not None:
+        evaluation["score_counts"] += get_score_counts(y_true, scores, evaluation["score_counts"].shape[1])
+    evaluation["nr_rows"] += len(y_prediction)
+
+
+def finish_evaluation(evaluation:dict, plot_file="", target_recall=None, target_fpr=None) -> dict | None:
+    """
+    Print the evaluation of mode 2 (classification report, accuracy, precision, recall and F1 score) 
+    from the confusion counts and save the confusion matrix to plot_file, if given. 
+    With target_recall or target_fpr (and score counts, see start_evaluation), 
+    print the threshold that reaches it (see find_operating_point).
+    Returns the classification report, or None if the y values do not match the predictions.
+    """
+    try:
+        evaluation["label_reader"].get_chunk(1)
+        evaluation["error"] = evaluation["error"] or f"Got more y values than predictions ({evaluation['nr_rows']})."
+    except StopIteration:
+        pass
+    finally:
+        evaluation["label_reader"].close()
+
+    if evaluation["error"]:
+        print(f"- Error: {evaluation['error']}")
+        return
+
+    counts = evaluation["counts"]
+    report = get_classification_report(counts)
+    print(f"- Evaluation of {evaluation['nr_rows']} rows:")
+    print(format_classification_report(report))
+    print_evaluation_metrics(counts.flatten().tolist())
+
+    if plot_file:
+        plot_confusion_counts(counts, CLASS_NAMES, output_file=plot_file)
+        print(f"- Confusion matrix saved to {plot_file}")
+
+    if evaluation["score_counts"] is not None:
+        operating_point = find_operating_point(evaluation["score_counts"], target_recall, target_fpr)
+        print_operating_point(operating_point, target_recall, target_fpr)
+    return report
+
+
+def start_dedup(model:tuple, cache_dir="", cache_size=CACHE_MAX_ENTRIES, engine="sklearn", workers=1) -> dict | None:
+    """
+    Return the state of the dedup for run_prediction(), with the cache of the model from cache_dir (if given).
+    The cache file belongs to the model file that is loaded (see load_model) and its feature schema.
+    Returns None for baseline models, which predict from the raw data.
+    """
+    if model[0].startswith('BM'):
+        print("- Note: --dedup and --cache-dir are only used for models from pickle files.")
+        return
+
+    if cache_dir and workers > 1:
+        print("- Note: --cache-dir is not used with --workers, the workers only predict identical rows once.")
+        cache_dir = ""
+
+    cache = None
+    if cache_dir:
+        model_file = model[1]
+        if engine == "numpy" and os.path.isfile(get_compiled_model_path(model[1])):
+            model_file = get_compiled_model_path(model[1])
+        cache = load_prediction_cache(cache_dir, [model_file, get_schema_path(model[1])], cache_size)
+    return new_dedup_state(cache)
+
+
+def start_cascade(model:tuple) -> dict | None:
+    """
+    Return the state of the cascade for run_prediction() with the rules fitted for the model 
+    (see scripts/cascade.py), or None if the rules cannot be loaded. Baseline models have no cascade.
+    """
+    if model[0].startswith('BM'):
+        print("- Error: --cascade is only used for models from pickle files.")
+        return
+
+    cascade = load_cascade(model[1])
+    if cascade is None:
+        return
+    return new_cascade_state(cascade)
+
+
+def check_feature_cache(model:tuple, cache_dir:str, chunk_size=0, workers=1, dedup=None, cascade=None) -> str:
+    """
+    Return the directory of the feature cache for run_prediction(), or "" if the cache is not used with 
+    the other options: baseline models predict from the raw data, the other options work on the rows of the DF.
+    """
+    if not cache_dir:
+        return ""
+    reasons = {"baseline models": model[0].startswith('BM'), "--chunk-size": chunk_size > 0, "--workers": workers > 1,
+               "--dedup": dedup is not None, "--cascade": cascade is not None}
+    not_used = [name for name, active in reasons.items() if active]
+    if not_used:
+        print(f"- Note: --feature-cache is not used with {', '.join(not_used)}.")
+        return ""
+    return cache_dir
+
+
+def finish_dedup(dedup:dict | None):
+    # save the cache and print the nr of unique rows and cache hits
+    if dedup is None:
+        return
+    if dedup["cache"] is not None:
+        save_prediction_cache(dedup["cache"])
+    print_dedup_stats(dedup)
+
+
+def report_stage_metrics(metrics:dict | None, profile=False, metrics_file="", cprofile_file=""):
+    """
+    Print the stage breakdown (profile), write the metrics to metrics_file 
+    and save the cProfile stats to cprofile_file, depending on the CLI options.
+    """
+    if metrics is None:
+        return
+
+    summary = summarize_stage_metrics(metrics)
+    if profile:
+        print_stage_metrics(summary)
+    if metrics_file:
+        write_metrics_file(summary, metrics_file)
+        print(f"- Metrics written to {metrics_file}")
+    if cprofile_file:
+        save_profile(metrics, cprofile_file)
 
 # ------------------------------------ main program -------------------------------------
 
 if __name__ == "__main__":
 
-    arguments = sys.argv # process CLI arguments
+    parsed_arguments = parse_options(sys.argv, CLI_OPTIONS) # process CLI arguments
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+
+    if options["--engine"] not in ENGINES:
+        print(f"- Error: Unknown engine {options['--engine']}. Expects one of {ENGINES}.")
+        sys.exit(1)
+
+    # -1 (default) means not set, otherwise a probability
+    for option in ["--threshold", "--target-recall", "--target-fpr"]:
+        if options[option] != -1 and not 0 <= options[option] <= 1:
+            print(f"- Error: Option {option} expects a value between 0 and 1, got {options[option]}.")
+            sys.exit(1)
+    threshold = options["--threshold"] if options["--threshold"] != -1 else None
+    target_recall = options["--target-recall"] if options["--target-recall"] != -1 else None
+    target_fpr = options["--target-fpr"] if options["--target-fpr"] != -1 else None
+    if target_recall is not None and target_fpr is not None:
+        print("- Error: Use either --target-recall or --target-fpr.")
+        sys.exit(1)
+
+    if options["--cprofile-stage"] not in STAGES:
+        print(f"- Error: Unknown stage {options['--cprofile-stage']}. Expects one of {list(STAGES.keys())}.")
+        sys.exit(1)
+
+    if options["--early-exit"]:
+        if options["--early-exit"] not in EARLY_EXIT_MODES:
+            print(f"- Error: Unknown mode {options['--early-exit']} of --early-exit. Expects one of {EARLY_EXIT_MODES}.")
+            sys.exit(1)
+        if options["--engine"] != "numpy":
+            print("- Error: --early-exit needs --engine numpy (the trees of the compiled model are evaluated in batches).")
+            sys.exit(1)
+        if options["--cache-dir"] or target_recall is not None or target_fpr is not None:
+            print("- Error: --early-exit cannot be used with --cache-dir, --target-recall and --target-fpr "
+                  "(the scores of rows that are decided early are estimates).")
+            sys.exit(1)
+
+    preprocessing.COMPACT_MODE = options["--compact"]
+    tree_engine.EARLY_EXIT_MODE = options["--early-exit"]
+    tree_engine.EARLY_EXIT_THRESHOLD = threshold
+    if options["--output"]:
+        output_file_name = options["--output"]
 
     # check if the 2nd argument is a model from the dict MODELS
     model = find_model(arguments[1], MODELS)
+    if model and not model[0].startswith('BM') and not os.path.exists(model[1]):
+        print(f"- Error: Cannot find the model file {model[1]}.")
+        sys.exit(1)
+
+    metrics = None
+    if model and (options["--profile"] or options["--metrics-file"] or options["--cprofile"]):
+        metrics = new_stage_metrics(model[0], options["--cprofile-stage"] if options["--cprofile"] else None)
+        if options["--cprofile"] and options["--workers"] > 1:
+            print("- Note: --cprofile only profiles the main process, the steps done by --workers are not included.")
+
+    dedup = None
+    if model and (options["--dedup"] or options["--cache-dir"]):
+        dedup = start_dedup(model, options["--cache-dir"], options["--cache-size"], options["--engine"], options["--workers"])
+
+    cascade = None
+    if model and options["--cascade"]:
+        cascade = start_cascade(model)
+        if cascade is None:
+            sys.exit(1)
+
+    feature_cache_dir = ""
+    if model:
+        feature_cache_dir = check_feature_cache(model, options["--feature-cache"], options["--chunk-size"], 
+                                                options["--workers"], dedup, cascade)
 
     if model:    
         print("\n--------------------")
@@ -149,19 +947,57 @@ if __name__ == "__main__":
         # TODO: implement func to check inpurt arg 3 and 4 
        
         # check nr of input arguments 
-        if len(arguments) == 3:
+        if options["--serve"] and len(arguments) == 2:
+            print('- Mode: prediction server.') #--> X values are sent to the server
+            serve_model(model, options["--port"], options["--batch-window-ms"], options["--engine"], threshold)
+
+        elif options["--serve"]:
+            print(f'- Error: Wrong number of input arguments. Got {len(arguments)}, expected 2 with --serve.')
+
+        elif options["--follow"] and len(arguments) == 3:
+            print('- Mode: follow the input.') #--> new lines are predicted until stopped
+            follow_prediction(model, arguments[2], options["--engine"], max(options["--max-batch-rows"], 1), 
+                              options["--idle-exit"], options["--alerts-file"], metrics, dedup, cascade, 
+                              threshold, options["--scores"], options["--alerts-only"])
+            finish_dedup(dedup)
+            if cascade is not None:
+                print_cascade_stats(cascade)
+            print_early_exit_stats()
+
+        elif options["--follow"]:
+            print(f'- Error: Wrong number of input arguments. Got {len(arguments)}, expected 3 with --follow.')
+
+        elif len(arguments) == 3:
             print('- Mode: prediction without evaluation.') #--> no y values given 
-            predictions = run_prediction()
+            predictions = run_prediction(model, arguments[2], options["--chunk-size"], options["--engine"], 
+                                         options["--workers"], metrics=metrics, dedup=dedup, cascade=cascade, 
+                                         threshold=threshold, write_scores=options["--scores"], 
+                                         feature_cache_dir=feature_cache_dir, memory_report=options["--memory-report"],
+                                         alerts_only=options["--alerts-only"])
+            finish_dedup(dedup)
+            if cascade is not None:
+                print_cascade_stats(cascade)
+            print_early_exit_stats()
 
         elif len(arguments) == 4: # (optional)
             print('- Mode: prediction with evaluation') # X an y were given 
-            predictions = run_prediction() 
-            print('- Error: evaluation not implemented yet.')
-            # TODO: preprocess target variable 
-            # TODO: run evaluation func
+            score_bins = SCORE_BINS if target_recall is not None or target_fpr is not None else 0
+            evaluation = start_evaluation(arguments[3], score_bins)
+            if evaluation is not None:
+                predictions = run_prediction(model, arguments[2], options["--chunk-size"], options["--engine"], 
+                                             options["--workers"], evaluation, metrics, dedup, cascade, 
+                                             threshold, options["--scores"], feature_cache_dir, 
+                                             options["--memory-report"], options["--alerts-only"])
+                finish_dedup(dedup)
+                if cascade is not None:
+                    print_cascade_stats(cascade)
+                print_early_exit_stats()
+                finish_evaluation(evaluation, options["--plot-file"], target_recall, target_fpr)
                             
         else:
-            print(f'- Error: Wrong number of input arguments. Got {len(sys.argv)}, expected 3 or 4.')
+            print(f'- Error: Wrong number of input arguments. Got {len(arguments)}, expected 3 or 4.')
+
+        report_stage_metrics(metrics, options["--profile"], options["--metrics-file"], options["--cprofile"])
             
     else:
         print(f"- Error: Unknown model. Expects one of {list(MODELS.keys())} as second argument.")
@@ -171,3 +1007,22 @@ if __name__ == "__main__":
 
     # CLI input: 
     # python predict.py RF test_input_X_20.txt
+    # python predict.py RF test_input_X_20.txt --chunk-size 100000
+    # python predict.py RF --serve --port 8000
+    # python predict.py RF test_input_X_20.txt --engine numpy
+    # python predict.py RF KDDTest+.txt --workers 8
+    # python predict.py RF KDDTest+.parquet
+    # python predict.py RF test_input_X_20.txt test_input_y_20.txt --plot-file confusion_matrix.png
+    # python predict.py RF KDDTest+.txt --profile --metrics-file metrics.prom --cprofile predict.prof
+    # python predict.py RF KDDTest+.txt --dedup --cache-dir .prediction_cache
+    # python predict.py RF KDDTest+.txt --cascade
+    # python predict.py RF KDDTest+.txt --threshold 0.3 --scores
+    # python predict.py RF KDDTest+.txt KDDTest+.txt --target-recall 0.99
+    # python predict.py RF KDDTest+.txt --feature-cache .cache/features
+    # python predict.py RF KDDTest+.txt --compact --memory-report
+    # python predict.py RF KDDTest+.txt --engine numpy --early-exit exact
+    # python predict.py RF KDDTest+.txt --output prediction.parquet --scores
+    # python predict.py RF KDDTest+.txt --output alerts.txt.gz --alerts-only
+    # python predict.py RF connections.txt --follow --alerts-file alerts.txt
+    # collector | python predict.py RF - --follow
+    # python predict.py RF_compressed KDDTest+.txt --engine numpy
@@ -0,0 +1,131 @@
+############################################################################
+### benchmark: aggregate_feature_by_target, previous vs. grouped count  ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_aggregation.py [nr_rows] [chunk_size]
+# Generates nr_rows (default 2 million) rows with scripts/generate_data.py (statistics of
+# data/KDDTrain+_statistics.json, fitted to the example input if it does not exist) and the binary target "attack"
+# (categorical, as in eda/eda.ipynb). For every feature of FEATURES, aggregate_feature_by_target() of plotting.py
+# is timed in the previous version (value_counts three times and scans per category), as one grouped count and
+# chunked: the generated file is read with read_data_in_chunks() in chunks of chunk_size rows (default 250000)
+# and the counts are accumulated. Fails if a version returns another DF or prints other lines than the previous one.
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from benchmark_scaling import get_statistics
+from generate_data import STATISTICS_FILE, write_generated_data
+from plotting import aggregate_feature_by_target, aggregate_feature_by_target_chunked
+from preprocessing import read_data_in_chunks, read_data_to_df, read_labels, recode_binary_target
+
+# ---------------------------------------- variables ----------------------------------------
+
+NR_ROWS = 2_000_000
+CHUNK_SIZE = 250_000
+FEATURES = ["protocol_type", "service", "flag", "logged_in"]
+TARGET = "attack"
+TARGET_DTYPE = pd.CategoricalDtype([0, 1])
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def previous_aggregate_feature_by_target(data_df: pd.DataFrame, feature: str, target, verbose=1) -> pd.DataFrame:
+    """
+    Previous version of aggregate_feature_by_target(), kept as reference for the benchmark and the comparison
+    of the results: counts and proportions by two value_counts and a merge, the prints count a third time
+    and scan the aggregated DF twice per category.
+    """
+    if target:
+        grouped_object = data_df.groupby(feature, observed=False, as_index=False, dropna=False)[target]
+        df_count = grouped_object.value_counts(dropna=False)
+        df_proportion = grouped_object.value_counts(dropna=False, normalize=True)
+        aggregated_df = df_count.merge(df_proportion, how='inner', on=[feature, target])
+        aggregated_df.sort_values([target, 'proportion'], ascending=False, inplace=True)
+    else:
+        df_count = data_df[feature].value_counts(dropna=False).reset_index()
+        df_proportion = data_df[feature].value_counts(dropna=False, normalize=True).reset_index()
+        aggregated_df = df_count.merge(df_proportion, how='inner', on=[feature])
+        aggregated_df.sort_values(['proportion'], ascending=False, inplace=True)
+
+    aggregated_df['proportion']= aggregated_df['proportion']*100
+    aggregated_df.rename({'proportion': 'percent'}, axis=1, inplace=True)
+
+    if verbose:
+        tc = data_df[feature].value_counts(dropna=False).reset_index()
+        for feature_category in aggregated_df[feature].unique():
+            abs_freq = tc[tc[feature] == feature_category]["count"].values[0]
+            rel_percent = aggregated_df[(aggregated_df[feature] == feature_category ) & (aggregated_df[target] == 1)].percent.values[0]
+            print(f"For {feature} { feature_category} {round(rel_percent,2)}% of traffic was an attack (based on {abs_freq} data points).")
+
+    return aggregated_df
+
+
+def read_chunks_with_target(path_to_file:str, labels_file:str, chunk_size:int, columns:list):
+    # chunks of the generated file with the binary target from the labels file
+    label_reader = read_labels(labels_file)
+    for data_df in read_data_in_chunks(path_to_file, chunk_size, columns):
+        labels = label_reader.get_chunk(len(data_df))["attack_type"]
+        data_df[TARGET] = pd.Categorical(recode_binary_target(labels), dtype=TARGET_DTYPE)
+        yield data_df
+
+
+def run_version(function, *arguments) -> tuple:
+    # DF, printed lines and seconds of a version
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        result = function(*arguments)
+    return result, output.getvalue(), time.perf_counter() - start
+
+
+def is_same_result(expected:tuple, result:tuple) -> bool:
+    try:
+        pd.testing.assert_frame_equal(expected[0], result[0], check_exact=True)
+    except AssertionError:
+        return False
+    return expected[0].index.equals(result[0].index) and expected[1] == result[1]
+
+
+if __name__ == "__main__":
+
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else CHUNK_SIZE
+    statistics = get_statistics(STATISTICS_FILE)
+    if statistics is None:
+        sys.exit(1)
+
+    results, different = [], []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path, labels_file = os.path.join(temp_dir, "data.txt"), os.path.join(temp_dir, "labels.txt")
+        print(f"- Generating {nr_rows} rows ...")
+        write_generated_data(statistics, nr_rows, path, labels_file)
+        df_data = read_data_to_df(path, FEATURES)
+        df_data[TARGET] = pd.Categorical(recode_binary_target(read_labels(labels_file).read()["attack_type"]), dtype=TARGET_DTYPE)
+        print(f"- {nr_rows} rows, {df_data[TARGET].astype(int).mean():.1%} attacks, chunks of {chunk_size} rows")
+
+        for feature in FEATURES:
+            expected = run_version(previous_aggregate_feature_by_target, df_data, feature, TARGET)
+            grouped = run_version(aggregate_feature_by_target, df_data, feature, TARGET)
+            chunked = run_version(aggregate_feature_by_target_chunked,
+                                  read_chunks_with_target(path, labels_file, chunk_size, [feature]), feature, TARGET)
+            results.append((feature, expected[0][feature].nunique(dropna=False), expected[2], grouped[2], chunked[2]))
+            different += [f"{feature} ({name})" for name, result in [("grouped", grouped), ("chunked", chunked)]
+                          if not is_same_result(expected, result)]
+
+    print(f"\n{'feature':<16}{'categories':>11}{'previous s':>12}{'grouped s':>11}{'speedup':>9}{'chunked s':>11}"
+          "   (chunked: incl. reading the file)")
+    for feature, nr_categories, previous, grouped, chunked in results:
+        print(f"{feature:<16}{nr_categories:>11}{previous:>12.3f}{grouped:>11.3f}{previous / grouped:>9.1f}{chunked:>11.3f}")
+
+    if different:
+        print(f"- Error: Different results for {', '.join(different)}.")
+        sys.exit(1)
+    print("- The grouped and the chunked version return the same DFs and print the same lines as the previous version.")
@@ -0,0 +1,82 @@
+############################################################################
+### benchmark: rule cascade in front of the random forest (--cascade)   ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_cascade.py [nr_rows] [flood_share] [engine]
+# fits the cascade rules (see scripts/cascade.py) to a generated flood-heavy input (see benchmark_dedup.py)
+# and compares the prediction of another generated input with and without the cascade:
+# rows/sec, share of the rows decided by the rules and the agreement with the predictions of the forest.
+# the rules are only kept in memory, the cascade file of the model is not changed.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from benchmark_dedup import create_flood_file
+from cascade import fit_cascade, get_cascade_stats, new_cascade_state
+from preprocessing import read_data_to_df
+
+# ---------------------------------------- variables ----------------------------------------
+
+MODEL_NAME = "RF"
+NR_ROWS = 500_000
+FLOOD_SHARE = 0.8
+FIT_RSEED, TEST_RSEED = 1, 2    # the fit and the test data are different samples
+NR_RUNS = 3                     # the fastest run is reported
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def time_prediction(model:tuple, loaded_model, df_data, schema:dict, create_cascade) -> tuple:
+    # fastest of NR_RUNS predictions (preprocessing and prediction, without reading the file), with the last state
+    best_seconds = None
+    for _ in range(NR_RUNS):
+        cascade = create_cascade()
+        start = time.perf_counter()
+        predictions, _ = predict.predict_data_proba(model, loaded_model, df_data.copy(), schema, cascade=cascade)
+        seconds = time.perf_counter() - start
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds, np.asarray(predictions), cascade
+
+
+if __name__ == "__main__":
+
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+    flood_share = float(sys.argv[2]) if len(sys.argv) > 2 else FLOOD_SHARE
+    engine = sys.argv[3] if len(sys.argv) > 3 else "sklearn"
+
+    os.chdir(PROJECT_DIR) # model paths in MODELS are relative to the project folder
+    model = predict.find_model(MODEL_NAME, predict.MODELS)
+    loaded_model = predict.load_model(model, engine)
+    schema = predict.load_model_schema(model, loaded_model)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data = {}
+        for name, rseed in [("fit", FIT_RSEED), ("test", TEST_RSEED)]:
+            create_flood_file(os.path.join(temp_dir, name + ".txt"), nr_rows, flood_share, rseed)
+            data[name] = read_data_to_df(os.path.join(temp_dir, name + ".txt"))
+
+    print(f"- Fitting the cascade to {nr_rows} rows ({flood_share:.0%} flood) ...")
+    fit_predictions, fit_probabilities = predict.predict_data_proba(model, loaded_model, data["fit"].copy(), schema)
+    rules = fit_cascade(data["fit"], fit_predictions, fit_probabilities)
+
+    seconds_full, full_predictions, _ = time_prediction(model, loaded_model, data["test"], schema, lambda: None)
+    seconds_cascade, cascade_predictions, cascade = time_prediction(model, loaded_model, data["test"], schema,
+                                                                    lambda: new_cascade_state(rules))
+    stats = get_cascade_stats(cascade)
+    agreement = float((full_predictions == cascade_predictions).mean())
+
+    print(f"\n- {nr_rows} test rows, model {MODEL_NAME} (engine {engine}), "
+          f"{len(rules['baseline_stages'])} baseline stages and {len(rules['rules'])} learned rules")
+    print(f"{'version':<16}{'seconds':>10}{'rows/sec':>14}{'speedup':>10}{'decided by rules':>18}{'agreement':>11}")
+    print(f"{'forest':<16}{seconds_full:>10.3f}{nr_rows / seconds_full:>14,.0f}{1:>10.2f}{'-':>18}{'-':>11}")
+    print(f"{'cascade':<16}{seconds_cascade:>10.3f}{nr_rows / seconds_cascade:>14,.0f}{seconds_full / seconds_cascade:>10.2f}"
+          f"{stats['short_circuit_share']:>18.1%}{agreement:>11.2%}")
+    for stage, nr_decided in stats["decided"].items():
+        print(f"    {stage:<24}{nr_decided:>12}")
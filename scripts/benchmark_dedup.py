@@ -0,0 +1,121 @@
+############################################################################
+### benchmark: prediction with deduplication and cache (--dedup)        ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_dedup.py [nr_rows] [flood_share] [engine]
+# e.g.  python scripts/benchmark_dedup.py 1000000 0.8 sklearn
+# creates a flood-heavy input: flood_share of the rows are neptune (REJ / S0 to private ports) and smurf
+# (icmp echo replies) rows with varying connection counts, the other rows are sampled from the example
+# input with random bytes and counts. Compares the prediction without dedup, with dedup,
+# and with an empty and a filled cache, the output files must be the same.
+
+import hashlib
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from prediction_cache import get_dedup_stats, new_dedup_state
+from preprocessing import read_data_to_df
+
+# ---------------------------------------- variables ----------------------------------------
+
+MODEL_NAME = "RF"
+SAMPLE_FILE = os.path.join(PROJECT_DIR, "test_input_X_20.txt")
+NR_ROWS = 1_000_000
+FLOOD_SHARE = 0.8
+RSEED = 42
+# columns of the flood rows that vary between connections (min, max)
+FLOOD_COUNTS = {"count": (100, 511), "srv_count": (1, 30), "dst_host_srv_count": (1, 30)}
+# columns of the other rows that are drawn at random (min, max)
+RANDOM_COUNTS = {"src_bytes": (0, 20000), "dst_bytes": (0, 50000), "count": (1, 100), "srv_count": (1, 100),
+                 "dst_host_count": (1, 255), "dst_host_srv_count": (1, 255)}
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_flood_file(path_to_file:str, nr_rows:int, flood_share:float, rseed=RSEED):
+    # write the benchmark input (see header), the rows are shuffled
+    rng = np.random.default_rng(rseed)
+    df_sample = read_data_to_df(SAMPLE_FILE).astype({"protocol_type": str, "service": str, "flag": str})
+
+    # flood templates: the REJ / S0 rows of the example input and a smurf row
+    df_flood = df_sample[df_sample["flag"].isin(["REJ", "S0"])].copy()
+    smurf = df_sample.iloc[[3]].copy()
+    smurf[["service", "src_bytes", "count", "srv_count"]] = ["ecr_i", 1032, 511, 511]
+    df_flood = pd.concat([df_flood, smurf], ignore_index=True)
+
+    nr_flood = int(nr_rows * flood_share)
+    df_flood = df_flood.iloc[rng.integers(0, len(df_flood), nr_flood)].reset_index(drop=True)
+    for column, (low, high) in FLOOD_COUNTS.items():
+        df_flood[column] = rng.integers(low, high + 1, nr_flood)
+
+    df_other = df_sample.iloc[rng.integers(0, len(df_sample), nr_rows - nr_flood)].reset_index(drop=True)
+    for column, (low, high) in RANDOM_COUNTS.items():
+        df_other[column] = rng.integers(low, high + 1, len(df_other))
+
+    df_data = pd.concat([df_flood, df_other], ignore_index=True)
+    df_data = df_data.iloc[rng.permutation(len(df_data))]
+    df_data.to_csv(path_to_file, header=False, index=False)
+
+
+def file_hash(path_to_file:str) -> str:
+    with open(path_to_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def time_prediction(model:tuple, filepath:str, engine:str, dedup=None) -> float:
+    start = time.perf_counter()
+    predict.run_prediction(model, filepath, engine=engine, dedup=dedup)
+    if dedup is not None:
+        predict.finish_dedup(dedup)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+    flood_share = float(sys.argv[2]) if len(sys.argv) > 2 else FLOOD_SHARE
+    engine = sys.argv[3] if len(sys.argv) > 3 else "sklearn"
+
+    os.chdir(PROJECT_DIR) # model paths in MODELS are relative to the project folder
+    model = predict.find_model(MODEL_NAME, predict.MODELS)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filepath = os.path.join(temp_dir, "flood_input.txt")
+        print(f"- Creating a file with {nr_rows} rows ({flood_share:.0%} flood) ...")
+        create_flood_file(filepath, nr_rows, flood_share)
+        with open(filepath, "rb") as f:
+            nr_unique_lines = len(set(f))
+        predict.output_file_name = os.path.join(temp_dir, "prediction.txt")
+        cache_dir = os.path.join(temp_dir, "cache")
+
+        versions = [("without dedup", lambda: None),
+                    ("dedup", lambda: new_dedup_state()),
+                    ("dedup, empty cache", lambda: predict.start_dedup(model, cache_dir, engine=engine)),
+                    ("dedup, filled cache", lambda: predict.start_dedup(model, cache_dir, engine=engine))]
+        for name, create_dedup in versions:
+            dedup = create_dedup()
+            seconds = time_prediction(model, filepath, engine, dedup)
+            stats = get_dedup_stats(dedup) if dedup is not None else {}
+            results.append((name, seconds, stats, file_hash(predict.output_file_name)))
+
+    # unique lines: rows that differ in any column, unique rows: rows that differ in the features of the model
+    print(f"\n- {nr_rows} rows, {nr_unique_lines} unique lines, model {MODEL_NAME} (engine {engine})")
+    print(f"{'version':<22}{'seconds':>10}{'rows/sec':>14}{'speedup':>10}{'unique rows':>13}{'cache hits':>12}")
+    for name, seconds, stats, _ in results:
+        unique = f"{stats['unique_rows']:,}" if stats else "-"
+        hits = f"{stats['cache_hit_rate']:.1%}" if stats.get("cache_hit_rate") is not None and "cache" in name else "-"
+        print(f"{name:<22}{seconds:>10.3f}{nr_rows / seconds:>14,.0f}{results[0][1] / seconds:>10.2f}{unique:>13}{hits:>12}")
+
+    if len(set(result[3] for result in results)) > 1:
+        print("- Error: The output files differ between the versions.")
+        sys.exit(1)
+    print("- All versions write the same predictions.")
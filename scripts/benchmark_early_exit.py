@@ -0,0 +1,111 @@
+############################################################################
+### benchmark: early exit of the forest vote vs. all trees              ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_early_exit.py [path_to_X_values e.g. data/KDDTest+.txt] [threshold]
+# without input file, NR_ROWS rows are generated with scripts/generate_data.py (statistics of
+# data/KDDTrain+_statistics.json, or sampled from the example input if they do not exist)
+# Predicts the input with the compiled model (--engine numpy) with all trees and with --early-exit exact
+# and bound (for the threshold, default: the class with the highest probability) and prints the time,
+# rows/sec, the mean nr of trees per row, the single row latency and the agreement with all trees.
+# Fails if the exact mode predicts a different class than all trees for any row.
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from benchmark_ingestion import create_benchmark_file
+from generate_data import STATISTICS_FILE, load_statistics, write_generated_data
+from preprocessing import preprocessing_categories, read_data_to_df
+from tree_engine import EARLY_EXIT_MODES, encode_categories, predict_proba_compiled, predict_proba_early_exit
+
+# ---------------------------------------- variables ----------------------------------------
+
+NR_ROWS = 500_000
+NR_LATENCY_ROWS = 500           # nr of single row predictions to measure the latency
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_input(path_to_file:str, nr_rows:int):
+    # generated rows with the statistics of the training data, otherwise sampled from the example input
+    if os.path.exists(STATISTICS_FILE):
+        statistics = load_statistics(STATISTICS_FILE)
+        if statistics is not None:
+            write_generated_data(statistics, nr_rows, path_to_file)
+            return
+    create_benchmark_file(path_to_file, nr_rows)
+
+
+def predict_mode(compiled:dict, codes:np.ndarray, mode:str, threshold=None) -> tuple:
+    # probabilities of class 1 and the trees per row, mode "all" evaluates all trees for every row
+    if mode == "all":
+        return predict_proba_compiled(compiled, codes)[:, 1], np.full(len(codes), len(compiled["tree_roots"]))
+    probabilities, trees_per_row = predict_proba_early_exit(compiled, codes, mode, threshold)
+    return probabilities[:, 1], trees_per_row
+
+
+def get_classes(probabilities:np.ndarray, threshold=None) -> np.ndarray:
+    # class 1 for probabilities >= threshold, otherwise for a higher probability than class 0 (see predict_labels)
+    return probabilities >= threshold if threshold is not None else probabilities > 1 - probabilities
+
+
+def single_row_latencies(compiled:dict, codes:np.ndarray, mode:str, threshold, nr_rows:int) -> np.ndarray:
+    # latency in ms for predicting nr_rows single rows one after another
+    latencies = []
+    for i in range(min(nr_rows, len(codes))):
+        start = time.perf_counter()
+        predict_mode(compiled, codes[i:i + 1], mode, threshold)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+if __name__ == "__main__":
+
+    model = ("RF", os.path.join(PROJECT_DIR, predict.MODELS["RF"]))
+    compiled = predict.load_model(model, "numpy")
+    schema = predict.load_model_schema(model, compiled)
+    threshold = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if len(sys.argv) > 1:
+            filepath = os.path.abspath(sys.argv[1])
+        else:
+            filepath = os.path.join(temp_dir, "benchmark_input.txt")
+            print(f"- Creating {NR_ROWS} rows ...")
+            create_input(filepath, NR_ROWS)
+        df_data = read_data_to_df(filepath, predict.get_model_input_columns(model, compiled))
+    if df_data is None:
+        sys.exit(1)
+    preprocessing_categories(df_data, schema)
+    codes = encode_categories(compiled, df_data[list(compiled["features"])])
+    print(f"- Benchmark with {len(codes)} rows, {len(compiled['tree_roots'])} trees, "
+          f"threshold {threshold if threshold is not None else 'highest probability'}.")
+
+    results = {}
+    for mode in ["all"] + EARLY_EXIT_MODES:
+        start = time.perf_counter()
+        probabilities, trees_per_row = predict_mode(compiled, codes, mode, threshold)
+        seconds = time.perf_counter() - start
+        results[mode] = {"seconds": seconds, "classes": get_classes(probabilities, threshold), "trees": trees_per_row.mean(),
+                         "latencies": single_row_latencies(compiled, codes, mode, threshold, NR_LATENCY_ROWS)}
+
+    print(f"\n{'mode':<8}{'seconds':>9}{'rows/sec':>12}{'speedup':>9}{'trees/row':>11}{'1 row p50 ms':>14}"
+          f"{'1 row p95 ms':>14}{'agreement':>11}")
+    for mode, result in results.items():
+        agreement = (result["classes"] == results["all"]["classes"]).mean()
+        print(f"{mode:<8}{result['seconds']:>9.3f}{len(codes) / result['seconds']:>12,.0f}"
+              f"{results['all']['seconds'] / result['seconds']:>9.2f}{result['trees']:>11.1f}"
+              f"{np.percentile(result['latencies'], 50):>14.3f}{np.percentile(result['latencies'], 95):>14.3f}{agreement:>11.4%}")
+
+    different = int((results["exact"]["classes"] != results["all"]["classes"]).sum())
+    if different:
+        print(f"- Error: The exact mode predicts {different} rows differently than all trees.")
+        sys.exit(1)
+    print("- The exact mode predicts the same classes as all trees.")
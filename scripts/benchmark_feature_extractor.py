@@ -0,0 +1,171 @@
+############################################################################
+### benchmark: streaming feature extraction vs. brute-force reference   ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_feature_extractor.py [nr_records] [connections_per_sec]
+# e.g.  python scripts/benchmark_feature_extractor.py 1000000 2000
+# creates random connection records (see create_records), checks that the streaming extractor
+# (scripts/feature_extractor.py) computes the same features as a brute-force reference that scans
+# the whole window for every connection, and measures the connections/sec of the extractor
+# (windows only, and with the conversion to the read_data_to_df layout).
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+import pandas as pd
+
+from feature_extractor import HOST_WINDOW, OUTPUT_COLUMNS, REJ_ERROR_FLAGS, SYN_ERROR_FLAGS, TIME_WINDOW, TRAFFIC_FEATURES, \
+    extract_file, extract_rows, get_rate, new_extractor_state, rows_to_df
+from preprocessing import COLUMN_DTYPES, read_data_to_df
+
+# ---------------------------------------- variables ----------------------------------------
+
+NR_RECORDS = 500_000
+CONNECTIONS_PER_SECOND = 2000   # mean rate of the generated connections, the time window has ~2 * rate connections
+NR_REFERENCE_RECORDS = 5_000    # the reference is slow (scans every window), only the first records are compared
+NR_HOSTS = 40
+NR_SOURCE_PORTS = 50            # few source ports, so that dst_host_same_src_port_rate is not always 1 / count
+SERVICES = {"http": 80, "private": 5001, "smtp": 25, "ftp_data": 20, "domain_u": 53, "ecr_i": 0, "telnet": 23, "other": 9999}
+FLAGS = ["SF", "S0", "REJ", "RSTO", "SH", "S1"]
+FLAG_WEIGHTS = [0.6, 0.2, 0.1, 0.05, 0.03, 0.02]
+TARGET_CONNECTIONS_PER_SECOND = 100_000
+RSEED = 42
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_records(nr_records:int, connections_per_second=CONNECTIONS_PER_SECOND, rseed=RSEED) -> list:
+    # random connection records (see RECORD_COLUMNS), ordered by timestamp, with repeated timestamps
+    rng = np.random.default_rng(rseed)
+    timestamps = 1_700_000_000 + np.round(np.cumsum(rng.exponential(1 / connections_per_second, nr_records)), 3)
+    services = rng.choice(list(SERVICES), nr_records)
+    hosts = [f"10.0.0.{i}" for i in range(NR_HOSTS)]
+    src_hosts, dst_hosts = rng.integers(0, NR_HOSTS, nr_records), rng.integers(0, NR_HOSTS, nr_records)
+    src_ports = rng.integers(40000, 40000 + NR_SOURCE_PORTS, nr_records)
+    flags = rng.choice(FLAGS, nr_records, p=FLAG_WEIGHTS)
+    src_bytes, dst_bytes = rng.integers(0, 5000, nr_records), rng.integers(0, 50000, nr_records)
+
+    return [(float(timestamps[i]), 0, "tcp", hosts[src_hosts[i]], int(src_ports[i]), hosts[dst_hosts[i]],
+             SERVICES[services[i]], str(services[i]), str(flags[i]), int(src_bytes[i]), int(dst_bytes[i]))
+            for i in range(nr_records)]
+
+
+def reference_features(records:list, time_window=TIME_WINDOW, host_window=HOST_WINDOW) -> pd.DataFrame:
+    """
+    Brute-force version of the extractor: for every connection, all connections of its windows
+    are collected again and the features are counted by their definition (O(window) per connection).
+    Returns a DF with land and the TRAFFIC_FEATURES.
+    """
+    rate = lambda part, total: float(get_rate(np.float64(part), np.float64(total)))
+    serrors = lambda connections: sum(record[8] in SYN_ERROR_FLAGS for record in connections)
+    rerrors = lambda connections: sum(record[8] in REJ_ERROR_FLAGS for record in connections)
+    rows = []
+    for i, (timestamp, _, _, src_host, src_port, dst_host, dst_port, service, _, _, _) in enumerate(records):
+        first = i # records are ordered by timestamp
+        while first > 0 and records[first - 1][0] > timestamp - time_window:
+            first -= 1
+        time_connections = records[first:i + 1]
+        host_connections = records[max(i + 1 - host_window, 0):i + 1]
+
+        same_host = [record for record in time_connections if record[5] == dst_host]
+        same_service = [record for record in time_connections if record[7] == service]
+        dst_same_host = [record for record in host_connections if record[5] == dst_host]
+        dst_same_service = [record for record in host_connections if record[7] == service]
+        count, srv_count = len(same_host), len(same_service)
+        dst_host_count, dst_host_srv_count = len(dst_same_host), len(dst_same_service)
+
+        rows.append({
+            "land": int(src_host == dst_host and src_port == dst_port),
+            "count": count,
+            "srv_count": srv_count,
+            "serror_rate": rate(serrors(same_host), count),
+            "srv_serror_rate": rate(serrors(same_service), srv_count),
+            "rerror_rate": rate(rerrors(same_host), count),
+            "srv_rerror_rate": rate(rerrors(same_service), srv_count),
+            "same_srv_rate": rate(sum(record[7] == service for record in same_host), count),
+            "diff_srv_rate": rate(sum(record[7] != service for record in same_host), count),
+            "srv_diff_host_rate": rate(sum(record[5] != dst_host for record in same_service), srv_count),
+            "dst_host_count": dst_host_count,
+            "dst_host_srv_count": dst_host_srv_count,
+            "dst_host_same_srv_rate": rate(sum(record[7] == service for record in dst_same_host), dst_host_count),
+            "dst_host_diff_srv_rate": rate(sum(record[7] != service for record in dst_same_host), dst_host_count),
+            "dst_host_same_src_port_rate": rate(sum(record[4] == src_port for record in dst_same_host), dst_host_count),
+            "dst_host_srv_diff_host_rate": rate(sum(record[5] != dst_host for record in dst_same_service), dst_host_srv_count),
+            "dst_host_serror_rate": rate(serrors(dst_same_host), dst_host_count),
+            "dst_host_srv_serror_rate": rate(serrors(dst_same_service), dst_host_srv_count),
+            "dst_host_rerror_rate": rate(rerrors(dst_same_host), dst_host_count),
+            "dst_host_srv_rerror_rate": rate(rerrors(dst_same_service), dst_host_srv_count),
+            })
+    columns = ["land"] + TRAFFIC_FEATURES
+    return pd.DataFrame(rows, columns=columns).astype({column: COLUMN_DTYPES[column] for column in columns})
+
+
+def compare_features(df_rows:pd.DataFrame, df_expected:pd.DataFrame) -> int:
+    # print the columns that differ with their first different row, returns the nr of rows that differ
+    if len(df_rows) != len(df_expected):
+        print(f"- Got {len(df_rows)} rows, expected {len(df_expected)}.")
+        return abs(len(df_rows) - len(df_expected))
+
+    different = np.zeros(len(df_rows), dtype=bool)
+    for column in df_expected.columns:
+        column_different = df_rows[column].to_numpy() != df_expected[column].to_numpy()
+        if column_different.any():
+            i = int(np.flatnonzero(column_different)[0])
+            print(f"- {column} differs in {column_different.sum()} rows, e.g. row {i}: "
+                  f"{df_rows[column].iloc[i]} != {df_expected[column].iloc[i]}")
+        different |= column_different
+    return int(different.sum())
+
+
+if __name__ == "__main__":
+
+    nr_records = int(sys.argv[1]) if len(sys.argv) > 1 else NR_RECORDS
+    connections_per_second = float(sys.argv[2]) if len(sys.argv) > 2 else CONNECTIONS_PER_SECOND
+
+    print(f"- Creating {nr_records} connection records ({connections_per_second:,.0f} connections/sec) ...")
+    records = create_records(nr_records, connections_per_second)
+
+    # correctness: the first records with batches of different sizes vs. the reference
+    nr_reference = min(NR_REFERENCE_RECORDS, nr_records)
+    df_expected = reference_features(records[:nr_reference])
+    state = new_extractor_state()
+    rows = []
+    for start, end in [(0, 1), (1, 1000), (1000, 1001), (1001, nr_reference)]:
+        rows += extract_rows(state, records[start:end])
+    df_reference_rows = rows_to_df(rows)
+    nr_differences = compare_features(df_reference_rows, df_expected)
+    print(f"- Compared {nr_reference} rows with the brute-force reference: {nr_differences} rows differ.")
+
+    # speed: windows only, and with the DF in the layout of read_data_to_df
+    start = time.perf_counter()
+    rows = extract_rows(new_extractor_state(), records)
+    seconds_rows = time.perf_counter() - start
+    start = time.perf_counter()
+    df_rows = rows_to_df(rows)
+    seconds_df = time.perf_counter() - start
+
+    # the written file can be read with read_data_to_df
+    with tempfile.TemporaryDirectory() as temp_dir:
+        records_path, output_path = os.path.join(temp_dir, "records.csv"), os.path.join(temp_dir, "kdd.txt")
+        with open(records_path, "w") as f:
+            f.writelines(",".join(str(value) for value in record) + "\n" for record in records[:nr_reference])
+        extract_file(records_path, output_path)
+        df_read = read_data_to_df(output_path)
+    readable = df_read is not None and df_read[OUTPUT_COLUMNS].equals(df_reference_rows)
+
+    speed = nr_records / seconds_rows
+    print(f"\n{'step':<34}{'seconds':>10}{'connections/sec':>18}")
+    print(f"{'windows (extract_rows)':<34}{seconds_rows:>10.3f}{speed:>18,.0f}")
+    print(f"{'with DF (rows_to_df)':<34}{seconds_rows + seconds_df:>10.3f}{nr_records / (seconds_rows + seconds_df):>18,.0f}")
+    print(f"- Mean count: {df_rows['count'].mean():.1f}, mean dst_host_count: {df_rows['dst_host_count'].mean():.1f}, "
+          f"written file readable with read_data_to_df: {readable}")
+    if speed < TARGET_CONNECTIONS_PER_SECOND:
+        print(f"- Note: below the target of {TARGET_CONNECTIONS_PER_SECOND:,} connections/sec on this machine.")
+
+    if nr_differences or not readable:
+        print("- Error: The streaming extractor does not match the reference.")
+        sys.exit(1)
+    print("- The streaming extractor matches the reference.")
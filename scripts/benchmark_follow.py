@@ -0,0 +1,203 @@
+############################################################################
+### benchmark: predict --follow with lines replayed at a controlled rate ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_follow.py path_to_X_values [options]
+# e.g.  python scripts/benchmark_follow.py data/KDDTest+.txt --rates 100,1000,10000 --seconds 5 --engine numpy
+# For every rate, the lines of the input file are appended to a temporary file at that rate (lines/sec,
+# the file is read again from the start if it has fewer lines) while the follow mode of predict.py
+# (scripts/follow_input.py) predicts them. Prints the rows/sec, the batch sizes and the latency per row
+# from writing the line to handling its prediction, and checks that the predictions are the same as for
+# the whole file at once. Then a file with lines that cannot be read (a header, a malformed and a half-written line)
+# is followed: fails if other lines than these are skipped or the predictions of the other lines differ.
+#
+# With --replay the lines are written to stdout at the first rate instead, to test the stdin mode, e.g.
+# python scripts/benchmark_follow.py data/KDDTest+.txt --replay --rates 1000 | python predict.py RF - --follow
+#
+# options:
+#   --rates R1,R2,..    lines/sec replayed (default 100,1000,10000)
+#   --seconds S         replay duration per rate (default 3)
+#   --model NAME        model of MODELS in predict.py (default RF)
+#   --engine ENGINE     see predict.py (default numpy)
+#   --replay            write the lines to stdout (see above)
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from follow_input import follow_input
+from preprocessing import read_data_to_df
+
+# ---------------------------------------- variables ----------------------------------------
+
+BENCHMARK_OPTIONS = {
+    "--rates": "100,1000,10000",
+    "--seconds": 3.0,
+    "--model": "RF",
+    "--engine": "numpy",
+    "--replay": False,
+    }
+WRITE_INTERVAL = 0.002      # seconds between two writes of the replay (all lines due until then are written at once)
+IDLE_EXIT = 0.5             # the follow mode stops this many seconds after the last line
+NR_BAD_LINES_ROWS = 2000    # readable lines of the check with lines that cannot be read
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def read_lines(path_to_file:str) -> list:
+    with open(path_to_file, "r", encoding="utf-8") as f:
+        return [line if line.endswith("\n") else line + "\n" for line in f if line.strip()]
+
+
+def replay_lines(output, lines:list, rate:float, nr_lines:int, write_times=None):
+    """
+    Write nr_lines lines (repeating the lines) to the open file output at rate lines/sec,
+    all lines that are due are written every WRITE_INTERVAL seconds. With write_times (array of nr_lines),
+    the time each line was written (time.perf_counter) is stored.
+    """
+    start, written = time.perf_counter(), 0
+    while written < nr_lines:
+        due = min(int((time.perf_counter() - start) * rate) + 1, nr_lines)
+        if due > written:
+            output.write("".join(lines[i % len(lines)] for i in range(written, due)))
+            output.flush()
+            if write_times is not None:
+                write_times[written:due] = time.perf_counter()
+            written = due
+        time.sleep(WRITE_INTERVAL)
+
+
+def run_rate(model:tuple, loaded_model, schema, lines:list, rate:float, seconds:float) -> dict:
+    # replay the lines at rate into a temporary file and follow it, returns the predictions and the measurements
+    nr_lines = max(int(rate * seconds), 1)
+    write_times, done_times = np.zeros(nr_lines), np.zeros(nr_lines)
+    predictions = np.zeros(nr_lines, dtype=np.int64)
+
+    def handle_batch(first_row:int, batch_predictions, probabilities):
+        predictions[first_row:first_row + len(batch_predictions)] = batch_predictions
+        done_times[first_row:first_row + len(batch_predictions)] = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "replay.txt")
+        with open(path, "w", encoding="utf-8") as output:
+            writer = threading.Thread(target=replay_lines, args=(output, lines, rate, nr_lines, write_times))
+            writer.start()
+            summary = follow_input(path, lambda df: predict.predict_labels(model, loaded_model, df, schema),
+                                   handle_batch, idle_exit=IDLE_EXIT)
+            writer.join()
+
+    latencies = (done_times - write_times) * 1000
+    return {"rate": rate, "rows": summary["rows_total"], "expected_rows": nr_lines, "predictions": predictions,
+            "rows_per_second": nr_lines / (done_times.max() - write_times.min()),
+            "batches": summary["batches_total"], "mean_batch_rows": summary["mean_batch_rows"],
+            "max_batch_rows": summary["max_batch_rows"],
+            **{f"p{percentile}": float(np.percentile(latencies, percentile)) for percentile in [50, 90, 99]}}
+
+
+def insert_bad_lines(lines:list) -> tuple:
+    # the lines with a header at the start, a malformed line in the middle and a half-written line before the end,
+    # and the line nrs of the inserted lines
+    values = lines[0].rstrip("\n").split(",")
+    header = ",".join(predict.COLUMN_NAMES[:len(values)]) + "\n"
+    malformed = ",".join(values[:4] + ["abc"] + values[5:]) + "\n"
+    half_written = ",".join(values[:len(values) // 2]) + "\n"
+    middle, end = len(lines) // 2, len(lines) - 3
+    new_lines = [header] + lines[:middle] + [malformed] + lines[middle:end] + [half_written] + lines[end:]
+    return new_lines, [0, middle + 1, end + 2]
+
+
+def check_bad_lines(model:tuple, loaded_model, schema, lines:list, expected:np.ndarray) -> bool:
+    """
+    Follow a file with lines that cannot be read (see insert_bad_lines), returns True if only these lines 
+    are skipped and the other lines have the predictions of expected at their line nrs.
+    """
+    lines = [lines[i % len(lines)] for i in range(NR_BAD_LINES_ROWS)]
+    expected = expected[np.arange(NR_BAD_LINES_ROWS) % len(expected)]
+    new_lines, bad_line_nrs = insert_bad_lines(lines)
+    predictions = np.full(len(new_lines), -1, dtype=np.int64)
+
+    def handle_batch(first_row:int, batch_predictions, probabilities):
+        predictions[first_row:first_row + len(batch_predictions)] = batch_predictions
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "bad_lines.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(new_lines)
+        summary = follow_input(path, lambda df: predict.predict_labels(model, loaded_model, df, schema),
+                               handle_batch, idle_exit=IDLE_EXIT)
+
+    good = np.ones(len(new_lines), dtype=bool)
+    good[bad_line_nrs] = False
+    print(f"- Lines that cannot be read: {summary['skipped_lines']} of {len(new_lines)} skipped "
+          f"(inserted {len(bad_line_nrs)}), {summary['rows_total']} rows predicted.")
+    return (summary["skipped_lines"] == len(bad_line_nrs) and (predictions[~good] == -1).all()
+            and np.array_equal(predictions[good], expected))
+
+
+def print_results(results:list):
+    print(f"\n{'lines/sec':>10}{'rows':>9}{'rows/sec':>11}{'batches':>9}{'mean batch':>12}{'max batch':>11}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for result in results:
+        print(f"{result['rate']:>10,.0f}{result['rows']:>9}{result['rows_per_second']:>11,.0f}{result['batches']:>9}"
+              f"{result['mean_batch_rows']:>12.1f}{result['max_batch_rows']:>11}"
+              f"{result['p50']:>9.1f}{result['p90']:>9.1f}{result['p99']:>9.1f}")
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, BENCHMARK_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) != 2:
+        print("- Error: Expects the X values, e.g. 'python scripts/benchmark_follow.py data/KDDTest+.txt'.")
+        sys.exit(1)
+    rates = [float(rate) for rate in options["--rates"].split(",")]
+    lines = read_lines(arguments[1])
+
+    if options["--replay"]:
+        replay_lines(sys.stdout, lines, rates[0], int(rates[0] * options["--seconds"]))
+        sys.exit(0)
+
+    model = predict.find_model(options["--model"], predict.MODELS)
+    if model is None:
+        print(f"- Error: Unknown model. Expects one of {list(predict.MODELS.keys())}.")
+        sys.exit(1)
+    if not model[0].startswith("BM"):
+        model = (model[0], os.path.join(PROJECT_DIR, model[1]))
+    loaded_model = predict.load_model(model, options["--engine"])
+    schema = predict.load_model_schema(model, loaded_model)
+
+    # expected predictions: all lines of the input file at once
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "input.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        expected = np.asarray(predict.predict_labels(model, loaded_model, read_data_to_df(path), schema)[0])
+
+    results = []
+    for rate in rates:
+        print(f"- Replaying {rate:,.0f} lines/sec for {options['--seconds']} sec ...")
+        result = run_rate(model, loaded_model, schema, lines, rate, options["--seconds"])
+        result["same_predictions"] = (result["rows"] == result["expected_rows"] and np.array_equal(
+            result["predictions"], expected[np.arange(result["expected_rows"]) % len(expected)]))
+        results.append(result)
+    print_results(results)
+    print("- Following a file with lines that cannot be read ...")
+    bad_lines_ok = check_bad_lines(model, loaded_model, schema, lines, expected)
+
+    different = [f"{result['rate']:,.0f}" for result in results if not result["same_predictions"]]
+    if different:
+        print(f"- Error: The predictions at {', '.join(different)} lines/sec differ from the predictions of the whole file.")
+    if not bad_lines_ok:
+        print("- Error: With lines that cannot be read, other lines were skipped or predicted differently.")
+    if different or not bad_lines_ok:
+        sys.exit(1)
+    print("- The predictions of the follow mode are the same as for the whole file, lines that cannot be read are skipped alone.")
@@ -0,0 +1,122 @@
+############################################################################
+### benchmark: typed csv ingestion vs. reading with inferred data types ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_ingestion.py [path_to_X_values | nr_rows]
+# without input file, a file with nr_rows (default 5 million) rows sampled from the example input is created
+# the data is also converted to the columnar formats of write_data() (parquet, arrow, npy) to compare the reading
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import preprocessing
+from preprocessing import *
+
+# ---------------------------------------- variables ----------------------------------------
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(PROJECT_DIR, "test_input_X_20.txt")
+SCHEMA_FILE = os.path.join(PROJECT_DIR, "model", "random_forest_model_schema.json")
+NR_ROWS = 5_000_000
+ROWS_PER_WRITE = 1_000_000
+RSEED = 42
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_benchmark_file(path_to_file:str, nr_rows:int, rseed=RSEED):
+    # write nr_rows lines sampled from the example input, in blocks to limit the memory
+    rng = np.random.default_rng(rseed)
+    with open(SAMPLE_FILE, "r") as f:
+        lines = np.array([line.strip() + "\n" for line in f if line.strip()])
+
+    with open(path_to_file, "w", newline="") as f:
+        for start in range(0, nr_rows, ROWS_PER_WRITE):
+            f.write("".join(rng.choice(lines, min(ROWS_PER_WRITE, nr_rows - start))))
+
+
+def read_untyped(path_to_file:str, columns=None) -> pd.DataFrame:
+    # previous version of read_data_to_df(): all columns, data types inferred by pandas
+    return pd.read_csv(path_to_file, names=get_column_names(path_to_file))
+
+
+def read_typed(path_to_file:str, columns=None, engine="c") -> pd.DataFrame:
+    # read_data_to_df() with the given csv engine
+    default_engine = preprocessing.CSV_ENGINE
+    preprocessing.CSV_ENGINE = engine
+    try:
+        return read_data_to_df(path_to_file, columns)
+    finally:
+        preprocessing.CSV_ENGINE = default_engine
+
+
+def time_reading(function, path_to_file:str, **kwargs) -> tuple:
+    # return the DF and the time in seconds
+    start = time.perf_counter()
+    df_data = function(path_to_file, **kwargs)
+    return df_data, time.perf_counter() - start
+
+
+def same_values(df_reference:pd.DataFrame, df_typed:pd.DataFrame) -> bool:
+    # df_typed must have the values of df_reference (converted to COLUMN_DTYPES)
+    return df_reference[df_typed.columns].equals(df_typed)
+
+
+def print_result(name:str, df_data:pd.DataFrame, seconds:float):
+    memory = df_data.memory_usage(deep=True).sum() / 1024**2
+    print(f"{name:<32}{df_data.shape[1]:>8}{seconds:>10.3f}{len(df_data) / seconds:>14,.0f}{memory:>12.1f}")
+
+
+if __name__ == "__main__":
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+            filepath = os.path.abspath(sys.argv[1])
+        else:
+            nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+            filepath = os.path.join(temp_dir, "benchmark_input.txt")
+            print(f"- Creating a file with {nr_rows} rows ...")
+            create_benchmark_file(filepath, nr_rows)
+        file_size = os.path.getsize(filepath)
+
+        # columns of the random forest: the features in its schema and the columns they are created from
+        model_columns = get_input_columns(list(load_feature_schema(SCHEMA_FILE)["categories"].keys()))
+
+        versions = [("typed, c engine", filepath, {}),
+                    ("typed, c engine, RF columns", filepath, {"columns": model_columns})]
+        if CSV_ENGINE == "pyarrow":
+            versions += [("typed, pyarrow", filepath, {"engine": "pyarrow"}),
+                         ("typed, pyarrow, RF columns", filepath, {"columns": model_columns, "engine": "pyarrow"})]
+            output_names = ["benchmark_input.parquet", "benchmark_input.arrow", "benchmark_input_npy"]
+        else:
+            print("- pyarrow is not installed, only the c engine and the npy format are compared.")
+            output_names = ["benchmark_input_npy"]
+
+        df_reference, seconds = time_reading(read_untyped, filepath)
+        print(f"- {len(df_reference)} rows, {file_size / 1024**2:.0f} MB")
+        print(f"{'version':<32}{'columns':>8}{'seconds':>10}{'rows/sec':>14}{'memory MB':>12}")
+        print_result("inferred types (previous)", df_reference, seconds)
+        # keep the reference values with the compact data types, so that large files fit into memory
+        df_reference = df_reference.astype({column: COLUMN_DTYPES[column] for column in df_reference.columns})
+
+        for output_name in output_names:
+            output_path = write_data(df_reference, os.path.join(temp_dir, output_name))
+            versions.append((f"{get_data_format(output_path)}, RF columns", output_path, {"columns": model_columns}))
+
+        different = []
+        for name, path, kwargs in versions:
+            df_data, seconds = time_reading(read_typed, path, **kwargs)
+            print_result(name, df_data, seconds)
+            # the typed versions must have the same values as the previous version
+            if not same_values(df_reference, df_data):
+                different.append(name)
+            del df_data
+
+    if different:
+        print(f"- Error: Different values for {different}.")
+        sys.exit(1)
+    print("- All versions read the same values.")
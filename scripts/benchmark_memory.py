@@ -0,0 +1,130 @@
+############################################################################
+### benchmark: memory of the input DF with inferred, typed and compact  ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_memory.py [path_to_X_values | nr_rows]
+# without input file, a file with nr_rows (default 2 million) rows sampled from the example input is created.
+# Every version reads and preprocesses the whole file in its own process (so that the peak memory of one
+# version does not hide the next one) and predicts it with the random forest (--engine numpy):
+# - inferred:  data types inferred by pandas (int64, float64, object strings), as before COLUMN_DTYPES
+# - typed:     read_data_to_df() with COLUMN_DTYPES (default)
+# - compact:   read_data_to_df() with COMPACT_DTYPES (--compact)
+# Prints the MB of the DF after reading and after the preprocessing, the peak memory of the process
+# while reading and preprocessing, the same numbers for 10 million rows, and the memory per column of the
+# compact DF. Fails if a version predicts differently than the typed version.
+
+import hashlib
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+import preprocessing
+from benchmark_ingestion import create_benchmark_file, read_untyped
+
+# ---------------------------------------- variables ----------------------------------------
+
+NR_ROWS = 2_000_000
+VERSIONS = ["inferred", "typed", "compact"]
+SCALE_ROWS = 10_000_000     # the memory is also shown for this nr of rows (linear)
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def reset_peak_memory():
+    # Linux: restart the peak resident memory (VmHWM) of the process at the current memory,
+    # ru_maxrss would include the peak of the parent process from before the start of the new process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_mb() -> float:
+    # peak resident memory of the process in MB (VmHWM, otherwise ru_maxrss in KB)
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_version(version:str, path_to_file:str, results):
+    # runs in its own process: read, preprocess and predict the file, put the measurements into results
+    # the model is loaded after the measurement, its memory would hide the peak of reading
+    model_path = os.path.join(PROJECT_DIR, predict.MODELS["RF"])
+    schema = preprocessing.load_feature_schema(preprocessing.get_schema_path(model_path))
+    preprocessing.COMPACT_MODE = version == "compact"
+
+    reset_peak_memory()
+    peak_start, start = get_peak_mb(), time.perf_counter()
+    df_data = read_untyped(path_to_file) if version == "inferred" else preprocessing.read_data_to_df(path_to_file)
+    read_mb = df_data.memory_usage(deep=True).sum() / 1024**2
+    categorial_features = preprocessing.preprocessing_categories(df_data, schema)
+    seconds = time.perf_counter() - start
+    peak_mb = get_peak_mb() - peak_start
+    report = preprocessing.get_memory_report(df_data) if version == "compact" else None
+
+    loaded_model = predict.load_model(("RF", model_path), "numpy")
+    predictions, _ = predict.predict_features(loaded_model, df_data, categorial_features)
+    results.put({"version": version, "rows": len(df_data), "seconds": seconds, "read_mb": read_mb,
+                 "preprocessed_mb": df_data.memory_usage(deep=True).sum() / 1024**2, "peak_mb": peak_mb,
+                 "report": report, "predictions": hashlib.sha256(predictions.astype("int8").tobytes()).hexdigest()})
+
+
+def run_version(version:str, path_to_file:str) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=measure_version, args=(version, path_to_file, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def print_results(results:list):
+    scale = SCALE_ROWS / results[0]["rows"]
+    print(f"\n{'version':<12}{'seconds':>9}{'read MB':>10}{'prepr. MB':>11}{'peak MB':>10}{'bytes/row':>11}"
+          f"{'MB per ' + format(SCALE_ROWS, ',') + ' rows':>30}")
+    for result in results:
+        print(f"{result['version']:<12}{result['seconds']:>9.2f}{result['read_mb']:>10.1f}{result['preprocessed_mb']:>11.1f}"
+              f"{result['peak_mb']:>10.1f}{result['preprocessed_mb'] * 1024**2 / result['rows']:>11.1f}"
+              f"{result['preprocessed_mb'] * scale:>15,.0f} (peak {result['peak_mb'] * scale:,.0f})")
+
+
+if __name__ == "__main__":
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if len(sys.argv) > 1 and not sys.argv[1].isdigit():
+            filepath = os.path.abspath(sys.argv[1])
+        else:
+            nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+            filepath = os.path.join(temp_dir, "benchmark_input.txt")
+            print(f"- Creating {nr_rows} rows ...")
+            create_benchmark_file(filepath, nr_rows)
+
+        results = []
+        for version in VERSIONS:
+            print(f"- Reading and preprocessing ({version}) ...")
+            results.append(run_version(version, filepath))
+
+    print_results(results)
+    compact = results[VERSIONS.index("compact")]
+    print(f"\nMemory per column (compact, after the preprocessing):")
+    for column, row in compact["report"].iterrows():
+        print(f"{column:<30}{row['dtype']:>10}{row['bytes_per_row']:>6.1f} bytes/row{row['share']:>8.1%}")
+
+    typed = results[VERSIONS.index("typed")]
+    different = [result["version"] for result in results if result["predictions"] != typed["predictions"]]
+    if different:
+        print(f"- Error: The predictions of {', '.join(different)} differ from the typed version.")
+        sys.exit(1)
+    print(f"- All versions predict the same, compact needs {compact['preprocessed_mb'] / results[0]['preprocessed_mb']:.0%} "
+          f"of the memory of the inferred and {compact['preprocessed_mb'] / typed['preprocessed_mb']:.0%} of the typed version.")
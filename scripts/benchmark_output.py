@@ -0,0 +1,143 @@
+############################################################################
+### benchmark: writing the predictions row by row vs. in blocks         ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_output.py [nr_rows]
+# Writes nr_rows (default 10 million) random labels and scores with the previous output function
+# (one formatted string per row) and with scripts/prediction_writer.py in every format, in blocks of
+# BLOCK_ROWS rows (like --chunk-size). Prints seconds, rows/sec and MB of every version and compares
+# the time with the time the random forest (--engine numpy) needs to predict the same nr of rows
+# (measured for SCORING_ROWS generated rows). Fails if a text file differs from the previous version
+# or a binary file cannot be read back with the same values.
+
+import gzip
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from benchmark_ingestion import create_benchmark_file
+from prediction_writer import SCORE_DECIMALS, close_prediction_writer, open_prediction_writer, write_predictions
+from preprocessing import read_data_to_df
+
+# ---------------------------------------- variables ----------------------------------------
+
+NR_ROWS = 10_000_000
+BLOCK_ROWS = 1_000_000
+SCORING_ROWS = 200_000
+MALICIOUS_SHARE = 0.45
+FILE_NAMES = ["prediction.txt", "prediction.txt.gz", "prediction.txt.zst", "prediction.npy", "prediction.parquet"]
+RSEED = 42
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def write_row_by_row(path_to_file:str, predictions, scores=None):
+    # previous version of write_prediction_output(): one formatted string per row
+    with open(path_to_file, "w", encoding="utf-8", newline="") as f:
+        if scores is None:
+            f.write("".join(f"{prediction}\n" for prediction in predictions))
+        else:
+            f.write("".join(f"{prediction},{score:.{SCORE_DECIMALS}f}\n" for prediction, score in zip(predictions, scores)))
+
+
+def write_in_blocks(path_to_file:str, predictions, scores, write_scores=False, alerts_only=False):
+    writer = open_prediction_writer(path_to_file, write_scores, alerts_only)
+    for start in range(0, len(predictions), BLOCK_ROWS):
+        write_predictions(writer, predictions[start:start + BLOCK_ROWS], scores[start:start + BLOCK_ROWS])
+    close_prediction_writer(writer)
+
+
+def read_output(path_to_file:str):
+    # content of an output file: bytes of the text (uncompressed), array or DF
+    if path_to_file.endswith(".gz"):
+        with gzip.open(path_to_file, "rb") as f:
+            return f.read()
+    if path_to_file.endswith(".zst"):
+        import pyarrow as pa
+        return pa.CompressedInputStream(pa.OSFile(path_to_file), "zstd").read()
+    if path_to_file.endswith(".npy"):
+        return np.load(path_to_file)
+    if path_to_file.endswith(".parquet"):
+        return pd.read_parquet(path_to_file)
+    with open(path_to_file, "rb") as f:
+        return f.read()
+
+
+def check_output(content, expected_text:bytes, labels, scores, write_scores:bool, alerts_only:bool) -> bool:
+    # the text must be the same as the previous version, arrays and DFs must have the same values
+    if isinstance(content, bytes):
+        return content == expected_text
+    malicious = np.flatnonzero(labels == 1)
+    expected = ({"row": malicious, "score": scores[malicious]} if alerts_only else
+                {"label": labels, "score": scores} if write_scores else {"label": labels})
+    if isinstance(content, np.ndarray) and content.dtype.names is None:
+        content = {"label": content}
+    return all(np.array_equal(np.asarray(content[name]), values) for name, values in expected.items())
+
+
+def measure_scoring(nr_rows:int) -> float:
+    # seconds per row of the random forest (--engine numpy), for generated rows
+    model = ("RF", os.path.join(PROJECT_DIR, predict.MODELS["RF"]))
+    loaded_model = predict.load_model(model, "numpy")
+    schema = predict.load_model_schema(model, loaded_model)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "scoring.txt")
+        create_benchmark_file(path, nr_rows)
+        df_data = read_data_to_df(path, predict.get_model_input_columns(model, loaded_model))
+    start = time.perf_counter()
+    predict.predict_labels(model, loaded_model, df_data, schema)
+    return (time.perf_counter() - start) / nr_rows
+
+
+if __name__ == "__main__":
+
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+    rng = np.random.default_rng(RSEED)
+    labels = (rng.random(nr_rows) < MALICIOUS_SHARE).astype(np.int64)
+    scores = np.where(labels == 1, rng.uniform(0.5, 1, nr_rows), rng.uniform(0, 0.5, nr_rows))
+    malicious = np.flatnonzero(labels == 1)
+
+    print(f"- Measuring the prediction of {SCORING_ROWS} rows with the random forest (--engine numpy) ...")
+    scoring_seconds = measure_scoring(SCORING_ROWS) * nr_rows
+
+    results, failed = [], []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for write_scores, alerts_only in [(False, False), (True, False), (True, True)]:
+            mode = "alerts only" if alerts_only else "labels, scores" if write_scores else "labels"
+            print(f"- Writing {nr_rows} rows ({mode}) ...")
+            expected_path = os.path.join(temp_dir, "expected.txt")
+            start = time.perf_counter()
+            if alerts_only:
+                with open(expected_path, "w", encoding="utf-8", newline="") as f:
+                    f.write("".join(f"{row},{scores[row]:.{SCORE_DECIMALS}f}\n" for row in malicious))
+            else:
+                write_row_by_row(expected_path, labels, scores if write_scores else None)
+            results.append((mode, "row by row (previous)", time.perf_counter() - start, os.path.getsize(expected_path)))
+            expected_text = read_output(expected_path)
+
+            for file_name in FILE_NAMES:
+                path = os.path.join(temp_dir, file_name)
+                start = time.perf_counter()
+                write_in_blocks(path, labels, scores, write_scores, alerts_only)
+                results.append((mode, file_name, time.perf_counter() - start, os.path.getsize(path)))
+                if not check_output(read_output(path), expected_text, labels, scores, write_scores, alerts_only):
+                    failed.append(f"{file_name} ({mode})")
+                os.remove(path)
+
+    print(f"\n{'output':<16}{'version':<24}{'seconds':>9}{'rows/sec':>14}{'MB':>9}{'% of scoring':>14}")
+    for mode, version, seconds, size in results:
+        print(f"{mode:<16}{version:<24}{seconds:>9.3f}{nr_rows / seconds:>14,.0f}{size / 1024**2:>9.1f}"
+              f"{seconds / scoring_seconds:>14.1%}")
+    print(f"- Predicting {nr_rows} rows with the random forest takes about {scoring_seconds:.1f} sec.")
+
+    if failed:
+        print(f"- Error: Different content in {', '.join(failed)}.")
+        sys.exit(1)
+    print("- All files have the content of the previous version.")
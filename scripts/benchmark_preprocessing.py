@@ -0,0 +1,121 @@
+############################################################################
+### benchmark: vectorized preprocessing_categories vs. row-wise version  ###
+############################################################################
+
+# run from the project folder: python scripts/benchmark_preprocessing.py [nr_rows]
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from preprocessing import *
+
+# ---------------------------------------- variables ----------------------------------------
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILE = os.path.join(PROJECT_DIR, "test_input_X_20.txt")
+SCHEMA_FILE = os.path.join(PROJECT_DIR, "model", "random_forest_model_schema.json")
+NR_ROWS = 1_000_000
+RSEED = 42
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_benchmark_data(nr_rows:int, rseed=RSEED) -> pd.DataFrame:
+    """
+    Sample nr_rows from the example input and draw random values for the recoded
+    numerical features, so that every category of the recodes occurs.
+    """
+    rng = np.random.default_rng(rseed)
+    df_sample = read_data_to_df(SAMPLE_FILE)
+    df_data = df_sample.iloc[rng.integers(0, len(df_sample), nr_rows)].reset_index(drop=True)
+
+    recode_values = np.array([0, 0, 0, 0, 0, 1, 2, 3, 7, 12, 40])
+    for feature in RECODE_NUM_TO_BINARY_CAT + list(RECODE_NUM_TO_THREE_CAT.keys()):
+        df_data[feature] = rng.choice(recode_values, nr_rows)
+    return df_data
+
+
+def rowwise_preprocessing_categories(data_df):
+    """
+    Previous version of preprocessing_categories() with loops over the rows,
+    kept as reference for the benchmark and the comparison of the results.
+    """
+    new_categories = set([]) # all categorical features after preprocessing
+
+    # --- 1 step: convert categorical variables to categories
+    for feature in CAT_FEATURES:
+        data_df = convert_column_type(data_df, feature, 'category')
+        new_categories.add(feature)
+
+    # --- 2 step: recode numerical variables to binary categorical
+    for feature in RECODE_NUM_TO_BINARY_CAT:
+        new_feature = feature + "_cat"
+        data_df[new_feature] = [x if x == 0 else 1 for x in data_df[feature]]
+        data_df = convert_column_type(data_df, new_feature, 'category')
+        new_categories.add(new_feature)
+
+    # --- 3 step: recode numerical variables to categorical with 3 categories
+    category_labels = ["none", "low", "high"]
+    for feature, boundary in RECODE_NUM_TO_THREE_CAT.items():
+        categories = get_conditions(data_df, feature, boundary)
+        new_feature = feature + "_cat"
+        recode_to_categories(data_df, new_feature, categories, category_labels)
+        new_categories.add(new_feature)
+
+    return list(new_categories)
+
+
+def time_preprocessing(function, df_data:pd.DataFrame, **kwargs) -> tuple:
+    # return the preprocessed copy of df_data, the features and the time in seconds
+    df_copy = df_data.copy()
+    start = time.perf_counter()
+    features = function(df_copy, **kwargs)
+    return df_copy, features, time.perf_counter() - start
+
+
+def compare_features(df_reference:pd.DataFrame, df_new:pd.DataFrame, features:list, schema=None) -> list:
+    """
+    Return the features where df_new has other values than df_reference.
+    With a schema, values of df_reference that are not in the frozen categories must be missing in df_new.
+    """
+    different = []
+    for feature in features:
+        reference = df_reference[feature].astype(object)
+        if schema:
+            reference = reference.where(reference.isin(schema["categories"][feature]))
+        if not reference.equals(df_new[feature].astype(object)):
+            different.append(feature)
+    return different
+
+
+if __name__ == "__main__":
+
+    nr_rows = int(sys.argv[1]) if len(sys.argv) > 1 else NR_ROWS
+    schema = load_feature_schema(SCHEMA_FILE)
+
+    print(f"- Creating {nr_rows} rows of benchmark data ...")
+    df_data = create_benchmark_data(nr_rows)
+
+    df_rowwise, features, time_rowwise = time_preprocessing(rowwise_preprocessing_categories, df_data)
+    df_inferred, _, time_inferred = time_preprocessing(preprocessing_categories, df_data)
+    df_frozen, _, time_frozen = time_preprocessing(preprocessing_categories, df_data, schema=schema)
+
+    print(f"{'version':<30}{'seconds':>10}{'rows/sec':>14}")
+    for name, seconds in [("row-wise (previous)", time_rowwise),
+                          ("vectorized", time_inferred),
+                          ("vectorized + frozen schema", time_frozen)]:
+        print(f"{name:<30}{seconds:>10.3f}{nr_rows / seconds:>14,.0f}")
+
+    # the vectorized versions must create the same features
+    different = compare_features(df_rowwise, df_inferred, features)
+    if schema:
+        different += compare_features(df_rowwise, df_frozen, features, schema)
+    else:
+        print(f"- Cannot find the feature schema '{SCHEMA_FILE}', frozen schema not compared.")
+
+    if different:
+        print(f"- Error: Different values for features {different}.")
+        sys.exit(1)
+    print("- All versions create the same features.")
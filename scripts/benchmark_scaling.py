@@ -0,0 +1,229 @@
+############################################################################
+### benchmark: end-to-end scaling of predict.py from 10k to 10M rows    ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_scaling.py [options]
+# e.g.  python scripts/benchmark_scaling.py --sizes 10000,100000,1000000 --models RF --save-baseline
+# For every size, an input is generated with scripts/generate_data.py (statistics of --statistics, if the file
+# does not exist they are fitted to the example input test_input_X_20.txt) and predicted by predict.py
+# (read, preprocess, predict, write) with every model and engine, each run in its own process.
+# Prints the rows/sec of the whole run and of the stages (from --metrics-file of predict.py) and the peak
+# memory of the process, and compares them with the stored baseline of the same model, engine and size:
+# a run is a regression if it is more than --tolerance slower (also a stage that takes at least
+# MIN_STAGE_SECONDS) or needs more than --tolerance more peak memory. Fails if there is a regression
+# or a run fails (e.g. out of memory, see --chunk-size).
+# The baseline depends on the machine, so it is kept in .cache/ and not in the repository.
+#
+# options:
+#   --sizes N1,N2,..        nr of rows (default 10000,100000,1000000,10000000)
+#   --models M1,M2,..       models of MODELS in predict.py (default all)
+#   --engines E1,E2,..      engines of the random forest (default sklearn,numpy)
+#   --chunk-size N          passed to predict.py (default 0: whole file at once)
+#   --statistics FILE       statistics of generate_data.py (default data/KDDTrain+_statistics.json)
+#   --data-dir DIR          keep the generated inputs in DIR and reuse them (default: temporary, deleted)
+#   --baseline FILE         default .cache/benchmark_scaling_baseline.json
+#   --save-baseline         store the results as baseline (replaces the runs of the same model, engine and size)
+#   --tolerance T           allowed share of slowdown or more memory (default 0.25)
+#   --results FILE          also write the results to this JSON file
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from generate_data import STATISTICS_FILE, fit_statistics, load_statistics, write_generated_data
+from preprocessing import read_data_to_df, read_labels
+
+# ---------------------------------------- variables ----------------------------------------
+
+BENCHMARK_OPTIONS = {
+    "--sizes": "10000,100000,1000000,10000000",
+    "--models": ",".join(predict.MODELS),
+    "--engines": ",".join(predict.ENGINES),
+    "--chunk-size": 0,
+    "--statistics": STATISTICS_FILE,
+    "--data-dir": "",
+    "--baseline": os.path.join(PROJECT_DIR, ".cache", "benchmark_scaling_baseline.json"),
+    "--save-baseline": False,
+    "--tolerance": 0.25,
+    "--results": "",
+    }
+SAMPLE_X_FILE = os.path.join(PROJECT_DIR, "test_input_X_20.txt")
+SAMPLE_Y_FILE = os.path.join(PROJECT_DIR, "test_input_y_20.txt")
+COMPARED_STAGES = ["read", "preprocess", "predict", "write"]
+MIN_STAGE_SECONDS = 0.2     # shorter stages are too noisy to be compared with the baseline
+BASELINE_VERSION = 1        # change when the format of the baseline file changes
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def get_statistics(path_to_file:str) -> dict | None:
+    # statistics for the generator, fitted to the example input if the file does not exist
+    if os.path.exists(path_to_file):
+        return load_statistics(path_to_file)
+    print(f"- Note: {path_to_file} not found, the statistics are fitted to the example input (20 rows).")
+    return fit_statistics(read_data_to_df(SAMPLE_X_FILE), read_labels(SAMPLE_Y_FILE).read()["attack_type"])
+
+
+def get_cases(models:list, engines:list) -> list:
+    # (model, engine) of every run, the baseline models do not use an engine
+    cases = []
+    for name in models:
+        model = predict.find_model(name, predict.MODELS)
+        if model is None:
+            print(f"- Error: Unknown model {name}. Expects one of {list(predict.MODELS.keys())}.")
+            return
+        if not model[0].startswith("BM") and not os.path.exists(os.path.join(PROJECT_DIR, model[1])):
+            print(f"- Note: {model[0]} is skipped, its model file {model[1]} does not exist.")
+            continue
+        cases += [(model[0], None)] if model[0].startswith("BM") else [(model[0], engine) for engine in engines]
+    return cases
+
+
+def run_case(model_name:str, engine:str | None, path_to_file:str, nr_rows:int, chunk_size:int, temp_dir:str) -> dict:
+    """
+    Predict the file with predict.py in a new process, return the wall time, rows/sec, the peak memory
+    of the process (measured by predict.py, see get_peak_memory_bytes) and the rows/sec and seconds of its stages.
+    """
+    metrics_file = os.path.join(temp_dir, "metrics.json")
+    command = [sys.executable, os.path.join(PROJECT_DIR, "predict.py"), model_name, path_to_file,
+               "--metrics-file", metrics_file, "--output", os.path.join(temp_dir, "prediction.txt")]
+    if engine is not None:
+        command += ["--engine", engine]
+    if chunk_size:
+        command += ["--chunk-size", str(chunk_size)]
+
+    start = time.perf_counter()
+    exit_code = subprocess.run(command, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    seconds = time.perf_counter() - start
+
+    result = {"model": model_name, "engine": engine, "rows": nr_rows, "exit_code": exit_code,
+              "seconds": seconds, "rows_per_second": nr_rows / seconds, "peak_mb": None, "stages": {}}
+    if exit_code == 0:
+        with open(metrics_file, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+        result["peak_mb"] = summary["peak_memory_bytes"] / 1024**2 if summary["peak_memory_bytes"] else None
+        result["stages"] = {stage: {"seconds": values["wall_seconds"], "rows_per_second": values["rows_per_second"]}
+                            for stage, values in summary["stages"].items() if stage in COMPARED_STAGES}
+        os.remove(metrics_file)
+    return result
+
+
+def get_case_key(result:dict) -> str:
+    return f"{result['model']}|{result['engine'] or '-'}|{result['rows']}"
+
+
+def load_baseline(path_to_file:str) -> dict:
+    # stored results by case key, empty if there is no baseline yet
+    try:
+        with open(path_to_file, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if baseline.get("version") != BASELINE_VERSION:
+        print(f"- Note: The baseline {path_to_file} has another version and is not used.")
+        return {}
+    if baseline.get("machine") != get_machine():
+        print(f"- Note: The baseline was measured on another machine ({baseline.get('machine')}).")
+    return baseline["results"]
+
+
+def save_baseline(results:list, path_to_file:str):
+    # the successful runs replace the runs of the same case, the others are kept
+    stored = load_baseline(path_to_file)
+    stored.update({get_case_key(result): result for result in results if result["exit_code"] == 0})
+    os.makedirs(os.path.dirname(os.path.abspath(path_to_file)), exist_ok=True)
+    with open(path_to_file, "w", encoding="utf-8") as f:
+        json.dump({"version": BASELINE_VERSION, "machine": get_machine(), "results": stored}, f, indent=4)
+
+
+def get_machine() -> str:
+    return f"{platform.machine()}, {os.cpu_count()} cpus, {platform.system()}, python {platform.python_version()}"
+
+
+def find_regressions(result:dict, baseline:dict, tolerance:float) -> list:
+    # descriptions of the measurements that are worse than the baseline of the same case by more than tolerance
+    if result["exit_code"] != 0:
+        return [f"failed with exit code {result['exit_code']}"]
+    reference = baseline.get(get_case_key(result))
+    if reference is None:
+        return []
+
+    regressions = []
+    if result["rows_per_second"] < reference["rows_per_second"] * (1 - tolerance):
+        regressions.append(f"rows/sec {result['rows_per_second']:,.0f} (baseline {reference['rows_per_second']:,.0f})")
+    if result["peak_mb"] and reference["peak_mb"] and result["peak_mb"] > reference["peak_mb"] * (1 + tolerance):
+        regressions.append(f"peak MB {result['peak_mb']:,.0f} (baseline {reference['peak_mb']:,.0f})")
+    for stage, values in result["stages"].items():
+        stored = reference["stages"].get(stage)
+        if (stored and values["rows_per_second"] and stored["rows_per_second"]
+                and max(values["seconds"], stored["seconds"]) >= MIN_STAGE_SECONDS
+                and values["rows_per_second"] < stored["rows_per_second"] * (1 - tolerance)):
+            regressions.append(f"{stage} rows/sec {values['rows_per_second']:,.0f} (baseline {stored['rows_per_second']:,.0f})")
+    return regressions
+
+
+def print_results(results:list, baseline:dict):
+    print(f"\n{'model':<14}{'engine':<9}{'rows':>12}{'seconds':>10}{'rows/sec':>12}"
+          + "".join(f"{stage + ' r/s':>16}" for stage in COMPARED_STAGES) + f"{'peak MB':>10}{'vs. baseline':>14}")
+    for result in results:
+        stages = "".join(f"{result['stages'][stage]['rows_per_second'] or 0:>16,.0f}" if stage in result["stages"]
+                         else f"{'-':>16}" for stage in COMPARED_STAGES)
+        reference = baseline.get(get_case_key(result))
+        change = f"{result['rows_per_second'] / reference['rows_per_second'] - 1:>+14.1%}" if reference and result["exit_code"] == 0 else f"{'-':>14}"
+        print(f"{result['model']:<14}{result['engine'] or '-':<9}{result['rows']:>12,}{result['seconds']:>10.2f}"
+              f"{result['rows_per_second']:>12,.0f}{stages}{result['peak_mb'] or 0:>10,.0f}{change}")
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, BENCHMARK_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    _, options = parsed_arguments
+    sizes = [int(size) for size in options["--sizes"].split(",")]
+    cases = get_cases(options["--models"].split(","), options["--engines"].split(","))
+    statistics = get_statistics(options["--statistics"])
+    if cases is None or statistics is None:
+        sys.exit(1)
+    baseline = load_baseline(options["--baseline"])
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = options["--data-dir"] or temp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        for nr_rows in sizes:
+            path = os.path.join(data_dir, f"generated_X_{nr_rows}.txt")
+            if not os.path.exists(path):
+                print(f"- Generating {nr_rows:,} rows ...")
+                write_generated_data(statistics, nr_rows, path)
+            for model_name, engine in cases:
+                print(f"- Predicting {nr_rows:,} rows with {model_name}" + (f" ({engine})" if engine else "") + " ...")
+                results.append(run_case(model_name, engine, path, nr_rows, options["--chunk-size"], temp_dir))
+            if not options["--data-dir"]:
+                os.remove(path)
+
+    print_results(results, baseline)
+    if options["--results"]:
+        with open(options["--results"], "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    regressions = [(result, find_regressions(result, baseline, options["--tolerance"])) for result in results]
+    regressions = [(result, found) for result, found in regressions if found]
+    if options["--save-baseline"]:
+        save_baseline(results, options["--baseline"])
+        print(f"- Baseline written to {options['--baseline']}")
+    if not baseline:
+        print("- No baseline to compare with, store one with --save-baseline.")
+    if regressions:
+        for result, found in regressions:
+            print(f"- Regression of {result['model']} {result['engine'] or ''} with {result['rows']:,} rows: {', '.join(found)}")
+        sys.exit(1)
+    print(f"- No regressions (tolerance {options['--tolerance']:.0%}).")
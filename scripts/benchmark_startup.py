@@ -0,0 +1,103 @@
+############################################################################
+### benchmark: cold start time of predict.py (python -X importtime)     ###
+############################################################################
+
+# run from the project folder: python scripts/benchmark_startup.py [nr_runs]
+# runs predict.py for a single row (see STARTUP_CASES) in new python processes and fails (exit code 1)
+# if a case imports modules it does not need, or its import time exceeds its budget.
+# note: like every prediction, the runs write prediction.txt in the project folder
+
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+# ---------------------------------------- variables ----------------------------------------
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(PROJECT_DIR, "scripts")
+NR_RUNS = 3                 # the median of the runs is reported
+NR_SLOWEST_IMPORTS = 3      # nr of slowest top level imports shown per case
+
+# name, arguments of predict.py, modules that must not be imported, max. import time in seconds
+STARTUP_CASES = [
+    ("BM_protocol", ["BM_protocol", "test_input_X_1.txt"], ["matplotlib", "seaborn", "scipy", "sklearn"], 1.5),
+    ("RF", ["RF", "test_input_X_1.txt"], ["matplotlib", "seaborn"], 3.5),
+    ("RF --engine numpy", ["RF", "test_input_X_1.txt", "--engine", "numpy"], ["matplotlib", "seaborn", "scipy", "sklearn"], 1.5),
+    ]
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def run_with_importtime(arguments:list) -> tuple:
+    """
+    Run predict.py with the arguments in a new python process with -X importtime.
+    Returns the wall time in seconds and the import times (stderr of the process).
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([SCRIPTS_DIR] + [path for path in [env.get("PYTHONPATH")] if path])
+    env["PYTHONWARNINGS"] = "ignore"
+
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "predict.py"] + arguments,
+                             cwd=PROJECT_DIR, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+
+    if process.returncode != 0:
+        print(process.stdout, process.stderr[-2000:])
+        raise RuntimeError(f"predict.py {' '.join(arguments)} failed.")
+    return seconds, process.stderr
+
+
+def parse_importtime(importtime_output:str) -> dict:
+    """
+    Return the cumulative import time in seconds of all top level imports
+    (also the ones imported later in functions, e.g. by pickle) from the output of -X importtime.
+    Nested imports are indented in the output and already part of the cumulative time of their parent.
+    """
+    imports = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "): # top level: only the single space after "|"
+            imports[name.strip()] = imports.get(name.strip(), 0) + int(cumulative) / 1e6
+    return imports
+
+
+def get_imported_modules(importtime_output:str) -> set:
+    # names of all imported packages (first part of the module names)
+    return {line.rsplit("|", 1)[1].strip().split(".")[0]
+            for line in importtime_output.splitlines() if line.startswith("import time:") and "|" in line}
+
+
+if __name__ == "__main__":
+
+    nr_runs = int(sys.argv[1]) if len(sys.argv) > 1 else NR_RUNS
+
+    errors = []
+    print(f"{'case':<20}{'wall sec':>10}{'import sec':>12}{'budget':>8}   slowest imports")
+    for name, arguments, forbidden_modules, max_import_seconds in STARTUP_CASES:
+        wall_times, import_times = [], []
+        for _ in range(nr_runs):
+            seconds, importtime_output = run_with_importtime(arguments)
+            imports = parse_importtime(importtime_output)
+            wall_times.append(seconds)
+            import_times.append(sum(imports.values()))
+
+        import_seconds = float(np.median(import_times))
+        slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:NR_SLOWEST_IMPORTS]
+        print(f"{name:<20}{np.median(wall_times):>10.3f}{import_seconds:>12.3f}{max_import_seconds:>8.1f}   "
+              + ", ".join(f"{module} {seconds:.2f}" for module, seconds in slowest))
+
+        unneeded = sorted(set(forbidden_modules) & get_imported_modules(importtime_output))
+        if unneeded:
+            errors.append(f"{name} imports {unneeded}")
+        if import_seconds > max_import_seconds:
+            errors.append(f"{name} takes {import_seconds:.2f} sec to import, budget {max_import_seconds} sec")
+
+    if errors:
+        for error in errors:
+            print(f"- Error: {error}.")
+        sys.exit(1)
+    print("- All cases start within their budget and without unneeded imports.")
@@ -0,0 +1,103 @@
+############################################################################
+### benchmark: NumPy tree engine vs. sklearn pipeline                   ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_tree_engine.py [path_to_X_values e.g. data/KDDTest+.txt]
+# without input file, random rows with the categories of the training data are used
+
+import os
+import pickle
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from preprocessing import *
+from tree_engine import compile_pipeline, encode_categories, predict_proba_compiled
+from benchmark_preprocessing import create_benchmark_data
+
+# ---------------------------------------- variables ----------------------------------------
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_FILE = os.path.join(PROJECT_DIR, "model", "random_forest_model.pkl")
+NR_ROWS = 500_000               # rows of random data, if no input file is given
+NR_LATENCY_ROWS = 500           # nr of single row predictions to measure the latency
+RSEED = 42
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def create_random_data(nr_rows:int, schema:dict, rseed=RSEED) -> pd.DataFrame:
+    # benchmark data with random protocol_type, service and flag from the categories of the schema
+    rng = np.random.default_rng(rseed)
+    df_data = create_benchmark_data(nr_rows, rseed)
+    for feature in ["protocol_type", "service", "flag"]:
+        df_data[feature] = rng.choice(schema["categories"][feature], nr_rows)
+    df_data["difficulty_level"] = rng.choice(schema["categories"]["difficulty_level"], nr_rows)
+    return df_data
+
+
+def predict_sklearn(pipeline, df_X:pd.DataFrame) -> np.ndarray:
+    return pipeline.predict_proba(df_X)
+
+
+def predict_numpy(compiled:dict, df_X:pd.DataFrame) -> np.ndarray:
+    return predict_proba_compiled(compiled, encode_categories(compiled, df_X))
+
+
+def time_function(function, *args) -> tuple:
+    # return the result of the function and the time in seconds
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def single_row_latencies(function, model, df_X:pd.DataFrame, nr_rows:int) -> np.ndarray:
+    # latency in ms for predicting nr_rows single rows one after another
+    latencies = []
+    for i in range(min(nr_rows, len(df_X))):
+        df_row = df_X.iloc[[i]]
+        start = time.perf_counter()
+        function(model, df_row)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+if __name__ == "__main__":
+
+    with open(MODEL_FILE, "rb") as f:
+        pipeline = pickle.load(f)
+    compiled = compile_pipeline(pipeline)
+    schema = get_feature_schema(pipeline)
+
+    if len(sys.argv) > 1:
+        df_data = read_data_to_df(sys.argv[1])
+        if df_data is None:
+            sys.exit(1)
+    else:
+        df_data = create_random_data(NR_ROWS, schema)
+
+    features = preprocessing_categories(df_data, schema)
+    df_X = df_data[NUM_FEATURES + features]
+    print(f"- Benchmark with {len(df_X)} rows, {len(compiled['tree_roots'])} trees.")
+
+    # both engines must return exactly the same probabilities and predictions
+    proba_sklearn, time_sklearn = time_function(predict_sklearn, pipeline, df_X)
+    proba_numpy, time_numpy = time_function(predict_numpy, compiled, df_X)
+
+    same_predictions = np.array_equal(np.argmax(proba_sklearn, axis=1), np.argmax(proba_numpy, axis=1))
+    same_probabilities = np.array_equal(proba_sklearn, proba_numpy)
+    print(f"- Same predictions: {same_predictions}, same probabilities: {same_probabilities} "
+          f"(max. difference {np.abs(proba_sklearn - proba_numpy).max():.2e})")
+
+    latency_sklearn = single_row_latencies(predict_sklearn, pipeline, df_X, NR_LATENCY_ROWS)
+    latency_numpy = single_row_latencies(predict_numpy, compiled, df_X, NR_LATENCY_ROWS)
+
+    print(f"{'engine':<10}{'batch sec':>12}{'rows/sec':>14}{'1 row p50 ms':>16}{'1 row p95 ms':>16}")
+    for name, seconds, latencies in [("sklearn", time_sklearn, latency_sklearn),
+                                     ("numpy", time_numpy, latency_numpy)]:
+        print(f"{name:<10}{seconds:>12.3f}{len(df_X) / seconds:>14,.0f}"
+              f"{np.percentile(latencies, 50):>16.3f}{np.percentile(latencies, 95):>16.3f}")
+
+    if not (same_predictions and same_probabilities):
+        sys.exit(1)
@@ -0,0 +1,93 @@
+############################################################################
+### benchmark: speedup of the sharded prediction per nr of workers      ###
+############################################################################
+
+# run from the project folder:
+# python scripts/benchmark_workers.py path_to_X_values [max_workers] [results.json]
+# e.g.  python scripts/benchmark_workers.py data/KDDTest+.txt 32 benchmark_workers.json
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+
+# ---------------------------------------- variables ----------------------------------------
+
+MODEL_NAME = "RF"
+ENGINE = "numpy"
+
+# ------------------------------------ benchmark functions ------------------------------------
+
+def get_worker_counts(max_workers:int) -> list:
+    # 1, 2, 4, 8, ... and max_workers
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if max_workers > 1:
+        counts.append(max_workers)
+    return counts
+
+
+def file_hash(path_to_file:str) -> str:
+    with open(path_to_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def time_prediction(model:tuple, filepath:str, workers:int) -> float:
+    # seconds for the whole prediction (read, preprocess, predict, write) with the given nr of workers
+    start = time.perf_counter()
+    predict.run_prediction(model, filepath, engine=ENGINE, workers=workers)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print("- Error: Expects the path to the X values, e.g. 'python scripts/benchmark_workers.py data/KDDTest+.txt'.")
+        sys.exit(1)
+
+    filepath = os.path.abspath(sys.argv[1])
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    results_file = sys.argv[3] if len(sys.argv) > 3 else None
+
+    os.chdir(PROJECT_DIR) # model paths in MODELS are relative to the project folder
+    model = predict.find_model(MODEL_NAME, predict.MODELS)
+    with open(filepath, "rb") as f:
+        nr_rows = sum(1 for _ in f)
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        predict.output_file_name = os.path.join(output_dir, "prediction.txt")
+
+        for workers in get_worker_counts(max_workers):
+            seconds = time_prediction(model, filepath, workers)
+            results.append({"workers": workers,
+                            "seconds": round(seconds, 3),
+                            "rows_per_sec": round(nr_rows / seconds),
+                            "output_hash": file_hash(predict.output_file_name)})
+
+    # speedup compared to 1 worker, efficiency = speedup / workers (1.0 is linear scaling)
+    print(f"\n- {nr_rows} rows, {os.cpu_count()} cores, model {MODEL_NAME} (engine {ENGINE})")
+    print(f"{'workers':>8}{'seconds':>10}{'rows/sec':>14}{'speedup':>10}{'efficiency':>12}")
+    for result in results:
+        result["speedup"] = round(results[0]["seconds"] / result["seconds"], 2)
+        result["efficiency"] = round(result["speedup"] / result["workers"], 2)
+        print(f"{result['workers']:>8}{result['seconds']:>10.3f}{result['rows_per_sec']:>14,}"
+              f"{result['speedup']:>10.2f}{result['efficiency']:>12.2f}")
+
+    if len(set(result["output_hash"] for result in results)) > 1:
+        print("- Error: The output files differ between the worker counts.")
+        sys.exit(1)
+
+    if results_file:
+        with open(results_file, "w", encoding="utf-8") as f:
+            json.dump({"input_file": filepath, "nr_rows": nr_rows, "cpu_count": os.cpu_count(),
+                       "model": MODEL_NAME, "engine": ENGINE, "results": results}, f, indent=4)
+        print(f"- Results written to {results_file}.")
@@ -0,0 +1,268 @@
+############################################################################
+### cascade of cheap rules in front of the random forest (--cascade)    ###
+############################################################################
+
+# Most rows are easy to classify (e.g. floods of REJ connections to private ports), so they are decided
+# by cheap vectorized rules and only the remaining rows are predicted by the random forest.
+# - stage 1: baseline models (see model_evaluation.py), for the classes where they agree with the forest
+# - stage 2: rules learned from the forest: combinations of RULE_FEATURES (e.g. tcp / private / REJ)
+#            where the forest predicts the same class with high probability for all rows
+#
+# fit step: python scripts/cascade.py model/random_forest_model.pkl path_to_X_values [path_to_validation_X]
+#           --> writes model/random_forest_model_cascade.json
+
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from model_evaluation import baseline_model_risky_protocol
+
+# ---------------------------------------- variables ----------------------------------------
+
+CASCADE_VERSION = 1             # change when the format of the cascade file changes
+# baseline models that are tried as rules (only classes that agree with the forest are used)
+CASCADE_BASELINES = {"BM_protocol": baseline_model_risky_protocol}
+RULE_FEATURES = ["protocol_type", "service", "flag"] # a learned rule is a combination of values of these features
+MIN_RULE_SUPPORT = 30           # min. nr of rows in the fit data for a rule
+MIN_RULE_CONFIDENCE = 0.99      # min. probability of the forest for the class of a rule (for every row)
+MIN_BASELINE_AGREEMENT = 0.99   # min. share of the rows decided by a baseline that the forest predicts the same
+
+# ------------------------------------ cascade functions ------------------------------------
+
+def get_cascade_path(model_path:str) -> str:
+    # the rules of a model are stored next to the model file, e.g. model/random_forest_model_cascade.json
+    return os.path.splitext(model_path)[0] + "_cascade.json"
+
+
+def get_file_hash(path_to_file:str) -> str:
+    with open(path_to_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_cascade(model_path:str) -> dict | None:
+    """
+    Load the rules of the model from the cascade file next to model_path (see fit_cascade).
+    Returns None if the file does not exist, has another version or was fitted for another model file.
+    """
+    path_to_file = get_cascade_path(model_path)
+    try:
+        with open(path_to_file, "r", encoding="utf-8") as f:
+            cascade = json.load(f)
+    except (OSError, ValueError) as error:
+        print(f"- Error: Cannot read the cascade rules {path_to_file}: {error}")
+        print(f"  Fit them with: python scripts/cascade.py {model_path} path_to_X_values")
+        return
+
+    if cascade.get("version") != CASCADE_VERSION:
+        print(f"- Error: The cascade rules {path_to_file} have version {cascade.get('version')}, expected {CASCADE_VERSION}.")
+        return
+    if cascade.get("model_hash") != get_file_hash(model_path):
+        print(f"- Error: The cascade rules {path_to_file} were fitted for another version of {model_path}.")
+        return
+    return cascade
+
+
+def new_cascade_state(cascade:dict) -> dict:
+    """
+    Create the state of the cascade for the prediction: the rules as lookup index
+    and the nr of rows decided by each stage (updated by apply_cascade).
+    """
+    rules = cascade["rules"]
+    return {"cascade": cascade,
+            "rule_index": pd.MultiIndex.from_tuples([tuple(rule["values"]) for rule in rules], names=cascade["rule_features"])
+                          if rules else None,
+            "rule_predictions": np.array([rule["prediction"] for rule in rules], dtype=np.int64),
+            "rule_probabilities": np.array([rule["probability"] for rule in rules], dtype=np.float64),
+            "rows": 0,
+            "decided": {stage: 0 for stage in get_stage_names(cascade)}}
+
+
+def get_stage_names(cascade:dict) -> list:
+    return [f"{stage['name']} = {stage['prediction']}" for stage in cascade["baseline_stages"]] + ["learned rules"]
+
+
+def apply_rules(state:dict, df_data:pd.DataFrame) -> tuple:
+    """
+    Apply the stages of the cascade to the raw data (before preprocessing).
+    Returns a mask of the decided rows, their predictions and probabilities of class 1 (for all rows,
+    only valid where decided) and the nr of rows decided by each stage.
+    """
+    cascade = state["cascade"]
+    decided = np.zeros(len(df_data), dtype=bool)
+    predictions = np.zeros(len(df_data), dtype=np.int64)
+    probabilities = np.zeros(len(df_data), dtype=np.float64)
+    decided_per_stage = []
+
+    # stage 1: baseline models, each decides the rows where it predicts its class
+    for stage in cascade["baseline_stages"]:
+        baseline_predictions = np.asarray(CASCADE_BASELINES[stage["name"]](df_data))
+        mask = ~decided & (baseline_predictions == stage["prediction"])
+        predictions[mask] = stage["prediction"]
+        probabilities[mask] = stage["probability"]
+        decided |= mask
+        decided_per_stage.append(int(mask.sum()))
+
+    # stage 2: learned rules, looked up by the values of the rule features
+    if state["rule_index"] is not None:
+        keys = pd.MultiIndex.from_arrays([df_data[feature].to_numpy() for feature in cascade["rule_features"]])
+        rule_positions = state["rule_index"].get_indexer(keys)
+        mask = ~decided & (rule_positions >= 0)
+        predictions[mask] = state["rule_predictions"][rule_positions[mask]]
+        probabilities[mask] = state["rule_probabilities"][rule_positions[mask]]
+        decided |= mask
+        decided_per_stage.append(int(mask.sum()))
+    else:
+        decided_per_stage.append(0)
+
+    return decided, predictions, probabilities, decided_per_stage
+
+
+def apply_cascade(state:dict, df_data:pd.DataFrame) -> tuple:
+    """
+    Same as apply_rules(), but only return the decided rows, predictions and probabilities
+    and add the nr of rows decided by each stage to state. The rows that are not decided are left to the model.
+    """
+    decided, predictions, probabilities, decided_per_stage = apply_rules(state, df_data)
+    state["rows"] += len(df_data)
+    for stage, nr_rows in zip(state["decided"], decided_per_stage):
+        state["decided"][stage] += nr_rows
+    return decided, predictions, probabilities
+
+
+def merge_cascade_stats(state:dict | None, stats:dict):
+    # add the counts of another process (e.g. a worker of --workers) to state
+    if state is None:
+        return
+    state["rows"] += stats["rows"]
+    for stage, nr_rows in stats["decided"].items():
+        state["decided"][stage] += nr_rows
+
+
+def get_cascade_stats(state:dict) -> dict:
+    # nr of rows, rows decided per stage and the share of rows decided by the rules (short-circuited)
+    nr_decided = sum(state["decided"].values())
+    return {"rows": state["rows"],
+            "decided": dict(state["decided"]),
+            "short_circuit_share": round(nr_decided / state["rows"], 4) if state["rows"] else None,
+            "model_rows": state["rows"] - nr_decided}
+
+
+def print_cascade_stats(state:dict):
+    stats = get_cascade_stats(state)
+    if not stats["rows"]:
+        return
+    print(f"- Cascade: {stats['rows'] - stats['model_rows']} of {stats['rows']} rows ({stats['short_circuit_share']:.1%}) "
+          f"decided by rules, {stats['model_rows']} predicted by the model.")
+    for stage, nr_rows in stats["decided"].items():
+        print(f"    {stage:<24}{nr_rows:>12}")
+
+# ------------------------------------ fit cascade ------------------------------------
+
+def fit_cascade(df_data:pd.DataFrame, model_predictions:np.ndarray, model_probabilities:np.ndarray,
+                min_support=MIN_RULE_SUPPORT, min_confidence=MIN_RULE_CONFIDENCE, min_agreement=MIN_BASELINE_AGREEMENT) -> dict:
+    """
+    Fit the rules of the cascade to the predictions and probabilities of class 1 of the model for df_data (raw data).
+
+    - baseline stages: a class of a baseline model is used if the model predicts the same class
+      for at least min_agreement of the (at least min_support) rows where the baseline predicts it.
+    - learned rules: combinations of RULE_FEATURES with at least min_support rows (not decided by the baselines),
+      for which the model predicts the same class for all rows with a probability of at least min_confidence.
+      The probability of a rule is the mean probability of class 1 of its rows.
+    """
+    model_predictions = np.asarray(model_predictions)
+    model_probabilities = np.asarray(model_probabilities, dtype=np.float64)
+    decided = np.zeros(len(df_data), dtype=bool)
+
+    baseline_stages = []
+    for name, baseline in CASCADE_BASELINES.items():
+        baseline_predictions = np.asarray(baseline(df_data))
+        for prediction in np.unique(baseline_predictions):
+            mask = ~decided & (baseline_predictions == prediction)
+            support = int(mask.sum())
+            agreement = float((model_predictions[mask] == prediction).mean()) if support else 0.0
+            if support >= min_support and agreement >= min_agreement:
+                baseline_stages.append({"name": name, "prediction": int(prediction), "support": support,
+                                        "agreement": round(agreement, 6), "probability": float(prediction)})
+                decided |= mask
+
+    df_regions = pd.DataFrame({feature: df_data[feature].to_numpy()[~decided] for feature in RULE_FEATURES})
+    df_regions["probability"] = model_probabilities[~decided]
+    df_regions["prediction"] = model_predictions[~decided]
+    regions = df_regions.groupby(RULE_FEATURES, observed=True, sort=True).agg(
+        support=("probability", "size"), min_probability=("probability", "min"),
+        max_probability=("probability", "max"), probability=("probability", "mean"),
+        min_prediction=("prediction", "min"), max_prediction=("prediction", "max"))
+
+    confident = ((regions["min_probability"] >= min_confidence) | (regions["max_probability"] <= 1 - min_confidence))
+    regions = regions[(regions["support"] >= min_support) & confident
+                      & (regions["min_prediction"] == regions["max_prediction"])]
+    rules = [{"values": [str(value) for value in values], "prediction": int(region["min_prediction"]),
+              "probability": round(float(region["probability"]), 6), "support": int(region["support"])}
+             for values, region in regions.iterrows()]
+
+    return {"version": CASCADE_VERSION,
+            "baseline_stages": baseline_stages,
+            "rule_features": RULE_FEATURES,
+            "rules": rules,
+            "min_support": min_support,
+            "min_confidence": min_confidence,
+            "min_agreement": min_agreement}
+
+
+def evaluate_cascade(cascade:dict, df_data:pd.DataFrame, model_predictions:np.ndarray) -> dict:
+    """
+    Compare the rules of the cascade with the predictions of the model for df_data:
+    share of the rows decided by the rules (short-circuited) and the agreement of the cascade with the model
+    (for all rows, the rows predicted by the model agree by definition) and of the decided rows only.
+    """
+    state = new_cascade_state(cascade)
+    decided, predictions, _, decided_per_stage = apply_rules(state, df_data)
+    model_predictions = np.asarray(model_predictions)
+    same = (predictions == model_predictions) | ~decided
+    return {"rows": len(df_data),
+            "short_circuit_share": round(float(decided.mean()), 6) if len(df_data) else None,
+            "agreement": round(float(same.mean()), 6) if len(df_data) else None,
+            "decided_agreement": round(float(same[decided].mean()), 6) if decided.any() else None,
+            "decided": dict(zip(get_stage_names(cascade), decided_per_stage))}
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 3:
+        print("- Error: Expects the model and the X values, e.g. "
+              "'python scripts/cascade.py model/random_forest_model.pkl data/KDDTrain+.txt [data/KDDTest+.txt]'.")
+        sys.exit(1)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import predict
+    from preprocessing import read_data_to_df
+
+    model_path = sys.argv[1]
+    model = ("RF", model_path)
+    loaded_model = predict.load_model(model)
+    schema = predict.load_model_schema(model, loaded_model)
+
+    cascade, evaluations = None, []
+    for name, path_to_file in zip(["fit data", "validation data"], sys.argv[2:4]):
+        df_data = read_data_to_df(path_to_file)
+        if df_data is None:
+            sys.exit(1)
+        model_predictions, model_probabilities = predict.predict_data_proba(model, loaded_model, df_data.copy(), schema)
+        if cascade is None:
+            cascade = fit_cascade(df_data, model_predictions, model_probabilities)
+            cascade["model_hash"] = get_file_hash(model_path)
+        evaluations.append((name, evaluate_cascade(cascade, df_data, model_predictions)))
+
+    print(f"- {len(cascade['baseline_stages'])} baseline stages, {len(cascade['rules'])} learned rules")
+    for name, evaluation in evaluations:
+        decided_agreement = f"{evaluation['decided_agreement']:.2%}" if evaluation["decided_agreement"] is not None else "-"
+        print(f"- {name}: {evaluation['rows']} rows, {evaluation['short_circuit_share']:.1%} decided by rules, "
+              f"agreement with the model {evaluation['agreement']:.2%} (of the decided rows: {decided_agreement})")
+        cascade[name.replace(" ", "_")] = evaluation
+
+    with open(get_cascade_path(model_path), "w", encoding="utf-8") as f:
+        json.dump(cascade, f, indent=4)
+    print(f"- Cascade rules written to {get_cascade_path(model_path)}")
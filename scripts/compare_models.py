@@ -0,0 +1,229 @@
+############################################################################
+### compare all models of MODELS on the same input                      ###
+############################################################################
+
+# run from the project folder:
+# python scripts/compare_models.py path_to_X_values [path_to_y_values] [options]
+# e.g.  python scripts/compare_models.py data/KDDTest+.txt data/KDDTest+.txt --workers 4 --output-dir comparison
+#
+# The input is read once (the columns of all models) and preprocessed once per feature schema,
+# then every model of MODELS in predict.py predicts it (models from pickle files with every engine).
+# Prints a table with rows/sec of the prediction, the latency of single (preprocessed) rows and,
+# with the y values, accuracy, precision, recall, F1 score and false positive rate of each model.
+#
+# options:
+#   --workers N         predict with N models at the same time (threads, the DFs are shared, not copied).
+#                       The times of parallel models include the contention for the cores.
+#   --output-dir DIR    write the predictions of each model to DIR/prediction_<model>.txt
+#   --results-file F    write the table as JSON
+#   --latency-rows N    nr of single rows predicted one after another to measure the latency (default 200)
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from model_evaluation import get_confusion_counts, get_evaluation_metrics
+from preprocessing import get_input_columns, preprocessing_categories, read_data_to_df, read_labels, recode_binary_target
+
+# ---------------------------------------- variables ----------------------------------------
+
+COMPARE_OPTIONS = {
+    "--workers": 1,
+    "--output-dir": "",
+    "--results-file": "",
+    "--latency-rows": 200,
+    }
+
+# ------------------------------------ compare functions ------------------------------------
+
+def load_models(models=predict.MODELS) -> list:
+    """
+    Load all models of MODELS, models from pickle files once per engine (if it can be used: "numpy" needs a
+    compiled random forest). Returns a list of dicts with the name (e.g. "RF --engine numpy"), the model tuple,
+    the loaded model and its feature schema.
+    """
+    entries = []
+    for name, model in models.items():
+        if name.startswith("BM"):
+            entries.append({"name": name, "model": (name, model), "loaded_model": model, "schema": None})
+            continue
+
+        model = (name, os.path.join(PROJECT_DIR, model)) # paths in MODELS are relative to the project folder
+        if not os.path.exists(model[1]):
+            print(f"- Note: {name} is skipped, its model file {model[1]} does not exist.")
+            continue
+        for engine in predict.ENGINES:
+            loaded_model = predict.load_model(model, engine)
+            if engine != "sklearn" and not predict.is_compiled_model(loaded_model):
+                continue
+            entries.append({"name": name if engine == "sklearn" else f"{name} --engine {engine}", "model": model,
+                            "loaded_model": loaded_model, "schema": predict.load_model_schema(model, loaded_model)})
+    return entries
+
+
+def get_compare_columns(entries:list) -> list | None:
+    # raw columns needed by any of the models, None (all columns) if the columns of a model are unknown
+    columns = []
+    for entry in entries:
+        model_columns = predict.get_model_input_columns(entry["model"], entry["loaded_model"])
+        if model_columns is None:
+            return
+        columns += [column for column in model_columns if column not in columns]
+    return get_input_columns(columns)
+
+
+def prepare_inputs(df_data, entries:list):
+    """
+    Add the input DF to every entry: baseline models predict from the raw data, the other models
+    from the preprocessed data. The preprocessing is done once for each feature schema (on a copy of
+    the raw data), models with the same schema (e.g. the engines of a model) share the DF.
+    """
+    preprocessed = {}
+    for entry in entries:
+        if entry["name"].startswith("BM"):
+            entry["df"], entry["features"] = df_data, None
+            continue
+
+        schema_key = json.dumps(entry["schema"], sort_keys=True, default=str)
+        if schema_key not in preprocessed:
+            df_model = df_data.copy()
+            preprocessed[schema_key] = (df_model, preprocessing_categories(df_model, entry["schema"]))
+        entry["df"], entry["features"] = preprocessed[schema_key]
+
+
+def predict_entry(entry:dict, df) -> tuple:
+    # predictions and probabilities for class 1 (for baseline models the predictions) of a prepared entry
+    if entry["features"] is None:
+        predictions = np.asarray(entry["loaded_model"](df)).astype(int)
+        return predictions, predictions.astype(float)
+    return predict.predict_features(entry["loaded_model"], df, entry["features"])
+
+
+def run_model(entry:dict, nr_latency_rows:int) -> dict:
+    """
+    Predict all rows of the entry at once (rows/sec) and nr_latency_rows single rows one after another
+    (latency in ms). Returns the predictions, probabilities and times.
+    """
+    start = time.perf_counter()
+    predictions, probabilities = predict_entry(entry, entry["df"])
+    seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(min(nr_latency_rows, len(entry["df"]))):
+        df_row = entry["df"].iloc[[i]]
+        start = time.perf_counter()
+        predict_entry(entry, df_row)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {"model": entry["name"], "predictions": np.asarray(predictions), "probabilities": np.asarray(probabilities),
+            "seconds": seconds, "rows_per_second": len(entry["df"]) / seconds if seconds else None,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if latencies else None,
+            "latency_p99_ms": float(np.percentile(latencies, 99)) if latencies else None}
+
+
+def evaluate_result(result:dict, y_true:np.ndarray):
+    # add the confusion counts, accuracy, precision, recall, F1 score and false positive rate to a result of run_model()
+    counts = get_confusion_counts(y_true, result["predictions"])
+    result.update(get_evaluation_metrics(counts.flatten().tolist()))
+    negatives = counts[0].sum()
+    result["false_positive_rate"] = float(counts[0, 1] / negatives) if negatives else 0.0
+    result["counts"] = counts.tolist()
+
+
+def read_true_labels(path_to_file:str, nr_rows:int) -> np.ndarray | None:
+    # binary labels of the y values (see read_labels), None if they cannot be read or do not match the nr of rows
+    label_reader = read_labels(path_to_file)
+    if label_reader is None:
+        return
+    with label_reader:
+        labels = label_reader.read()["attack_type"]
+    if len(labels) != nr_rows:
+        print(f"- Error: Got {len(labels)} y values for {nr_rows} rows.")
+        return
+    return recode_binary_target(labels)
+
+
+def print_comparison(results:list, evaluated:bool):
+    header = f"{'model':<22}{'rows/sec':>14}{'seconds':>10}{'p50 ms':>9}{'p99 ms':>9}"
+    if evaluated:
+        header += f"{'accuracy':>10}{'precision':>11}{'recall':>9}{'F1':>9}{'FPR':>9}"
+    print("\n" + header)
+    for result in results:
+        line = (f"{result['model']:<22}{result['rows_per_second'] or 0:>14,.0f}{result['seconds']:>10.3f}"
+                f"{result['latency_p50_ms'] or 0:>9.3f}{result['latency_p99_ms'] or 0:>9.3f}")
+        if evaluated:
+            line += "".join(f"{result[metric]:>{width}.2%}" for metric, width in
+                            [("accuracy", 10), ("precision", 11), ("recall", 9), ("f1_score", 9), ("false_positive_rate", 9)])
+        print(line)
+
+
+def write_model_predictions(results:list, output_dir:str):
+    # one file per model in the format of prediction.txt
+    os.makedirs(output_dir, exist_ok=True)
+    for result in results:
+        file_name = "prediction_" + result["model"].replace(" --engine ", "_") + ".txt"
+        predict.write_prediction_output(os.path.join(output_dir, file_name), result["predictions"])
+    print(f"- Predictions of each model written to {output_dir}")
+
+
+def compare_models(x_path:str, y_path="", workers=1, nr_latency_rows=200) -> list | None:
+    # run the whole comparison (see header), returns the results of all models or None if the input cannot be read
+    entries = load_models()
+
+    start = time.perf_counter()
+    df_data = read_data_to_df(x_path, get_compare_columns(entries))
+    if df_data is None:
+        return
+    read_seconds = time.perf_counter() - start
+
+    y_true = None
+    if y_path:
+        y_true = read_true_labels(y_path, len(df_data))
+        if y_true is None:
+            return
+
+    start = time.perf_counter()
+    prepare_inputs(df_data, entries)
+    print(f"- Read {len(df_data)} rows once in {read_seconds:.3f} sec, preprocessed in {time.perf_counter() - start:.3f} sec, "
+          f"predicting with {len(entries)} models ({workers} at a time) ...")
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = list(executor.map(lambda entry: run_model(entry, nr_latency_rows), entries))
+    if y_true is not None:
+        for result in results:
+            evaluate_result(result, y_true)
+
+    print_comparison(results, y_true is not None)
+    return results
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, COMPARE_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) not in [2, 3]:
+        print("- Error: Expects the X values and optionally the y values, "
+              "e.g. 'python scripts/compare_models.py data/KDDTest+.txt data/KDDTest+.txt'.")
+        sys.exit(1)
+
+    results = compare_models(arguments[1], arguments[2] if len(arguments) == 3 else "",
+                             options["--workers"], options["--latency-rows"])
+    if results is None:
+        sys.exit(1)
+
+    if options["--output-dir"]:
+        write_model_predictions(results, options["--output-dir"])
+    if options["--results-file"]:
+        with open(options["--results-file"], "w", encoding="utf-8") as f:
+            json.dump([{key: value for key, value in result.items() if key not in ["predictions", "probabilities"]}
+                       for result in results], f, indent=4)
+        print(f"- Results written to {options['--results-file']}")
@@ -0,0 +1,408 @@
+############################################################################
+### compress the random forest under a max. drop of recall and F1       ###
+############################################################################
+
+# run from the project folder:
+# python scripts/compress_model.py path_to_X_values path_to_y_values [options]
+# e.g.  python scripts/compress_model.py data/KDDTest+.txt data/KDDTest+.txt --max-f1-drop 0.002
+#
+# The forest of model/random_forest_model.pkl was picked for accuracy only. This builds smaller versions of it
+# and keeps the one that predicts fastest within the allowed drop of recall and F1 score on the validation data
+# (X and y values as in mode 2 of predict.py):
+# - depth capping: the nodes at depth --depths become leaves (with the class probabilities of their training rows)
+# - pruning: a subtree becomes a leaf if the probabilities of all its leaves differ by at most --tolerances
+#   from the probabilities of its root. Tolerance 0 only removes subtrees that cannot change a prediction.
+# - tree selection: the trees are ordered greedily by the F1 score of the forest of the first trees,
+#   the first 1, --tree-step, 2 * --tree-step, ... trees are the candidates
+# The validation rows are split: the trees are ordered on one part (--selection-share), all candidates are scored on
+# the other part. Prints the frontier (candidates with a better F1 score than every candidate with fewer nodes per row)
+# with nr of trees, nodes, size and measured µs per row (--engine), and saves the candidate with the fewest nodes
+# per row whose recall and F1 score are at most --max-recall-drop / --max-f1-drop below the whole forest
+# to --output (default: the model 'RF_compressed' of MODELS in predict.py), with its feature schema,
+# compiled model (--engine numpy) and the frontier (<output>_compression.json).
+#
+# options:
+#   --model FILE            pickled forest pipeline (default model/random_forest_model.pkl)
+#   --output FILE           compressed model (default model/random_forest_model_compressed.pkl)
+#   --max-recall-drop D     max. drop of the recall of attacks (default 0.005)
+#   --max-f1-drop D         max. drop of the F1 score of attacks (default 0.005)
+#   --depths D1,D2,..       max. depths tried besides the depth of the forest (default 4,5,6,8,10,12,15,20)
+#   --tolerances T1,T2,..   pruning tolerances of the probabilities (default 0,0.01,0.05)
+#   --tree-step N           nr of trees between two candidates (default 5)
+#   --selection-share S     share of the validation rows used to order the trees (default 0.5)
+#   --engine E              engine of the measured µs per row, sklearn or numpy (default numpy)
+
+import copy
+import json
+import os
+import pickle
+import sys
+import time
+import numpy as np
+from sklearn.tree._tree import Tree
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from model_evaluation import get_evaluation_metrics
+from preprocessing import get_recoding_path, get_schema_path, preprocessing_categories, read_data_to_df, read_labels, \
+    recode_binary_target, save_feature_schema, save_recoding_statistics
+from tree_engine import compile_pipeline, encode_categories, get_compiled_model_path, get_node_probabilities, \
+    predict_proba_compiled, save_compiled_model
+
+# ---------------------------------------- variables ----------------------------------------
+
+COMPRESS_OPTIONS = {
+    "--model": predict.MODELS["RF"],
+    "--output": predict.MODELS["RF_compressed"],
+    "--max-recall-drop": 0.005,
+    "--max-f1-drop": 0.005,
+    "--depths": "4,5,6,8,10,12,15,20",
+    "--tolerances": "0,0.01,0.05",
+    "--tree-step": 5,
+    "--selection-share": 0.5,
+    "--engine": "numpy",
+    }
+MAX_VALIDATION_ROWS = 100_000   # rows of the validation data used (sample), limits the memory of the trees x rows matrices
+MAX_GREEDY_TREES = 200          # trees ordered greedily, the others follow in their order in the forest
+LATENCY_REPEATS = 3             # the µs per row of a frontier candidate is the best of these runs
+RSEED = 42
+
+# ------------------------------------ tree functions ------------------------------------
+
+def get_node_levels(tree) -> tuple:
+    # depth and parent of every node, and the nodes of every depth (from the root)
+    depth = np.zeros(tree.node_count, dtype=np.intp)
+    parent = np.full(tree.node_count, -1, dtype=np.intp)
+    levels = [np.array([0], dtype=np.intp)]
+    while True:
+        nodes = levels[-1][tree.children_left[levels[-1]] >= 0]
+        if not len(nodes):
+            break
+        children = np.concatenate([tree.children_left[nodes], tree.children_right[nodes]])
+        depth[children] = len(levels)
+        parent[children] = np.concatenate([nodes, nodes])
+        levels.append(children)
+    return depth, parent, levels
+
+
+def get_tree_info(estimator) -> dict:
+    """
+    Return the arrays of a tree that every compression of it needs (see get_node_levels), the class probabilities
+    of its nodes and the spread of every subtree: the max. difference between the probabilities of a leaf
+    in the subtree and of its root.
+    """
+    tree = estimator.tree_
+    depth, parent, levels = get_node_levels(tree)
+    probabilities = get_node_probabilities(tree)
+    is_leaf = tree.children_left < 0
+    low, high = probabilities.copy(), probabilities.copy()
+    for nodes in reversed(levels):
+        nodes = nodes[~is_leaf[nodes]]
+        left, right = tree.children_left[nodes], tree.children_right[nodes]
+        low[nodes] = np.minimum(low[left], low[right])
+        high[nodes] = np.maximum(high[left], high[right])
+    spread = np.maximum(high - probabilities, probabilities - low).max(axis=1)
+    return {"depth": depth, "parent": parent, "levels": levels, "probabilities": probabilities, "is_leaf": is_leaf,
+            "spread": spread}
+
+
+def get_effective_nodes(info:dict, max_depth=None, tolerance=None) -> np.ndarray:
+    """
+    Return for every node of the tree the node whose prediction it gets in the compressed tree:
+    the node itself, or the node above it that became a leaf by the depth cap or the pruning (tolerance).
+    Applied to the leaf of a row in the original tree, this gives its leaf in the compressed tree.
+    """
+    collapsed = ~info["is_leaf"]
+    collapsed &= ((info["depth"] >= max_depth) if max_depth is not None else False) | \
+                 ((info["spread"] <= tolerance) if tolerance is not None else False)
+    effective = np.arange(len(collapsed))
+    for nodes in info["levels"][1:]:
+        parents = info["parent"][nodes]
+        above = effective[parents]
+        effective[nodes] = np.where((above != parents) | collapsed[above], above, nodes)
+    return effective
+
+
+def build_tree(estimator, effective:np.ndarray):
+    """
+    Return a copy of the fitted tree (DecisionTreeClassifier) with only the nodes that are their own
+    effective node (see get_effective_nodes), the others are removed and their parents become leaves
+    with the class values of their training rows. The nodes keep their order.
+    """
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    kept = np.flatnonzero(effective == np.arange(len(effective)))
+    new_index = np.full(tree.node_count, -1, dtype=np.intp)
+    new_index[kept] = np.arange(len(kept))
+
+    nodes = state["nodes"][kept].copy()
+    left = tree.children_left[kept]
+    is_leaf = (left < 0) | (new_index[np.maximum(left, 0)] < 0)
+    nodes["left_child"] = np.where(is_leaf, -1, new_index[np.maximum(left, 0)])
+    nodes["right_child"] = np.where(is_leaf, -1, new_index[np.maximum(tree.children_right[kept], 0)])
+    nodes["feature"] = np.where(is_leaf, -2, nodes["feature"])
+    nodes["threshold"] = np.where(is_leaf, -2.0, nodes["threshold"])
+
+    depth, _, _ = get_node_levels(tree)
+    compressed = Tree(tree.n_features, np.asarray(tree.n_classes, dtype=np.intp), tree.n_outputs)
+    compressed.__setstate__({"max_depth": int(depth[kept].max()), "node_count": len(kept), "nodes": nodes,
+                             "values": np.ascontiguousarray(state["values"][kept])})
+    new_estimator = copy.copy(estimator)
+    new_estimator.tree_ = compressed
+    return new_estimator
+
+
+def build_pipeline(pipeline, infos:list, candidate:dict):
+    # pipeline of the candidate: the encoder of the pipeline and a forest of the compressed selected trees
+    forest = pipeline.steps[-1][1]
+    estimators = [build_tree(forest.estimators_[i], get_effective_nodes(infos[i], candidate["max_depth"], candidate["tolerance"]))
+                  for i in candidate["trees"]]
+    compressed = copy.copy(forest)
+    compressed.estimators_ = estimators
+    compressed.n_estimators = len(estimators)
+    return type(pipeline)(pipeline.steps[:-1] + [(pipeline.steps[-1][0], compressed)])
+
+# ------------------------------------ search functions ------------------------------------
+
+def get_tree_votes(infos:list, leaves:np.ndarray, max_depth=None, tolerance=None) -> tuple:
+    """
+    Return the probability of class 1 of every compressed tree for every row (trees x rows)
+    and the mean nr of nodes a row passes in each compressed tree (its depth), with the nr of nodes of each tree.
+    leaves: leaf of every row in the original trees (trees x rows).
+    """
+    votes = np.empty(leaves.shape)
+    node_visits, nr_nodes = np.empty(len(infos)), np.empty(len(infos), dtype=np.int64)
+    for i, info in enumerate(infos):
+        effective = get_effective_nodes(info, max_depth, tolerance)
+        row_nodes = effective[leaves[i]]
+        votes[i] = info["probabilities"][row_nodes, 1]
+        node_visits[i] = info["depth"][row_nodes].mean() if leaves.shape[1] else 0.0
+        nr_nodes[i] = (effective == np.arange(len(effective))).sum()
+    return votes, node_visits, nr_nodes
+
+
+def get_scores(sums:np.ndarray, nr_trees:int, y:np.ndarray) -> tuple:
+    # recall and F1 score of attacks for the sums of the class 1 probabilities (one row per candidate, or a vector)
+    predicted = sums * 2 > nr_trees # class 1 if its mean probability is higher than of class 0
+    true_positives = (predicted & y).sum(axis=-1)
+    false_positives = (predicted & ~y).sum(axis=-1)
+    false_negatives = y.sum() - true_positives
+    recall = true_positives / max(y.sum(), 1)
+    f1 = 2 * true_positives / np.maximum(2 * true_positives + false_positives + false_negatives, 1)
+    return recall, f1
+
+
+def order_trees(votes:np.ndarray, y:np.ndarray, max_greedy=MAX_GREEDY_TREES) -> list:
+    """
+    Order the trees greedily: the next tree is the one with the highest F1 score of the forest of the trees
+    before it and itself, with the lowest squared error of the probabilities if several are equally good.
+    """
+    remaining = list(range(len(votes)))
+    order = []
+    sums = np.zeros(votes.shape[1])
+    for nr_trees in range(1, min(len(votes), max_greedy) + 1):
+        candidate_sums = sums + votes[remaining]
+        _, f1 = get_scores(candidate_sums, nr_trees, y)
+        errors = ((candidate_sums / nr_trees - y) ** 2).mean(axis=1)
+        best = remaining[np.lexsort((errors, -f1))[0]]
+        order.append(best)
+        remaining.remove(best)
+        sums += votes[best]
+    return order + remaining
+
+
+def find_candidates(infos:list, leaves:np.ndarray, y:np.ndarray, selection:np.ndarray, depths:list,
+                    tolerances:list, tree_step:int) -> list:
+    """
+    Score every combination of max. depth, pruning tolerance and nr of trees on the rows that are not in selection
+    (the trees are ordered for each max. depth on the rows of selection, see order_trees).
+    Returns a dict per candidate with its trees, recall, F1 score, mean nodes a row passes and nr of nodes.
+    """
+    evaluation = ~selection
+    candidates = []
+    for max_depth in depths:
+        votes, _, _ = get_tree_votes(infos, leaves[:, selection], max_depth, 0.0)
+        order = order_trees(votes, y[selection])
+        for tolerance in tolerances:
+            votes, node_visits, nr_nodes = get_tree_votes(infos, leaves[:, evaluation], max_depth, tolerance)
+            sums = np.zeros(evaluation.sum())
+            for nr_trees, tree in enumerate(order, 1):
+                sums += votes[tree]
+                if nr_trees == 1 or nr_trees % tree_step == 0 or nr_trees == len(order):
+                    recall, f1 = get_scores(sums, nr_trees, y[evaluation])
+                    candidates.append({"max_depth": max_depth, "tolerance": tolerance, "trees": order[:nr_trees],
+                                       "recall": float(recall), "f1_score": float(f1),
+                                       "node_visits": float(node_visits[order[:nr_trees]].sum()),
+                                       "nodes": int(nr_nodes[order[:nr_trees]].sum())})
+    return candidates
+
+
+def get_frontier(candidates:list) -> list:
+    # candidates with a higher F1 score than all candidates with fewer nodes per row (fewer nodes if equal)
+    frontier = []
+    for candidate in sorted(candidates, key=lambda c: (c["node_visits"], c["nodes"], -c["f1_score"])):
+        if not frontier or candidate["f1_score"] > frontier[-1]["f1_score"]:
+            frontier.append(candidate)
+    return frontier
+
+
+def is_within_drop(candidate:dict, reference:dict, max_recall_drop:float, max_f1_drop:float) -> bool:
+    return (candidate["recall"] >= reference["recall"] - max_recall_drop
+            and candidate["f1_score"] >= reference["f1_score"] - max_f1_drop)
+
+
+def choose_candidate(candidates:list, reference:dict, max_recall_drop:float, max_f1_drop:float) -> dict | None:
+    # candidate with the fewest nodes per row within the allowed drop of recall and F1 score, None if there is none
+    allowed = [c for c in candidates if is_within_drop(c, reference, max_recall_drop, max_f1_drop)]
+    return min(allowed, key=lambda c: (c["node_visits"], c["nodes"], len(c["trees"])), default=None)
+
+# ------------------------------------ measure functions ------------------------------------
+
+def evaluate_pipeline(pipeline, df_X, y:np.ndarray, engine:str) -> dict:
+    """
+    Predict df_X (features of the model) with the pipeline and return recall and F1 score of attacks,
+    the best µs per row of LATENCY_REPEATS runs with the engine, and the size of the pickled and compiled model.
+    """
+    compiled = compile_pipeline(pipeline)
+    if engine == "numpy" and compiled is not None:
+        codes = encode_categories(compiled, df_X)
+        predict_function = lambda: predict_proba_compiled(compiled, codes)
+    else:
+        encoded_X = pipeline[:-1].transform(df_X)
+        predict_function = lambda: pipeline.steps[-1][1].predict_proba(encoded_X)
+
+    seconds = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        probabilities = predict_function()
+        seconds.append(time.perf_counter() - start)
+    predicted = np.argmax(probabilities, axis=1) == 1
+    counts = [int((~predicted & ~y).sum()), int((predicted & ~y).sum()), int((~predicted & y).sum()), int((predicted & y).sum())]
+    metrics = get_evaluation_metrics(counts)
+    return {"recall": metrics["recall"], "f1_score": metrics["f1_score"],
+            "us_per_row": min(seconds) / max(len(df_X), 1) * 1e6, "pickle_kb": len(pickle.dumps(pipeline)) / 1024,
+            "compiled_kb": sum(v.nbytes for v in compiled.values() if isinstance(v, np.ndarray)) / 1024 if compiled else None}
+
+
+def print_frontier(rows:list):
+    print(f"\n{'trees':>6}{'max depth':>10}{'tolerance':>10}{'nodes':>8}{'nodes/row':>10}{'pickle KB':>10}"
+          f"{'µs/row':>9}{'recall':>9}{'F1':>9}  ")
+    for row in rows:
+        print(f"{len(row['trees']):>6}{row['max_depth'] if row['max_depth'] is not None else '-':>10}"
+              f"{row['tolerance'] if row['tolerance'] is not None else '-':>10}{row['nodes']:>8}{row['node_visits']:>10.1f}"
+              f"{row['pickle_kb']:>10.1f}{row['us_per_row']:>9.2f}{row['recall']:>9.4f}{row['f1_score']:>9.4f}  {row.get('note', '')}")
+
+
+def save_compressed_model(pipeline, schema:dict, output_path:str, log:dict):
+    # pickled pipeline (as loaded by predict.py), its feature schema (and recoding statistics), compiled model and the log of the compression
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "wb") as f:
+        pickle.dump(pipeline, f)
+    save_feature_schema({key: value for key, value in schema.items() if key != "recoding"}, get_schema_path(output_path))
+    if "recoding" in schema:
+        save_recoding_statistics(schema["recoding"], get_recoding_path(output_path))
+    elif os.path.exists(get_recoding_path(output_path)):
+        os.remove(get_recoding_path(output_path))
+    compiled = compile_pipeline(pipeline)
+    if compiled is not None:
+        save_compiled_model(compiled, get_compiled_model_path(output_path))
+    with open(os.path.splitext(output_path)[0] + "_compression.json", "w", encoding="utf-8") as f:
+        json.dump(log, f, indent=4)
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, COMPRESS_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) != 3:
+        print("- Error: Expects the X and y values of the validation data, e.g. "
+              "'python scripts/compress_model.py data/KDDTest+.txt data/KDDTest+.txt'.")
+        sys.exit(1)
+    if options["--engine"] not in predict.ENGINES:
+        print(f"- Error: Unknown engine {options['--engine']}. Expects one of {predict.ENGINES}.")
+        sys.exit(1)
+
+    model = ("RF", options["--model"])
+    pipeline = predict.load_model(model)
+    if not hasattr(pipeline, "steps") or not hasattr(pipeline.steps[-1][1], "estimators_") \
+            or len(pipeline.steps[-1][1].classes_) != 2:
+        print(f"- Error: {options['--model']} is not a pipeline with a random forest of 2 classes.")
+        sys.exit(1)
+    schema = predict.load_model_schema(model, pipeline)
+
+    df_data = read_data_to_df(arguments[1], predict.get_model_input_columns(model, pipeline))
+    label_reader = read_labels(arguments[2])
+    if df_data is None or label_reader is None:
+        sys.exit(1)
+    y = np.asarray(recode_binary_target(label_reader.read()["attack_type"])) == 1
+    if len(y) != len(df_data):
+        print(f"- Error: {len(df_data)} rows of X values, but {len(y)} y values.")
+        sys.exit(1)
+    if len(y) > MAX_VALIDATION_ROWS:
+        rows = np.sort(np.random.default_rng(RSEED).choice(len(y), MAX_VALIDATION_ROWS, replace=False))
+        df_data, y = df_data.iloc[rows].reset_index(drop=True), y[rows]
+
+    categorial_features = preprocessing_categories(df_data, schema)
+    df_X = predict.select_model_features(pipeline, df_data, categorial_features)
+    encoded_X = predict.encode_model_input(pipeline, df_X)
+    forest = pipeline.steps[-1][1]
+    encoded_X = encoded_X.tocsr().astype(np.float32) if hasattr(encoded_X, "tocsr") else np.asarray(encoded_X, dtype=np.float32)
+    leaves = np.array([estimator.apply(encoded_X, check_input=False) for estimator in forest.estimators_], dtype=np.int32)
+    infos = [get_tree_info(estimator) for estimator in forest.estimators_]
+
+    selection = np.zeros(len(y), dtype=bool)
+    selection[np.random.default_rng(RSEED).permutation(len(y))[:round(len(y) * options["--selection-share"])]] = True
+    forest_depth = max(info["depth"].max() for info in infos)
+    depths = [None] + sorted({int(d) for d in options["--depths"].split(",") if int(d) < forest_depth}, reverse=True)
+    tolerances = [None] + [float(t) for t in options["--tolerances"].split(",")]
+    print(f"- {len(forest.estimators_)} trees (max. depth {forest_depth}, {sum(len(info['depth']) for info in infos)} nodes), "
+          f"{selection.sum()} rows to order the trees, {(~selection).sum()} rows to score the candidates ({y.mean():.1%} attacks)")
+
+    candidates = find_candidates(infos, leaves, y, selection, depths, tolerances, options["--tree-step"])
+    df_evaluation = df_X.iloc[np.flatnonzero(~selection)]
+    full_forest = {"max_depth": None, "tolerance": None, "trees": list(range(len(forest.estimators_))),
+                   "nodes": int(sum(len(info["depth"]) for info in infos)), "note": "whole forest"}
+    full_forest["node_visits"] = float(sum(info["depth"][leaf].mean() for info, leaf in zip(infos, leaves[:, ~selection])))
+    full_forest.update(evaluate_pipeline(pipeline, df_evaluation, y[~selection], options["--engine"]))
+    # the candidates are scored with the summed votes of their trees, the saved one is checked with its predictions
+    drops = (options["--max-recall-drop"], options["--max-f1-drop"])
+    chosen = choose_candidate(candidates, full_forest, *drops)
+    while chosen is not None:
+        chosen.update(evaluate_pipeline(build_pipeline(pipeline, infos, chosen), df_evaluation, y[~selection], options["--engine"]))
+        if is_within_drop(chosen, full_forest, *drops):
+            break
+        candidates.remove(chosen)
+        chosen = choose_candidate(candidates, full_forest, *drops)
+
+    frontier = [c for c in get_frontier(candidates) # without the candidate of the whole forest (shown below)
+                if not (c["max_depth"] is None and c["tolerance"] is None and len(c["trees"]) == len(forest.estimators_))]
+    if chosen is not None and chosen not in frontier:
+        frontier = sorted(frontier + [chosen], key=lambda c: c["node_visits"])
+    for candidate in frontier:
+        if "us_per_row" not in candidate:
+            candidate.update(evaluate_pipeline(build_pipeline(pipeline, infos, candidate), df_evaluation, y[~selection],
+                                               options["--engine"]))
+        if candidate is chosen:
+            candidate["note"] = "<-- saved"
+    print(f"- {len(candidates)} candidates, frontier of F1 score vs. nodes per row (µs/row with --engine {options['--engine']}):")
+    print_frontier(frontier + [full_forest])
+
+    if chosen is None:
+        print(f"- Error: No candidate within the allowed drop (recall {options['--max-recall-drop']}, F1 {options['--max-f1-drop']}).")
+        sys.exit(1)
+    log = {"source_model": options["--model"], "validation_X": arguments[1], "validation_y": arguments[2],
+           "validation_rows": len(y), "selection_rows": int(selection.sum()),
+           "max_recall_drop": options["--max-recall-drop"], "max_f1_drop": options["--max-f1-drop"],
+           "whole_forest": full_forest, "chosen": chosen, "frontier": frontier}
+    save_compressed_model(build_pipeline(pipeline, infos, chosen), schema, options["--output"], log)
+    print(f"- {len(chosen['trees'])} of {len(forest.estimators_)} trees, {chosen['nodes']} of {full_forest['nodes']} nodes, "
+          f"{chosen['node_visits'] / full_forest['node_visits']:.1%} of the nodes per row, "
+          f"{chosen['us_per_row'] / full_forest['us_per_row']:.1%} of the time, recall {chosen['recall'] - full_forest['recall']:+.4f}, "
+          f"F1 {chosen['f1_score'] - full_forest['f1_score']:+.4f}")
+    print(f"- Saved the compressed model to {options['--output']}")
+    if os.path.abspath(options["--output"]) == os.path.abspath(predict.MODELS["RF_compressed"]):
+        print("  Predict with: python predict.py RF_compressed path_to_X_values [--engine numpy]")
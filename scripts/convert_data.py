@@ -0,0 +1,59 @@
+############################################################################
+### convert KDD text files to columnar formats that are read faster      ###
+############################################################################
+
+# run from the project folder:
+# python scripts/convert_data.py path_to_input output_path
+# e.g.  python scripts/convert_data.py data/KDDTest+.txt data/KDDTest+.arrow
+#
+# the format is chosen by the extension of output_path (see write_data() in preprocessing.py):
+#   .parquet            --> compressed, smallest file
+#   .arrow / .feather   --> Arrow IPC, memory-mapped when read (fastest)
+#   no extension        --> directory with one memory-mapped .npy file per column (no pyarrow needed)
+# the output can be used everywhere instead of the text file, e.g. python predict.py RF data/KDDTest+.arrow
+
+import os
+import sys
+import time
+
+from preprocessing import read_data_to_df, write_data, get_data_format
+
+# ------------------------------------ conversion functions ------------------------------------
+
+def get_size(path:str) -> int:
+    # size of a file or of all files in a directory in bytes
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def convert_data(input_path:str, output_path:str) -> bool:
+    """
+    Read the input (any format of read_data_to_df) and write it to output_path with write_data().
+    Returns True if the output was written.
+    """
+    start = time.perf_counter()
+    data_df = read_data_to_df(input_path)
+    if data_df is None:
+        return False
+    read_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if write_data(data_df, output_path) is None:
+        return False
+    write_seconds = time.perf_counter() - start
+
+    print(f"- Converted {len(data_df)} rows from '{input_path}' ({read_seconds:.2f} sec) "
+          f"to '{output_path}' ({get_data_format(output_path)}, {write_seconds:.2f} sec).")
+    print(f"- Size: {get_size(input_path) / 1024**2:.1f} MB --> {get_size(output_path) / 1024**2:.1f} MB")
+    return True
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 3:
+        print("- Error: Expects the input and the output path, e.g. 'python scripts/convert_data.py data/KDDTest+.txt data/KDDTest+.arrow'.")
+        sys.exit(1)
+
+    if not convert_data(sys.argv[1], sys.argv[2]):
+        sys.exit(1)
@@ -0,0 +1,152 @@
+############################################################################
+### content-addressed cache of encoded features (--feature-cache)        ###
+############################################################################
+
+# Reading, preprocessing and encoding the same input (e.g. KDDTest+.txt) again for every model or threshold
+# takes most of the time of a prediction. The encoded matrices are stored in a cache directory,
+# one entry (directory with .npy files) per key. The key is the hash of the content of the input file,
+# the preprocessing settings of preprocessing.py and a description of the encoder (e.g. the fitted
+# one-hot encoder of a model), so a changed file, feature list, recode threshold or model gets a new entry
+# and entries that do not fit any more are never used. The arrays are memory-mapped when loaded.
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+
+import preprocessing
+
+# ---------------------------------------- variables ----------------------------------------
+
+FEATURE_CACHE_VERSION = 1       # change when the files of an entry change
+FEATURE_CACHE_DIR = os.path.join(".cache", "features")  # default directory, relative to the project folder
+ENTRY_FILE = "entry.json"       # arrays and metadata of an entry
+OBJECTS_FILE = "objects.pkl"    # optional python objects of an entry (e.g. fitted encoders)
+CSR_ARRAYS = ["data", "indices", "indptr"] # files of a sparse matrix
+HASH_BLOCK_BYTES = 1024**2
+
+# ------------------------------------ key functions ------------------------------------
+
+def get_preprocessing_settings() -> dict:
+    """
+    Return the settings of preprocessing.py that change the features of a row: feature lists,
+    recode thresholds and categories, data types and the versions of the feature schema and recoding statistics.
+    """
+    return {"cache_version": FEATURE_CACHE_VERSION,
+            "schema_version": preprocessing.FEATURE_SCHEMA_VERSION,
+            "cat_features": preprocessing.CAT_FEATURES,
+            "num_features": preprocessing.NUM_FEATURES,
+            "binary_features": preprocessing.RECODE_NUM_TO_BINARY_CAT,
+            "binary_threshold": preprocessing.BINARY_FEATURE_THRESHOLD,
+            "binary_new_category": preprocessing.BINARY_FEATURE_NEW_CAT,
+            "three_cat_features": preprocessing.RECODE_NUM_TO_THREE_CAT,
+            "recoding_version": preprocessing.RECODING_VERSION,
+            "three_cat_quantile": preprocessing.THREE_CAT_QUANTILE,
+            "column_dtypes": {column: str(dtype) for column, dtype in preprocessing.COLUMN_DTYPES.items()}}
+
+
+def update_with_file(digest, path_to_file:str):
+    with open(path_to_file, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+
+
+def hash_input(path_to_file:str) -> str:
+    # SHA-256 of the content of an input file, or of all files of an input directory (.npy columns)
+    digest = hashlib.sha256()
+    if os.path.isdir(path_to_file):
+        for name in sorted(os.listdir(path_to_file)):
+            digest.update(name.encode())
+            update_with_file(digest, os.path.join(path_to_file, name))
+    else:
+        update_with_file(digest, path_to_file)
+    return digest.hexdigest()
+
+
+def get_feature_cache_key(path_to_file:str, encoder_parts:list) -> str:
+    """
+    Return the key of the encoded features of an input file: the hash of the content of the file,
+    the preprocessing settings (see get_preprocessing_settings) and the encoder_parts
+    (bytes or JSON serializable values that describe how the features are encoded, e.g. the pickled encoder).
+    """
+    digest = hashlib.sha256(hash_input(path_to_file).encode())
+    digest.update(json.dumps(get_preprocessing_settings(), sort_keys=True).encode())
+    for part in encoder_parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+# ------------------------------------ entry functions ------------------------------------
+
+def save_feature_entry(cache_dir:str, key:str, arrays:dict, metadata=None, objects=None) -> bool:
+    """
+    Save the arrays (dense NumPy arrays or sparse matrices, stored as CSR) with the metadata (JSON serializable)
+    and objects (pickled) as entry key in cache_dir. The entry is written to a temporary directory
+    and renamed at once, so an interrupted run does not leave a broken entry. Returns True if it was saved.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    temp_dir = entry_dir + f".tmp{os.getpid()}"
+    try:
+        os.makedirs(temp_dir, exist_ok=True)
+        stored = {}
+        for name, array in arrays.items():
+            if hasattr(array, "tocsr"): # sparse matrix of scipy
+                array = array.tocsr()
+                for part in CSR_ARRAYS:
+                    np.save(os.path.join(temp_dir, f"{name}.{part}.npy"), getattr(array, part))
+                stored[name] = {"format": "csr", "shape": list(array.shape)}
+            else:
+                np.save(os.path.join(temp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+                stored[name] = {"format": "dense", "shape": list(np.shape(array))}
+
+        if objects is not None:
+            with open(os.path.join(temp_dir, OBJECTS_FILE), "wb") as f:
+                pickle.dump(objects, f)
+        with open(os.path.join(temp_dir, ENTRY_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": FEATURE_CACHE_VERSION, "arrays": stored, "metadata": metadata}, f)
+
+        if os.path.isdir(entry_dir): # saved by another process in the meantime
+            shutil.rmtree(temp_dir)
+        else:
+            os.replace(temp_dir, entry_dir)
+    except OSError as error:
+        print(f"- Warning: Cannot save the features to the cache {cache_dir}: {error}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return False
+    return True
+
+
+def load_feature_entry(cache_dir:str, key:str) -> dict | None:
+    """
+    Load the entry key from cache_dir, returns None if it does not exist or has another version.
+    Returns a dict with the arrays (memory-mapped read-only, sparse matrices as CSR),
+    the metadata and the objects of save_feature_entry().
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isfile(os.path.join(entry_dir, ENTRY_FILE)):
+        return
+
+    try:
+        with open(os.path.join(entry_dir, ENTRY_FILE), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("version") != FEATURE_CACHE_VERSION:
+            return
+
+        arrays = {}
+        for name, stored in entry["arrays"].items():
+            if stored["format"] == "csr":
+                import scipy.sparse # only needed for sparse matrices, not for the compiled models (--engine numpy)
+                parts = [np.load(os.path.join(entry_dir, f"{name}.{part}.npy"), mmap_mode="r") for part in CSR_ARRAYS]
+                arrays[name] = scipy.sparse.csr_matrix(tuple(parts), shape=tuple(stored["shape"]), copy=False)
+            else:
+                arrays[name] = np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r")
+
+        objects = None
+        if os.path.isfile(os.path.join(entry_dir, OBJECTS_FILE)):
+            with open(os.path.join(entry_dir, OBJECTS_FILE), "rb") as f:
+                objects = pickle.load(f)
+    except (OSError, ValueError, KeyError, pickle.UnpicklingError) as error:
+        print(f"- Warning: Cannot read the cache entry {entry_dir} ({error}), the features are encoded again.")
+        return
+    return {"arrays": arrays, "metadata": entry["metadata"], "objects": objects}
@@ -0,0 +1,337 @@
+############################################################################
+### streaming extraction of the KDD features from connection records    ###
+############################################################################
+
+# run from the project folder:
+# python scripts/feature_extractor.py path_to_records|- output_path [--time-window 2.0] [--host-window 100]
+# e.g.  python scripts/feature_extractor.py capture_records.csv capture_kdd.txt
+#       python predict.py RF capture_kdd.txt
+#
+# Input: one connection record per line (csv without header, '-' reads stdin), in the order of RECORD_COLUMNS:
+#   timestamp (sec), duration (sec), protocol_type, src_host, src_port, dst_host, dst_port, service, flag, src_bytes, dst_bytes
+# e.g. 1700000000.25,0,tcp,10.0.0.5,40112,10.0.0.9,80,http,SF,215,45076
+#
+# Output: one row per connection in the layout of read_data_to_df() (42 columns, without attack_type),
+# with the traffic features of the KDD data set:
+# - time window:   the connections of the last 2 seconds (incl. the current one) to the same destination host
+#                  (count, serror_rate, rerror_rate, same_srv_rate, diff_srv_rate)
+#                  and to the same service (srv_count, srv_serror_rate, srv_rerror_rate, srv_diff_host_rate)
+# - host window:   one shared window of the last 100 connections (incl. the current one) to any host, not 100 per host.
+#                  Within it the connections to the same destination host are counted
+#                  (dst_host_count, dst_host_same_srv_rate, dst_host_diff_srv_rate, dst_host_same_src_port_rate,
+#                  dst_host_serror_rate, dst_host_rerror_rate) and to the same service (dst_host_srv_count,
+#                  dst_host_srv_diff_host_rate, dst_host_srv_serror_rate, dst_host_srv_rerror_rate),
+#                  so dst_host_count is at most 100 and usually much smaller with many hosts.
+# Rates are rounded to 2 decimals as in the KDD files. The content features (hot, logged_in, num_failed_logins, ...)
+# need the payload of the connections and are 0, land is computed from the hosts and ports.
+#
+# The windows are updated incrementally: the connections in a window are kept in a queue (the host window
+# is a ring buffer of the last 100), and counters per host, service and (host, service) are increased
+# when a connection enters a window and decreased when it leaves, so no window is scanned again.
+# Records must be ordered by timestamp (as written by a capture), older timestamps are treated as the latest one.
+
+import csv
+import os
+import sys
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+
+from preprocessing import COLUMN_DTYPES, COLUMN_NAMES, write_text_data
+
+# ---------------------------------------- variables ----------------------------------------
+
+RECORD_COLUMNS = ["timestamp", "duration", "protocol_type", "src_host", "src_port", "dst_host", "dst_port",
+                  "service", "flag", "src_bytes", "dst_bytes"]
+TIME_WINDOW = 2.0               # seconds of the time window
+HOST_WINDOW = 100               # nr of connections of the host window
+SYN_ERROR_FLAGS = {"S0", "S1", "S2", "S3"}  # connections with SYN errors (serror rates)
+REJ_ERROR_FLAGS = {"REJ"}       # rejected connections (rerror rates)
+RATE_DECIMALS = 2
+DIFFICULTY_LEVEL = 21           # the features of the model include difficulty_level, most frequent value of KDDTrain+
+BATCH_RECORDS = 100_000         # nr of records converted to a DF at once (see extract_batches)
+
+# columns of the output (read_data_to_df layout without attack_type) and the features computed here
+OUTPUT_COLUMNS = [column for column in COLUMN_NAMES if column != "attack_type"]
+TRAFFIC_FEATURES = ["count", "srv_count", "serror_rate", "srv_serror_rate", "rerror_rate", "srv_rerror_rate",
+                    "same_srv_rate", "diff_srv_rate", "srv_diff_host_rate",
+                    "dst_host_count", "dst_host_srv_count", "dst_host_same_srv_rate", "dst_host_diff_srv_rate",
+                    "dst_host_same_src_port_rate", "dst_host_srv_diff_host_rate", "dst_host_serror_rate",
+                    "dst_host_srv_serror_rate", "dst_host_rerror_rate", "dst_host_srv_rerror_rate"]
+# columns of a row returned by extract_rows(): the values of the record and the counts of its windows
+ROW_COLUMNS = ["duration", "protocol_type", "service", "flag", "src_bytes", "dst_bytes", "land",
+               "count", "srv_count", "host_serrors", "host_rerrors", "srv_serrors", "srv_rerrors", "same_srv",
+               "dst_host_count", "dst_host_srv_count", "dst_host_serrors", "dst_host_rerrors", "dst_host_srv_serrors",
+               "dst_host_srv_rerrors", "dst_host_same_srv", "dst_host_same_src_port"]
+# numpy record of a row: the categorical columns as python objects, the counts as int64
+ROW_DTYPE = np.dtype([(column, object if COLUMN_DTYPES.get(column) == "category" else np.int64) for column in ROW_COLUMNS])
+# rate features: (nr of connections, of the window) from the counts, rates of the other connections with 1 - rate
+RATE_FEATURES = {
+    "serror_rate": ("host_serrors", "count"),
+    "srv_serror_rate": ("srv_serrors", "srv_count"),
+    "rerror_rate": ("host_rerrors", "count"),
+    "srv_rerror_rate": ("srv_rerrors", "srv_count"),
+    "same_srv_rate": ("same_srv", "count"),
+    "dst_host_same_srv_rate": ("dst_host_same_srv", "dst_host_count"),
+    "dst_host_same_src_port_rate": ("dst_host_same_src_port", "dst_host_count"),
+    "dst_host_serror_rate": ("dst_host_serrors", "dst_host_count"),
+    "dst_host_srv_serror_rate": ("dst_host_srv_serrors", "dst_host_srv_count"),
+    "dst_host_rerror_rate": ("dst_host_rerrors", "dst_host_count"),
+    "dst_host_srv_rerror_rate": ("dst_host_srv_rerrors", "dst_host_srv_count"),
+    }
+OTHER_RATE_FEATURES = {
+    "diff_srv_rate": ("same_srv", "count"),                         # other services of the same host
+    "srv_diff_host_rate": ("same_srv", "srv_count"),                # other hosts of the same service
+    "dst_host_diff_srv_rate": ("dst_host_same_srv", "dst_host_count"),
+    "dst_host_srv_diff_host_rate": ("dst_host_same_srv", "dst_host_srv_count"),
+    }
+
+# ------------------------------------ extractor functions ------------------------------------
+
+def new_extractor_state(time_window=TIME_WINDOW, host_window=HOST_WINDOW) -> dict:
+    """
+    Create the state of the windows, which is updated by extract_rows().
+    Counters are lists [connections, SYN errors, REJ errors] per destination host and per service,
+    and nr of connections per (host, service) and (host, source port).
+    """
+    return {"time_window": time_window, "host_window": host_window, "last_timestamp": float("-inf"), "records": 0,
+            # time window: queue of (timestamp, host, service, host counter, service counter, host_service, error flags)
+            "time_queue": deque(), "time_host": {}, "time_service": {}, "time_host_service": {},
+            # host window: ring buffer of the last host_window connections
+            "host_queue": deque(), "host_host": {}, "host_service": {}, "host_host_service": {}, "host_host_port": {}}
+
+
+def extract_rows(state:dict, records) -> list:
+    """
+    Return a row (values in ROW_COLUMNS) for every record (values in RECORD_COLUMNS, parsed,
+    see parse_record) and update the windows of state. A row only depends on the current
+    and previous records, so the records can be passed in batches of any size.
+    The rows have the counts of the windows, the rates are computed for all rows at once (see rows_to_df).
+    """
+    time_window, host_window = state["time_window"], state["host_window"]
+    last_timestamp = state["last_timestamp"]
+    time_queue, time_host, time_service, time_host_service = (state["time_queue"], state["time_host"],
+                                                              state["time_service"], state["time_host_service"])
+    host_queue, host_host, host_service, host_host_service, host_host_port = (state["host_queue"], state["host_host"],
+        state["host_service"], state["host_host_service"], state["host_host_port"])
+    syn_error_flags, rej_error_flags = SYN_ERROR_FLAGS, REJ_ERROR_FLAGS
+    rows = []
+    append = rows.append
+
+    for timestamp, duration, protocol_type, src_host, src_port, dst_host, dst_port, service, flag, src_bytes, dst_bytes in records:
+        if timestamp < last_timestamp:
+            timestamp = last_timestamp
+        last_timestamp = timestamp
+        serror = 1 if flag in syn_error_flags else 0
+        rerror = 1 if flag in rej_error_flags else 0
+        host_key = (dst_host, service)
+
+        # --- time window: remove connections older than time_window, add the current one
+        limit = timestamp - time_window
+        while time_queue and time_queue[0][0] <= limit:
+            _, old_host, old_service, old_host_counter, old_service_counter, old_host_key, old_serror, old_rerror = time_queue.popleft()
+            old_host_counter[0] -= 1
+            old_host_counter[1] -= old_serror
+            old_host_counter[2] -= old_rerror
+            if not old_host_counter[0]:
+                del time_host[old_host]
+            old_service_counter[0] -= 1
+            old_service_counter[1] -= old_serror
+            old_service_counter[2] -= old_rerror
+            if not old_service_counter[0]:
+                del time_service[old_service]
+            same = time_host_service[old_host_key] - 1
+            if same:
+                time_host_service[old_host_key] = same
+            else:
+                del time_host_service[old_host_key]
+
+        host_counter = time_host.get(dst_host)
+        if host_counter is None:
+            host_counter = time_host[dst_host] = [0, 0, 0]
+        host_counter[0] += 1
+        host_counter[1] += serror
+        host_counter[2] += rerror
+        service_counter = time_service.get(service)
+        if service_counter is None:
+            service_counter = time_service[service] = [0, 0, 0]
+        service_counter[0] += 1
+        service_counter[1] += serror
+        service_counter[2] += rerror
+        same_service = time_host_service.get(host_key, 0) + 1
+        time_host_service[host_key] = same_service
+        time_queue.append((timestamp, dst_host, service, host_counter, service_counter, host_key, serror, rerror))
+
+        # --- host window: remove the oldest connection if the window is full, add the current one
+        if len(host_queue) == host_window:
+            old_host, old_service, old_host_key, old_port_key, old_serror, old_rerror = host_queue.popleft()
+            old_counter = host_host[old_host]
+            old_counter[0] -= 1
+            old_counter[1] -= old_serror
+            old_counter[2] -= old_rerror
+            if not old_counter[0]:
+                del host_host[old_host]
+            old_counter = host_service[old_service]
+            old_counter[0] -= 1
+            old_counter[1] -= old_serror
+            old_counter[2] -= old_rerror
+            if not old_counter[0]:
+                del host_service[old_service]
+            same = host_host_service[old_host_key] - 1
+            if same:
+                host_host_service[old_host_key] = same
+            else:
+                del host_host_service[old_host_key]
+            same = host_host_port[old_port_key] - 1
+            if same:
+                host_host_port[old_port_key] = same
+            else:
+                del host_host_port[old_port_key]
+
+        port_key = (dst_host, src_port)
+        dst_counter = host_host.get(dst_host)
+        if dst_counter is None:
+            dst_counter = host_host[dst_host] = [0, 0, 0]
+        dst_counter[0] += 1
+        dst_counter[1] += serror
+        dst_counter[2] += rerror
+        dst_service_counter = host_service.get(service)
+        if dst_service_counter is None:
+            dst_service_counter = host_service[service] = [0, 0, 0]
+        dst_service_counter[0] += 1
+        dst_service_counter[1] += serror
+        dst_service_counter[2] += rerror
+        dst_same_service = host_host_service.get(host_key, 0) + 1
+        host_host_service[host_key] = dst_same_service
+        dst_same_port = host_host_port.get(port_key, 0) + 1
+        host_host_port[port_key] = dst_same_port
+        host_queue.append((dst_host, service, host_key, port_key, serror, rerror))
+
+        # --- counts of the current connection
+        append((duration, protocol_type, service, flag, src_bytes, dst_bytes,
+                1 if src_host == dst_host and src_port == dst_port else 0,
+                host_counter[0], service_counter[0], host_counter[1], host_counter[2], service_counter[1],
+                service_counter[2], same_service, dst_counter[0], dst_service_counter[0], dst_counter[1], dst_counter[2],
+                dst_service_counter[1], dst_service_counter[2], dst_same_service, dst_same_port))
+
+    state["last_timestamp"] = last_timestamp
+    state["records"] += len(rows)
+    return rows
+
+
+def get_rate(part:np.ndarray, total:np.ndarray) -> np.ndarray:
+    # share of the connections, rounded to RATE_DECIMALS (total is at least 1, the current connection)
+    return np.round(part / total, RATE_DECIMALS)
+
+
+def rows_to_df(rows:list) -> pd.DataFrame:
+    """
+    Return the rows of extract_rows() as DF in the layout of read_data_to_df() (OUTPUT_COLUMNS, COLUMN_DTYPES)
+    with the rates computed from the counts. The content features are 0 and difficulty_level is DIFFICULTY_LEVEL.
+    """
+    records = np.array(rows, dtype=ROW_DTYPE) # all rows in one conversion, the columns are fields (no transpose)
+    values = {}
+    for column in ROW_COLUMNS:
+        if COLUMN_DTYPES.get(column) == "category":
+            codes, categories = pd.factorize(records[column], sort=True)
+            values[column] = pd.Categorical.from_codes(codes, categories)
+        else:
+            values[column] = records[column]
+    for feature, (part, total) in RATE_FEATURES.items():
+        values[feature] = get_rate(values[part], values[total])
+    for feature, (part, total) in OTHER_RATE_FEATURES.items():
+        values[feature] = get_rate(values[total] - values[part], values[total])
+
+    columns = {}
+    for column in OUTPUT_COLUMNS:
+        dtype = COLUMN_DTYPES[column]
+        if dtype == "category":
+            columns[column] = values[column]
+        elif column in values:
+            columns[column] = values[column].astype(dtype)
+        elif column == "difficulty_level":
+            columns[column] = np.full(len(rows), DIFFICULTY_LEVEL, dtype=dtype)
+        else:
+            columns[column] = np.zeros(len(rows), dtype=dtype)
+    return pd.DataFrame(columns)
+
+# ------------------------------------ input / output functions ------------------------------------
+
+def parse_record(values:list) -> tuple:
+    # values of a csv line in the order of RECORD_COLUMNS with their types
+    return (float(values[0]), int(float(values[1])), values[2], values[3], int(values[4]), values[5], int(values[6]),
+            values[7], values[8], int(values[9]), int(values[10]))
+
+
+def read_records(lines):
+    """
+    Yield the parsed records of csv lines (file or stdin), lines with another nr of values are skipped
+    with a warning (e.g. a header).
+    """
+    for line_nr, values in enumerate(csv.reader(lines), 1):
+        if len(values) != len(RECORD_COLUMNS):
+            if values:
+                print(f"- Warning: Skipped line {line_nr}, expects {len(RECORD_COLUMNS)} values, got {len(values)}.",
+                      file=sys.stderr)
+            continue
+        try:
+            yield parse_record(values)
+        except ValueError as e:
+            print(f"- Warning: Skipped line {line_nr}: {e}", file=sys.stderr)
+
+
+def extract_batches(state:dict, records, batch_records=BATCH_RECORDS):
+    # yield DFs (see rows_to_df) of at most batch_records rows for an iterable of parsed records
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_records:
+            yield rows_to_df(extract_rows(state, batch))
+            batch = []
+    if batch:
+        yield rows_to_df(extract_rows(state, batch))
+
+
+def extract_file(input_path:str, output_path:str, time_window=TIME_WINDOW, host_window=HOST_WINDOW) -> int | None:
+    """
+    Extract the features of all records of input_path ('-' for stdin) and write them to output_path
+    in the KDD text format (readable by read_data_to_df). Returns the nr of rows, None if the input cannot be read.
+    """
+    if input_path != "-" and not os.path.isfile(input_path):
+        print(f"- Error: Cannot find the records '{input_path}'.")
+        return
+
+    state = new_extractor_state(time_window, host_window)
+    input_file = sys.stdin if input_path == "-" else open(input_path, "r", newline="")
+    try:
+        with open(output_path, "wb") as output_file:
+            for df_batch in extract_batches(state, read_records(input_file)):
+                write_text_data(df_batch, output_file)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+    return state["records"]
+
+
+if __name__ == "__main__":
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from predict import parse_options # only needed for the CLI
+
+    parsed_arguments = parse_options(sys.argv, {"--time-window": TIME_WINDOW, "--host-window": HOST_WINDOW})
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) != 3:
+        print("- Error: Expects the connection records ('-' for stdin) and the output path, "
+              "e.g. 'python scripts/feature_extractor.py capture_records.csv capture_kdd.txt'.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    nr_rows = extract_file(arguments[1], arguments[2], options["--time-window"], options["--host-window"])
+    if nr_rows is None:
+        sys.exit(1)
+    seconds = time.perf_counter() - start
+    print(f"- Extracted the features of {nr_rows} connections in {seconds:.2f} sec "
+          f"({nr_rows / seconds if seconds else 0:,.0f} connections/sec), written to {arguments[2]}")
@@ -0,0 +1,90 @@
+############################################################################
+### fit the recoding statistics of the preprocessing in one pass        ###
+############################################################################
+
+# run from the project folder:
+# python scripts/fit_recoding.py path_to_train_data [options]
+# e.g.  python scripts/fit_recoding.py data/KDDTrain+.txt --three-cat-quantile 0.9
+#
+# Reads the training data once in chunks (only the columns PREPROCESSING_COLUMNS of preprocessing.py, so the file
+# does not have to fit in memory) and fits the statistics that preprocessing_categories() needs, see
+# fit_recoding_statistics() in preprocessing.py: the most frequent value of the features recoded to binary,
+# the quantiles of the values > 0 and the boundaries of the features recoded to three categories and
+# the categories of the categorical features. Prints them and writes them to --output (versioned json file).
+# Train a model with them with 'python scripts/train_model.py path_to_train_data --recoding-file FILE',
+# which stores them next to the model (model/name_recoding.json), where predict.py loads them.
+#
+# options:
+#   --output FILE               recoding statistics (default: next to the training data, <name>_recoding.json)
+#   --chunk-size N              nr of rows per chunk (default 500000)
+#   --three-cat-quantile Q      fit the boundaries of RECODE_NUM_TO_THREE_CAT to this quantile of the values > 0
+#                               (default: keep the boundaries of RECODE_NUM_TO_THREE_CAT)
+#   --threshold T               min. share of the most frequent value of a binary recoded feature, a note is printed
+#                               for features below (default BINARY_FEATURE_THRESHOLD = 0.99)
+
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from preprocessing import BINARY_FEATURE_THRESHOLD, PREPROCESSING_COLUMNS, fit_recoding_statistics, read_data_in_chunks, \
+    save_recoding_statistics
+
+# ---------------------------------------- variables ----------------------------------------
+
+FIT_OPTIONS = {
+    "--output": "",
+    "--chunk-size": 500_000,
+    "--three-cat-quantile": "",
+    "--threshold": BINARY_FEATURE_THRESHOLD,
+    }
+
+# ------------------------------------ functions ------------------------------------
+
+def print_recoding_statistics(recoding:dict):
+    print(f"\n{'binary feature':<22}{'most frequent':>14}{'share':>10}{'values':>8}")
+    for feature, values in recoding["binary"].items():
+        print(f"{feature:<22}{values['value']:>14}{values['share']:>10.4%}{values['nr_values']:>8}")
+
+    print(f"\n{'three categories':<22}{'boundary':>9}{'values > 0':>11}  quantiles of the values > 0")
+    for feature, values in recoding["three_cat"].items():
+        quantiles = ", ".join(f"{quantile}: {value}" for quantile, value in values["quantiles"].items())
+        print(f"{feature:<22}{values['boundary']:>9}{values['nr_values']:>11}  {quantiles}")
+
+    print(f"\n{'categorical feature':<22}{'categories':>11}")
+    for feature, categories in recoding["categories"].items():
+        print(f"{feature:<22}{len(categories):>11}")
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, FIT_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) != 2:
+        print("- Error: Expects the training data, e.g. 'python scripts/fit_recoding.py data/KDDTrain+.txt'.")
+        sys.exit(1)
+    try:
+        three_cat_quantile = float(options["--three-cat-quantile"]) if options["--three-cat-quantile"] else None
+    except ValueError:
+        print(f"- Error: Option --three-cat-quantile expects a value of type float, got {options['--three-cat-quantile']}.")
+        sys.exit(1)
+    output_path = options["--output"] or os.path.splitext(arguments[1])[0] + "_recoding.json"
+
+    start = time.perf_counter()
+    data_chunks = read_data_in_chunks(arguments[1], options["--chunk-size"], PREPROCESSING_COLUMNS)
+    if data_chunks is None:
+        sys.exit(1)
+    recoding = fit_recoding_statistics(data_chunks, three_cat_quantile, options["--threshold"])
+    if recoding is None:
+        sys.exit(1)
+    seconds = time.perf_counter() - start
+
+    print_recoding_statistics(recoding)
+    save_recoding_statistics(recoding, output_path)
+    print(f"\n- Fitted to {recoding['rows']} rows in {seconds:.2f} sec ({recoding['rows'] / seconds:,.0f} rows/sec), "
+          f"written to {output_path}")
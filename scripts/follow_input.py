@@ -0,0 +1,271 @@
+############################################################################
+### follow mode: predict the lines appended to a file or sent via stdin  ###
+############################################################################
+
+# Used by 'python predict.py RF path_to_X_values --follow' (or '-' for stdin, e.g. piped from a collector).
+# A reader thread reads new lines as soon as they arrive (a file is polled, like 'tail -f', and read from
+# the start), the main thread parses and predicts them in batches: all lines that are waiting, up to
+# the current batch size. The batch size doubles while lines are left waiting (load), at least to the nr of
+# waiting lines (a backlog is predicted in the next batch), and halves when the batches are much smaller (idle),
+# so single lines are predicted at once and bursts in few calls.
+# The latency of a row is the time from reading its line to the end of handle_batch (e.g. the written output).
+# Lines that cannot be read (e.g. a header or a malformed line) are skipped with a warning, the other lines of their
+# batch are predicted. Skipped lines have no row in the output, handle_batch gets the line nr (from 0) of the first
+# row of every run of lines between them, so the row nrs of the alerts stay the line nrs of the input.
+
+import contextlib
+import io
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+import numpy as np
+
+from preprocessing import read_data_from_text
+from stage_metrics import measure_stage
+
+# ---------------------------------------- variables ----------------------------------------
+
+POLL_INTERVAL = 0.005       # seconds between checks for new lines at the end of a file
+READ_BYTES = 1024**2        # max. bytes read at once
+MIN_BATCH_ROWS = 1
+MAX_BATCH_ROWS = 20000
+MAX_REPORTED_LINES = 5      # line nrs printed in the warning about lines that cannot be read
+LATENCY_WINDOW = 100000     # nr of most recent (batch) latencies used for the percentiles
+LATENCY_PERCENTILES = [50, 90, 99]
+STDIN_PATH = "-"
+
+# ------------------------------------ reader functions ------------------------------------
+
+def split_lines(data:bytes, partial:bytes) -> tuple:
+    # complete lines of partial + data (without empty lines) and the incomplete rest
+    data = partial + data
+    end = data.rfind(b"\n") + 1
+    lines = [line for line in data[:end].decode("utf-8", errors="replace").splitlines() if line.strip()]
+    return lines, data[end:]
+
+
+def file_was_replaced(path:str, fd:int) -> bool:
+    # True if the file was truncated or replaced (e.g. rotated by the collector) since it was opened
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False # rotated, the new file does not exist yet
+    return stat.st_ino != os.fstat(fd).st_ino or stat.st_size < os.lseek(fd, 0, os.SEEK_CUR)
+
+
+def read_lines(path:str, line_queue:queue.Queue, stop:threading.Event):
+    """
+    Put (arrival time, list of lines) into line_queue for every block of new lines of the file
+    at path, or of stdin for path "-". Runs in its own thread until stop is set,
+    at the end of stdin None is put into the queue.
+    """
+    fd = sys.stdin.fileno() if path == STDIN_PATH else os.open(path, os.O_RDONLY)
+    partial = b""
+    try:
+        while not stop.is_set():
+            data = os.read(fd, READ_BYTES) # blocks for stdin until data arrives
+            if data:
+                lines, partial = split_lines(data, partial)
+                if lines:
+                    line_queue.put((time.perf_counter(), lines))
+                continue
+
+            if path == STDIN_PATH:
+                lines, _ = split_lines(b"\n", partial) # last line without newline
+                if lines:
+                    line_queue.put((time.perf_counter(), lines))
+                line_queue.put(None)
+                return
+
+            if file_was_replaced(path, fd):
+                os.close(fd)
+                fd, partial = os.open(path, os.O_RDONLY), b""
+                print(f"- Reading {path} again from the start (truncated or replaced).")
+                continue
+            time.sleep(POLL_INTERVAL)
+    finally:
+        if path != STDIN_PATH:
+            os.close(fd)
+
+
+def take_rows(pending:deque, nr_rows:int) -> tuple:
+    # remove up to nr_rows lines from the pending blocks, returns the lines and their (arrival time, nr) per block
+    lines, arrivals = [], []
+    while pending and len(lines) < nr_rows:
+        arrival, block = pending[0]
+        take = nr_rows - len(lines)
+        if len(block) > take:
+            pending[0] = (arrival, block[take:])
+            block = block[:take]
+        else:
+            pending.popleft()
+        lines += block
+        arrivals.append((arrival, len(block)))
+    return lines, arrivals
+
+
+def next_batch_rows(batch_rows:int, nr_rows:int, waiting:bool, max_batch_rows=MAX_BATCH_ROWS, waiting_rows=0) -> int:
+    # grow the batch while lines are waiting (at least to the waiting_rows of a backlog), 
+    # shrink it when the last batch used less than a quarter of it
+    if waiting:
+        return min(max(batch_rows * 2, waiting_rows), max_batch_rows)
+    if nr_rows < batch_rows // 4:
+        return max(batch_rows // 2, MIN_BATCH_ROWS)
+    return batch_rows
+
+# ------------------------------------ follow functions ------------------------------------
+
+def new_follow_stats() -> dict:
+    return {
+        "started_at": time.perf_counter(),
+        "rows_total": 0,
+        "batches_total": 0,
+        "skipped_lines": 0,
+        "max_batch_rows": 0,
+        "latency_recent": deque(maxlen=LATENCY_WINDOW), # (latency in seconds, nr of rows)
+        }
+
+
+def follow_input(path:str, predict_fn, handle_batch, max_batch_rows=MAX_BATCH_ROWS, idle_exit=0.0,
+                 metrics=None, stats=None) -> dict | None:
+    """
+    Predict the lines of path (or stdin for "-") as they arrive, see the header of this file.
+    Stops at the end of stdin, after idle_exit seconds without new lines (0: never) or with Ctrl+C.
+
+    Args:
+        path (str):             KDD text file (42 or 43 columns, see read_data_from_text) or "-"
+        predict_fn (callable):  function(pd.DataFrame) -> (predictions, probabilities)
+        handle_batch (callable):    function(first_row, predictions, probabilities) called for every batch
+                                    (for every run of readable lines if a batch has lines that cannot be read),
+                                    first_row is the line nr of its first row (from 0, skipped lines count too)
+        max_batch_rows (int, optional): Defaults to MAX_BATCH_ROWS.
+        idle_exit (float, optional):    Defaults to 0.0.
+        metrics (dict, optional):   measure the time of reading (parsing) the lines, see scripts/stage_metrics.py
+        stats (dict, optional):     counters of new_follow_stats(), e.g. to read them while following
+
+    Returns:
+        dict: the stats (see summarize_follow_stats), or None if the file cannot be opened
+    """
+    if path != STDIN_PATH and not os.path.isfile(path):
+        print(f"- Error: File {path} not found.")
+        return
+
+    stats = new_follow_stats() if stats is None else stats
+    line_queue, stop = queue.Queue(), threading.Event()
+    reader = threading.Thread(target=read_lines, args=(path, line_queue, stop), daemon=True)
+    reader.start()
+
+    pending, batch_rows, finished = deque(), MIN_BATCH_ROWS, False
+    try:
+        while not finished or pending:
+            if not pending:
+                try:
+                    item = line_queue.get(timeout=idle_exit or None) # wait for new lines
+                except queue.Empty:
+                    print(f"- No new lines for {idle_exit} sec, stopped.")
+                    break
+                if item is None:
+                    finished = True
+                    continue
+                pending.append(item)
+            while not line_queue.empty(): # everything that arrived in the meantime
+                item = line_queue.get_nowait()
+                if item is None:
+                    finished = True
+                    break
+                pending.append(item)
+
+            lines, arrivals = take_rows(pending, batch_rows)
+            with measure_stage(metrics, "read", len(lines)):
+                runs = parse_runs(lines)
+            first_line = stats["rows_total"] + stats["skipped_lines"]
+            skipped = get_skipped_lines(runs, len(lines))
+            if skipped:
+                stats["skipped_lines"] += len(skipped)
+                print(f"- Warning: Skipped {len(skipped)} lines that cannot be read (line nr "
+                      f"{', '.join(str(first_line + i) for i in skipped[:MAX_REPORTED_LINES])}{', ...' if len(skipped) > MAX_REPORTED_LINES else ''}).")
+            for start, df_run in runs:
+                predictions, probabilities = predict_fn(df_run)
+                handle_batch(first_line + start, predictions, probabilities)
+                stats["rows_total"] += len(df_run)
+            if runs:
+                done = time.perf_counter()
+                stats["latency_recent"].extend((done - arrival, nr) for arrival, nr in arrivals)
+                stats["batches_total"] += 1
+                stats["max_batch_rows"] = max(stats["max_batch_rows"], len(lines))
+
+            waiting_rows = sum(len(block) for _, block in pending)
+            batch_rows = next_batch_rows(batch_rows, len(lines), waiting_rows > 0 or not line_queue.empty(), max_batch_rows, 
+                                         waiting_rows)
+    except KeyboardInterrupt:
+        print("- Stopped.")
+    finally:
+        stop.set()
+    return summarize_follow_stats(stats)
+
+
+def parse_lines(lines:list):
+    # DF of the lines (see read_data_from_text), None if they cannot be read (e.g. a different nr of columns)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # the caller reports the lines that cannot be read
+            return read_data_from_text("\n".join(lines))
+    except ValueError: # includes the ParserError of pandas
+        return
+
+
+def parse_runs(lines:list, start=0) -> list:
+    """
+    Return (index of the first line, DF) for the runs of lines that can be read. A batch that cannot be read 
+    (e.g. a header, a half-written or malformed line) is split in halves until only the lines that cannot be read
+    are left out, so a bad line costs about log2(nr of lines) extra parses and the other lines are predicted.
+    """
+    df_lines = parse_lines(lines)
+    if df_lines is not None:
+        return [(start, df_lines)]
+    if len(lines) == 1:
+        return []
+    middle = len(lines) // 2
+    return parse_runs(lines[:middle], start) + parse_runs(lines[middle:], start + middle)
+
+
+def get_skipped_lines(runs:list, nr_lines:int) -> list:
+    # index of the lines of a batch that are in no run of parse_runs()
+    read = np.zeros(nr_lines, dtype=bool)
+    for start, df_run in runs:
+        read[start:start + len(df_run)] = True
+    return np.flatnonzero(~read).tolist()
+
+# ------------------------------------ stats functions ------------------------------------
+
+def get_latency_percentiles(latency_recent, percentiles=LATENCY_PERCENTILES) -> dict:
+    # percentiles of the latency per row in milliseconds, every (latency, nr of rows) counts nr times
+    if not latency_recent:
+        return {f"p{percentile}": None for percentile in percentiles}
+    latencies, counts = np.array(latency_recent).T
+    latencies = np.repeat(latencies, counts.astype(np.int64)) * 1000
+    return {f"p{percentile}": float(np.percentile(latencies, percentile)) for percentile in percentiles}
+
+
+def summarize_follow_stats(stats:dict) -> dict:
+    # JSON serializable summary of the stats with rows/sec, mean batch size and latency percentiles (ms)
+    seconds = time.perf_counter() - stats["started_at"]
+    summary = {key: value for key, value in stats.items() if key not in ["started_at", "latency_recent"]}
+    summary["seconds"] = seconds
+    summary["rows_per_second"] = stats["rows_total"] / seconds if seconds else 0.0
+    summary["mean_batch_rows"] = stats["rows_total"] / stats["batches_total"] if stats["batches_total"] else 0.0
+    summary["latency_ms"] = get_latency_percentiles(stats["latency_recent"])
+    return summary
+
+
+def print_follow_stats(summary:dict):
+    latency = ", ".join(f"{name} {value:.1f}" for name, value in summary["latency_ms"].items() if value is not None)
+    print(f"- Predicted {summary['rows_total']} rows in {summary['batches_total']} batches "
+          f"(mean {summary['mean_batch_rows']:.1f} rows, max {summary['max_batch_rows']}), "
+          f"{summary['rows_per_second']:,.0f} rows/sec.")
+    if latency:
+        print(f"- Latency per row in ms (read to written): {latency}")
+    if summary["skipped_lines"]:
+        print(f"- Skipped {summary['skipped_lines']} lines that cannot be read.")
@@ -0,0 +1,284 @@
+############################################################################
+### generator of synthetic KDD data with the distributions of real data ###
+############################################################################
+
+# run from the project folder:
+# fit step:  python scripts/generate_data.py fit data/KDDTrain+.txt [path_to_labels] [--statistics FILE]
+#            --> writes the statistics of the data to data/KDDTrain+_statistics.json (or FILE),
+#                path_to_labels is needed for data without the attack_type column (42 columns)
+# generate:  python scripts/generate_data.py nr_rows output_file [--labels FILE] [--statistics FILE]
+#                                            [--flood-share 0.5] [--seed 42]
+#            e.g. python scripts/generate_data.py 10000000 data/X_10M.txt --labels data/y_10M.txt
+#            --> nr_rows rows in the format of the test input (42 columns, without attack_type),
+#                the attack types are written to the labels file (one per line, e.g. for mode 2 of predict.py)
+#
+# The statistics are fitted per attack type (incl. normal): its share of the rows, the mix of
+# protocol_type / service / flag and the distribution of every other column, also per flag for flags with
+# at least MIN_GROUP_ROWS rows (e.g. the error rates of S0 and REJ connections differ a lot).
+# Columns with few values keep their value counts, the others the values at NR_QUANTILES quantiles.
+# A generated row draws its attack type, then a combination of protocol_type, service and flag, then every
+# other column independently of the others (within its attack type and flag).
+# flood_share of the rows are floods: runs of identical rows (mean FLOOD_RUN_ROWS) of the DoS attacks in
+# FLOOD_CLASSES, as the duplicates in the original KDD data (NSL-KDD removed them from KDDTrain+).
+
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from preprocessing import COLUMN_DTYPES, COLUMN_NAMES, read_data_to_df, read_labels, write_text_data
+
+# ---------------------------------------- variables ----------------------------------------
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATISTICS_FILE = os.path.join(PROJECT_DIR, "data", "KDDTrain+_statistics.json")
+STATISTICS_VERSION = 1          # change when the format of the statistics file changes
+COMBINATION_FEATURES = ["protocol_type", "service", "flag"]  # drawn together (their joint mix per attack type)
+VALUE_COLUMNS = [column for column in COLUMN_NAMES if column not in COMBINATION_FEATURES + ["attack_type"]]
+MAX_DISCRETE_VALUES = 200       # columns with more values are stored as quantiles
+NR_QUANTILES = 100
+MIN_GROUP_ROWS = 50             # min. nr of rows of a flag within an attack type for its own distributions
+RATE_DECIMALS = 2               # the rates of the KDD data have 2 decimals
+FLOOD_CLASSES = ["neptune", "smurf", "back", "teardrop", "pod", "land"]
+FLOOD_SHARE = 0.5
+FLOOD_RUN_ROWS = 100            # mean length of a flood run (geometric distribution)
+BLOCK_ROWS = 1_000_000          # rows generated and written at once
+RSEED = 42
+GENERATOR_OPTIONS = {
+    "--statistics": STATISTICS_FILE,
+    "--labels": "",
+    "--flood-share": FLOOD_SHARE,
+    "--seed": RSEED,
+    }
+
+# ------------------------------------ fit functions ------------------------------------
+
+def fit_distribution(values:pd.Series) -> dict:
+    # value counts (as shares) for columns with few values, otherwise the values at the quantiles
+    values = values.to_numpy(dtype=np.float64)
+    unique, counts = np.unique(values, return_counts=True)
+    if len(unique) <= MAX_DISCRETE_VALUES:
+        return {"values": unique.tolist(), "weights": (counts / counts.sum()).tolist()}
+    return {"quantiles": np.quantile(values, np.linspace(0, 1, NR_QUANTILES + 1), method="inverted_cdf").tolist()}
+
+
+def fit_statistics(data_df:pd.DataFrame, labels=None) -> dict:
+    """
+    Return the statistics of the data for generate_data(), see the header of this file.
+
+    Args:
+        data_df (pd.DataFrame):     data read with read_data_to_df() (42 or 43 columns)
+        labels (optional):          attack types of the rows, defaults to the column attack_type
+    """
+    data_df = data_df.copy()
+    data_df["attack_type"] = np.asarray(labels if labels is not None else data_df["attack_type"]).astype(str)
+    for column in VALUE_COLUMNS:
+        if "rate" in column: # float32 values with 2 decimals, e.g. 0.04 instead of 0.03999999910593033
+            data_df[column] = data_df[column].astype(np.float64).round(RATE_DECIMALS)
+
+    classes = {}
+    for attack_type, df_class in data_df.groupby("attack_type", sort=True):
+        combinations = df_class.groupby(COMBINATION_FEATURES, observed=True).size().sort_values(ascending=False)
+        classes[attack_type] = {
+            "share": len(df_class) / len(data_df),
+            "combinations": [[*combination, count / len(df_class)] for combination, count in combinations.items()],
+            "columns": {column: fit_distribution(df_class[column]) for column in VALUE_COLUMNS},
+            "flags": {str(flag): {column: fit_distribution(df_flag[column]) for column in VALUE_COLUMNS}
+                      for flag, df_flag in df_class.groupby("flag", observed=True) if len(df_flag) >= MIN_GROUP_ROWS},
+            }
+    return {"version": STATISTICS_VERSION, "rows": len(data_df), "classes": classes}
+
+
+def save_statistics(statistics:dict, path_to_file:str):
+    os.makedirs(os.path.dirname(os.path.abspath(path_to_file)), exist_ok=True)
+    with open(path_to_file, "w", encoding="utf-8") as f:
+        json.dump(statistics, f)
+
+
+def load_statistics(path_to_file:str) -> dict | None:
+    # statistics of fit_statistics(), None if the file cannot be read or has another version
+    try:
+        with open(path_to_file, "r", encoding="utf-8") as f:
+            statistics = json.load(f)
+    except (OSError, ValueError) as error:
+        print(f"- Error: Cannot read the statistics {path_to_file}: {error}")
+        print("  Fit them with: python scripts/generate_data.py fit data/KDDTrain+.txt")
+        return
+
+    if statistics.get("version") != STATISTICS_VERSION:
+        print(f"- Error: The statistics {path_to_file} have version {statistics.get('version')}, expected {STATISTICS_VERSION}.")
+        return
+    return statistics
+
+# ------------------------------------ generator functions ------------------------------------
+
+def sample_distribution(distribution:dict, nr_rows:int, rng:np.random.Generator) -> np.ndarray:
+    # nr_rows values of a distribution of fit_distribution(), between the quantiles the values are interpolated
+    if "values" in distribution:
+        return rng.choice(np.asarray(distribution["values"]), nr_rows, p=distribution["weights"])
+    quantiles = np.asarray(distribution["quantiles"])
+    position = rng.random(nr_rows) * (len(quantiles) - 1)
+    lower = np.minimum(position.astype(np.int64), len(quantiles) - 2)
+    return quantiles[lower] + (position - lower) * (quantiles[lower + 1] - quantiles[lower])
+
+
+def get_categories(statistics:dict) -> dict:
+    # all values of protocol_type, service and flag in the statistics (sorted)
+    return {feature: sorted({combination[i] for values in statistics["classes"].values() for combination in values["combinations"]})
+            for i, feature in enumerate(COMBINATION_FEATURES)}
+
+
+def sample_rows(statistics:dict, class_index:np.ndarray, rng:np.random.Generator, categories:dict) -> pd.DataFrame:
+    """
+    Return a DF with a generated row for every row of class_index (index of the attack type
+    in statistics["classes"]), with the columns of COLUMN_NAMES and their types in COLUMN_DTYPES.
+    """
+    class_names = list(statistics["classes"])
+    codes = {feature: np.zeros(len(class_index), dtype=np.int16) for feature in COMBINATION_FEATURES}
+    values = {column: np.zeros(len(class_index)) for column in VALUE_COLUMNS}
+    category_index = {feature: {value: i for i, value in enumerate(categories[feature])} for feature in COMBINATION_FEATURES}
+
+    for class_nr in np.unique(class_index):
+        class_statistics = statistics["classes"][class_names[class_nr]]
+        rows = np.flatnonzero(class_index == class_nr)
+        combinations = class_statistics["combinations"]
+        combination_nr = rng.choice(len(combinations), len(rows), p=[combination[-1] for combination in combinations])
+        for i, feature in enumerate(COMBINATION_FEATURES):
+            combination_codes = np.array([category_index[feature][combination[i]] for combination in combinations], dtype=np.int16)
+            codes[feature][rows] = combination_codes[combination_nr]
+
+        # rows of the flags with their own distributions, the remaining rows use the distributions of the class
+        remaining = np.ones(len(rows), dtype=bool)
+        flag_groups = []
+        for flag, distributions in class_statistics["flags"].items():
+            in_flag = codes["flag"][rows] == category_index["flag"][flag]
+            flag_groups.append((rows[in_flag], distributions))
+            remaining &= ~in_flag
+        flag_groups.append((rows[remaining], class_statistics["columns"]))
+        for group_rows, distributions in flag_groups:
+            if len(group_rows):
+                for column in VALUE_COLUMNS:
+                    values[column][group_rows] = sample_distribution(distributions[column], len(group_rows), rng)
+
+    data = {}
+    for column in COLUMN_NAMES:
+        if column in COMBINATION_FEATURES:
+            data[column] = np.asarray(categories[column], dtype=object)[codes[column]]
+        elif column == "attack_type":
+            data[column] = np.asarray(class_names, dtype=object)[class_index]
+        elif "rate" in column:
+            data[column] = values[column].round(RATE_DECIMALS)
+        else:
+            data[column] = np.rint(values[column]).astype(COLUMN_DTYPES[column])
+    return pd.DataFrame(data)
+
+
+def generate_data(statistics:dict, nr_rows:int, rng:np.random.Generator, flood_share=FLOOD_SHARE, categories=None) -> pd.DataFrame:
+    """
+    Return nr_rows generated rows (all columns of COLUMN_NAMES), see the header of this file.
+    The flood runs are placed between the other rows at random positions.
+    """
+    categories = get_categories(statistics) if categories is None else categories
+    class_names = list(statistics["classes"])
+    shares = np.array([statistics["classes"][name]["share"] for name in class_names])
+    flood_classes = [i for i, name in enumerate(class_names) if name in FLOOD_CLASSES]
+    nr_flood = int(round(nr_rows * flood_share)) if flood_classes else 0
+
+    # run lengths of the floods (the last one cut to nr_flood rows)
+    run_rows = np.zeros(0, dtype=np.int64)
+    while run_rows.sum() < nr_flood:
+        run_rows = np.concatenate([run_rows, rng.geometric(1 / FLOOD_RUN_ROWS, nr_flood // FLOOD_RUN_ROWS + 1)])
+    run_rows = run_rows[:np.searchsorted(np.cumsum(run_rows), nr_flood) + 1] if nr_flood else run_rows[:0]
+    if len(run_rows):
+        run_rows[-1] -= run_rows.sum() - nr_flood
+
+    nr_other = nr_rows - nr_flood
+    flood_shares = shares[flood_classes] / shares[flood_classes].sum() if flood_classes else []
+    df_other = sample_rows(statistics, rng.choice(len(class_names), nr_other, p=shares), rng, categories)
+    df_runs = sample_rows(statistics, rng.choice(flood_classes, len(run_rows), p=flood_shares) if len(run_rows)
+                          else np.zeros(0, dtype=np.int64), rng, categories)
+    df_data = pd.concat([df_other, df_runs.iloc[np.repeat(np.arange(len(run_rows)), run_rows)]], ignore_index=True)
+
+    # segments: every other row alone and every run as a whole, in random order
+    segment_rows = np.concatenate([np.ones(nr_other, dtype=np.int64), run_rows])
+    segment_starts = np.concatenate([np.arange(nr_other), nr_other + np.cumsum(run_rows) - run_rows])
+    order = rng.permutation(len(segment_rows))
+    segment_rows, segment_starts = segment_rows[order], segment_starts[order]
+    row_order = np.repeat(segment_starts - (np.cumsum(segment_rows) - segment_rows), segment_rows) + np.arange(nr_rows)
+    return df_data.iloc[row_order].reset_index(drop=True)
+
+
+def write_generated_data(statistics:dict, nr_rows:int, path_to_file:str, labels_file="", flood_share=FLOOD_SHARE,
+                         rseed=RSEED) -> int:
+    """
+    Write nr_rows generated rows (without attack_type) to path_to_file in the KDD text format,
+    in blocks of BLOCK_ROWS rows, and their attack types to labels_file (one per line) if given.
+    The same statistics, nr_rows and rseed give the same file. Returns the nr of rows written.
+    """
+    rng = np.random.default_rng(rseed)
+    categories = get_categories(statistics)
+    labels = open(labels_file, "w", encoding="utf-8", newline="") if labels_file else None
+    try:
+        with open(path_to_file, "wb") as f:
+            for start in range(0, nr_rows, BLOCK_ROWS):
+                df_block = generate_data(statistics, min(BLOCK_ROWS, nr_rows - start), rng, flood_share, categories)
+                write_text_data(df_block.drop(columns="attack_type"), f)
+                if labels is not None:
+                    labels.write("\n".join(df_block["attack_type"]) + "\n")
+    finally:
+        if labels is not None:
+            labels.close()
+    return nr_rows
+
+
+if __name__ == "__main__":
+
+    sys.path.insert(0, PROJECT_DIR)
+    import predict
+
+    parsed_arguments = predict.parse_options(sys.argv, GENERATOR_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+
+    if len(arguments) >= 3 and arguments[1] == "fit":
+        data_df = read_data_to_df(arguments[2])
+        if data_df is None:
+            sys.exit(1)
+        labels = None
+        if len(arguments) > 3:
+            reader = read_labels(arguments[3])
+            if reader is None:
+                sys.exit(1)
+            labels = reader.read()["attack_type"]
+        elif "attack_type" not in data_df.columns:
+            print("- Error: The data has no attack_type column, expects the labels as 2nd file.")
+            sys.exit(1)
+        if labels is not None and len(labels) != len(data_df):
+            print(f"- Error: {len(labels)} labels for {len(data_df)} rows.")
+            sys.exit(1)
+
+        statistics = fit_statistics(data_df, labels)
+        save_statistics(statistics, options["--statistics"])
+        print(f"- Statistics of {len(data_df)} rows ({len(statistics['classes'])} attack types) written to {options['--statistics']}")
+
+    elif len(arguments) >= 3 and arguments[1].isdigit():
+        if not 0 <= options["--flood-share"] <= 1:
+            print(f"- Error: Option --flood-share expects a value between 0 and 1, got {options['--flood-share']}.")
+            sys.exit(1)
+        statistics = load_statistics(options["--statistics"])
+        if statistics is None:
+            sys.exit(1)
+        start = time.perf_counter()
+        nr_rows = write_generated_data(statistics, int(arguments[1]), arguments[2], options["--labels"],
+                                       options["--flood-share"], options["--seed"])
+        seconds = time.perf_counter() - start
+        print(f"- {nr_rows} rows written to {arguments[2]} in {seconds:.1f} sec ({nr_rows / seconds:,.0f} rows/sec)")
+
+    else:
+        print("- Error: Expects 'fit path_to_data [path_to_labels]' or 'nr_rows output_file', e.g. "
+              "'python scripts/generate_data.py fit data/KDDTrain+.txt' and "
+              "'python scripts/generate_data.py 1000000 data/X_1M.txt --labels data/y_1M.txt'.")
+        sys.exit(1)
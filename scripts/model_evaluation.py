@@ -1,9 +1,9 @@
 import pandas as pd
 import numpy as np
 import random
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import confusion_matrix, classification_report
+
+# matplotlib and seaborn are imported in the plot functions: they take longer to import than a whole
+# prediction of a small file, and the baseline models and the evaluation in predict.py do not need them
 
 # functions
 
@@ -41,7 +41,7 @@ def baseline_model_risky_protocol(data):
     When the protocol type is 'icmp' predict the network traffic is 'malicious' = 1.
     EDA revealed that over 80% of traffic with 'icmp protocol type was malicious.
     """
-    return [1 if protocol == 'icmp' else 0 for protocol in data["protocol_type"]]
+    return np.where(data["protocol_type"] == 'icmp', 1, 0)
 
 
 # ------------------------------------- prediction -------------------------------------
@@ -51,32 +51,120 @@ def make_predictions(model, Xtrain, Xtest):
     """
     Return predictions and probabilities for 1 class 
     from Xtrain and Xtest using a model object.
+    The model is run once per dataset (see predict_with_probabilities).
     """
-    train_pred = model.predict(Xtrain)
-    train_probs = model.predict_proba(Xtrain)[:, 1]
-
-    test_pred = model.predict(Xtest)
-    test_probs = model.predict_proba(Xtest)[:, 1]
+    train_pred, train_probs = predict_with_probabilities(model, Xtrain)
+    test_pred, test_probs = predict_with_probabilities(model, Xtest)
     return train_pred, train_probs, test_pred, test_probs
 
 
+def predict_with_probabilities(model, X) -> tuple:
+    """
+    Return the predictions and the probabilities for class 1 from a single model.predict_proba(X).
+    The predictions are the same as model.predict(X): the class with the highest probability.
+    """
+    probabilities = model.predict_proba(X)
+    return model.classes_[np.argmax(probabilities, axis=1)], probabilities[:, 1]
+
+
 # ------------------------------------- evaluation -------------------------------------
 
 def print_classification_report(y_true, y_pred): 
     # quick and dirty evaluation output for now 
-    # prevent classification report warning with adding 'zero_division=0', 
-    # in case model does not predict one class -> 0 instead of NaN
+    # zero_division=0: in case model does not predict one class -> 0 instead of NaN
+    # the report is computed once from the confusion counts (see get_classification_report)
+    cr = get_classification_report(get_confusion_counts(y_true, y_pred))
     print("------"*10)
     print("Classification Report: \n", 
-          classification_report(y_true, y_pred))
+          format_classification_report(cr))
     print("------"*10)
-    cr = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
     #f1_score = cr['macro avg']['f1-score'] * 100
     #print(f"F1_Score: {round(f1_score,0)}") 
     return cr
 
 
-def plot_confusion_matrix(y_test:list, y_pred:list, classes=None, normalize='true', verbose=1):
+def get_confusion_counts(y_true, y_pred) -> np.ndarray:
+    """
+    Return the confusion matrix for the binary labels 0 (genuine) and 1 (malicious),
+    same as confusion_matrix(y_true, y_pred, labels=[0, 1]), but counted with a single np.bincount.
+    The counts of several chunks of the data can be added up.
+
+    Returns:
+        np.ndarray: 2x2 counts, rows are the true and columns the predicted labels ([[TN, FP], [FN, TP]])
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    y_pred = np.asarray(y_pred).astype(np.int64)
+    if len(y_true) != len(y_pred):
+        raise ValueError(f"Got {len(y_true)} true and {len(y_pred)} predicted labels.")
+    if len(y_true) and (min(y_true.min(), y_pred.min()) < 0 or max(y_true.max(), y_pred.max()) > 1):
+        raise ValueError("Expects binary labels 0 and 1.")
+    
+    return np.bincount(y_true * 2 + y_pred, minlength=4).reshape(2, 2)
+
+
+def normalize_confusion_counts(cf_matrix:np.ndarray, normalize='true') -> np.ndarray:
+    # same as the normalize argument of confusion_matrix(): by row ('true'), column ('pred'), all cells ('all') or None 
+    cf_matrix = cf_matrix.astype(float)
+    if normalize == 'true':
+        totals = cf_matrix.sum(axis=1, keepdims=True)
+    elif normalize == 'pred':
+        totals = cf_matrix.sum(axis=0, keepdims=True)
+    elif normalize == 'all':
+        totals = cf_matrix.sum()
+    else:
+        return cf_matrix
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nan_to_num(cf_matrix / totals)
+
+
+def get_classification_report(cf_matrix:np.ndarray) -> dict:
+    """
+    Return the same dict as classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    from the confusion counts of binary labels (see get_confusion_counts).
+    Like sklearn, only labels that are true or predicted at least once are reported.
+    """
+    report = {}
+    totals = cf_matrix.sum()
+    labels = [label for label in [0, 1] if cf_matrix[label, :].sum() + cf_matrix[:, label].sum()]
+    for label in labels:
+        true_positives = cf_matrix[label, label]
+        predicted = cf_matrix[:, label].sum()
+        support = cf_matrix[label, :].sum()
+        precision = true_positives / predicted if predicted else 0.0
+        recall = true_positives / support if support else 0.0
+        f1_score = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        report[str(label)] = {"precision": float(precision), "recall": float(recall), 
+                              "f1-score": float(f1_score), "support": float(support)}
+
+    report["accuracy"] = float(np.trace(cf_matrix) / totals) if totals else 0.0
+    for average in ["macro avg", "weighted avg"]:
+        weights = np.array([report[str(label)]["support"] for label in labels])
+        if average == "macro avg" or not weights.sum():
+            weights = np.ones(len(labels))
+        report[average] = {metric: float(np.average([report[str(label)][metric] for label in labels], weights=weights))
+                           for metric in ["precision", "recall", "f1-score"]}
+        report[average]["support"] = float(totals)
+    return report
+
+
+def format_classification_report(report:dict, digits=2) -> str:
+    # text of a report from get_classification_report() in the layout of classification_report()
+    width = len("weighted avg")
+    metrics = ["precision", "recall", "f1-score"]
+    row = lambda name, values: (f"{name:>{width}} " + "".join(f" {values[metric]:>9.{digits}f}" for metric in metrics)
+                                + f" {int(values['support']):>9}")
+
+    lines = [f"{'':>{width}} " + "".join(f" {header:>9}" for header in metrics + ["support"]), ""]
+    lines += [row(name, values) for name, values in report.items() if name not in ["accuracy", "macro avg", "weighted avg"]]
+    lines.append("")
+    lines.append(f"{'accuracy':>{width}} {'':>9} {'':>9}  {report['accuracy']:>9.{digits}f} {int(report['macro avg']['support']):>9}")
+    lines.append(row("macro avg", report["macro avg"]))
+    lines.append(row("weighted avg", report["weighted avg"]))
+    return "\n".join(lines) + "\n"
+
+
+def plot_confusion_matrix(y_test:list, y_pred:list, classes=None, normalize='true', verbose=1, output_file=None):
     """
     Plot a confusion matrix with group counts, normalized percentages, and class labels.
 
@@ -87,11 +175,31 @@ def plot_confusion_matrix(y_test:list, y_pred:list, classes=None, normalize='tru
         normalize (str or None):    optional Normalization mode ('true', 'pred', 'all', or None)
         verbose (0 or 1):           if true print accuracy, precision and recall measures, 
                                     otherwise set to 0. 
+        output_file (str):          optional Save the plot to this file instead of showing it.
     """
 
-    # compute confusion matrix
-    cf_matrix = confusion_matrix(y_test, y_pred)
-    cf_matrix_norm = confusion_matrix(y_test, y_pred, normalize=normalize)
+    # compute confusion matrix (once, the normalized values are derived from the counts)
+    cf_matrix = get_confusion_counts(y_test, y_pred)
+    plot_confusion_counts(cf_matrix, classes, normalize, output_file)
+
+    # print evaluation metrics accuracy, precision and recall
+    if verbose:
+        gc = [value for value in cf_matrix.flatten()] 
+        print_evaluation_metrics(group_counts=gc)
+
+    return 
+
+
+def plot_confusion_counts(cf_matrix:np.ndarray, classes=None, normalize='true', output_file=None):
+    """
+    Plot a confusion matrix from the counts of get_confusion_counts(), see plot_confusion_matrix().
+    With output_file the plot is saved (e.g. 'confusion_matrix.png') and not shown, 
+    so it works without a display.
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    cf_matrix_norm = normalize_confusion_counts(cf_matrix, normalize)
 
     # create labels (group names + count + percentage)
     group_names = ["TN", "FP", "FN", "TP" ] 
@@ -118,58 +226,66 @@ def plot_confusion_matrix(y_test:list, y_pred:list, classes=None, normalize='tru
     ax.set_ylabel("True", fontsize=12)
     ax.set_title("Confusion Matrix", fontsize=14)
     plt.tight_layout()
-    plt.show()
 
-    # print evaluation metrics accuracy, precision and recall
-    if verbose:
-        gc = [value for value in cf_matrix.flatten()] 
-        print_evaluation_metrics(group_counts=gc)
+    if output_file:
+        plt.savefig(output_file)
+        plt.close()
+    else:
+        plt.show()
+    return
 
-    return 
+
+def get_evaluation_metrics(group_counts: list) -> dict:
+    """
+    Return accuracy, precision, recall and F1 score from the 4 group counts of a confusion matrix 
+    in the order of group_names (TN, FP, FN, TP), 0.0 for metrics that would divide by 0.
+    """
+    group_names  = ["TN", "FP", "FN", "TP" ]
+    v_dict = dict(zip(group_names, group_counts))
+    
+    total = v_dict["TP"] + v_dict["FN"] + v_dict["TN"] + v_dict["FP"]
+    predicted_attacks = v_dict["TP"] + v_dict["FP"]
+    actual_attacks = v_dict["TP"] + v_dict["FN"]
+
+    accuracy = (v_dict["TP"] + v_dict["TN"]) / total if total else 0.0
+    precision = v_dict["TP"] / predicted_attacks if predicted_attacks else 0.0
+    recall = v_dict["TP"] / actual_attacks if actual_attacks else 0.0
+    f1_score = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"accuracy": float(accuracy), "precision": float(precision), "recall": float(recall), "f1_score": float(f1_score)}
 
 
 def print_evaluation_metrics(group_counts: list):
     """
-    Print accuracy, precision and recall.
+    Print accuracy, precision, recall and F1 score.
     Requires an input a list with 4 integers as group counts from a confusion matrix,
     similar to group_names.
-    Create a dict from group names and group counts and use it 
-    to calculate the measures manually.
+    The measures are calculated manually from the group counts with get_evaluation_metrics().
     
     This function is a memo for me, I know there are faster ways to get the metrics.  
     """
-    group_names  = ["TN", "FP", "FN", "TP" ]
-
-    # get the group_counts from confusion matrix and flatten to same format   
-    # group_counts = [f"{int(value)}" for value in cf_matrix.flatten()]
-    
-    # dict to calculate metrics 
-    v_dict = dict(zip(group_names,group_counts))
+    metrics = get_evaluation_metrics(group_counts)
     
     # accuracy
-    accuracy = (v_dict["TP"] + v_dict["TN"]) / (v_dict["TP"] + v_dict["FN"] + v_dict["TN"] + v_dict["FP"])
-    print(f"Accuracy  {round(accuracy*100,2)}%  --> Proportion of all classifications (TN and TP) that were correct.")
+    print(f"Accuracy  {round(metrics['accuracy']*100,2)}%  --> Proportion of all classifications (TN and TP) that were correct.")
     
-    # precision
-    if (v_dict["TP"] + v_dict["FP"]) == 0: # avoid nan when 0 division
-        precision = 0.0   
-    else:
-        precision = v_dict["TP"] / (v_dict["TP"] + v_dict["FP"])
-    print(f"Precision {round(precision*100,2)}%  --> Correctness: proportion of attack detections that were correct.")
+    # precision (0.0 instead of nan when 0 division)
+    print(f"Precision {round(metrics['precision']*100,2)}%  --> Correctness: proportion of attack detections that were correct.")
     #  Precision = quality of positive predictions, (does not accout for correct detection of no attack - TN)!
     #  Precision improves when false positives decrease 
     #  HOW to improve Precision: INCREASE threshold for classification 
     #  --> less false pos but more false neg (bad for recall)
      
     # recall
-    recall = v_dict["TP"]/(v_dict["TP"]+v_dict["FN"])
-    print(f"Recall    {round(recall*100,2)}%  --> Sensitivity (TPR): proportion of actual attacks that could be correctly identified.")
+    print(f"Recall    {round(metrics['recall']*100,2)}%  --> Sensitivity (TPR): proportion of actual attacks that could be correctly identified.")
     #  recall = models ability to detect attacks correctly (does not account for falase alarms!)
     #  recall = probabaility of detection
     #  Recall improves when false negatives decrease
     #  HOW to improve RECALL: DECREASE the threshold for classification -
     #  --> less false negatives, but more false positives (bad for precision)
 
+    # F1 score
+    print(f"F1 score  {round(metrics['f1_score']*100,2)}%  --> Harmonic mean of precision and recall.")
+
     # precision-recall-tradeoff (you can only optimize for one, because improving one, makes the other worse)
     # depending on case decide for the measure to optimize! 
     
@@ -179,6 +295,83 @@ def print_evaluation_metrics(group_counts: list):
     return 
 
 
+# ------------------------------------- threshold -------------------------------------
+
+SCORE_BINS = 10_000 # resolution of the thresholds of the operating point sweep (steps of 0.0001)
+
+
+def get_score_thresholds(nr_bins=SCORE_BINS) -> np.ndarray:
+    # thresholds of the score bins: bin k holds the scores >= k / nr_bins (and < (k + 1) / nr_bins)
+    return np.arange(nr_bins) / nr_bins
+
+
+def get_score_counts(y_true, scores, nr_bins=SCORE_BINS) -> np.ndarray:
+    """
+    Count the scores (probabilities for class 1) in nr_bins bins per true label 0 and 1, with a single np.bincount.
+    A score is >= the threshold of a bin (see get_score_thresholds) exactly if it is counted in this or a higher bin,
+    so the confusion counts at every threshold follow from the bins. The counts of several chunks can be added up.
+
+    Returns:
+        np.ndarray: 2 x nr_bins counts, rows are the true labels
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    bins = np.searchsorted(get_score_thresholds(nr_bins), np.asarray(scores, dtype=np.float64), side="right") - 1
+    return np.bincount(y_true * nr_bins + bins.clip(0, nr_bins - 1), minlength=2 * nr_bins).reshape(2, nr_bins)
+
+
+def get_operating_points(score_counts:np.ndarray) -> dict:
+    """
+    Return the confusion counts, recall, false positive rate (FPR) and precision for every threshold 
+    of the score bins (see get_score_counts): malicious (1) if the score is >= threshold.
+    All thresholds are computed at once from the cumulative counts (sweep from the highest threshold down).
+    """
+    # nr of rows with a score >= threshold, per true label
+    genuine_above, malicious_above = np.cumsum(score_counts[:, ::-1], axis=1)[:, ::-1]
+    nr_genuine, nr_malicious = score_counts.sum(axis=1)
+    predicted_attacks = genuine_above + malicious_above
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"threshold": get_score_thresholds(score_counts.shape[1]),
+                "TN": nr_genuine - genuine_above, "FP": genuine_above, 
+                "FN": nr_malicious - malicious_above, "TP": malicious_above,
+                "recall": np.nan_to_num(malicious_above / nr_malicious),
+                "fpr": np.nan_to_num(genuine_above / nr_genuine),
+                "precision": np.nan_to_num(malicious_above / predicted_attacks)}
+
+
+def find_operating_point(score_counts:np.ndarray, target_recall=None, target_fpr=None) -> dict | None:
+    """
+    Find the threshold for a target recall (the highest threshold with at least this recall, so with the fewest false alarms)
+    or a target false positive rate (the lowest threshold with at most this FPR, so with the highest recall).
+    Returns the threshold with its confusion counts and metrics, or None if no threshold reaches the target.
+    """
+    points = get_operating_points(score_counts)
+    if target_recall is not None:
+        candidates = np.flatnonzero(points["recall"] >= target_recall)
+        index = candidates[-1] if len(candidates) else None
+    else:
+        candidates = np.flatnonzero(points["fpr"] <= target_fpr)
+        index = candidates[0] if len(candidates) else None
+
+    if index is None:
+        return
+    operating_point = {key: values[index].item() for key, values in points.items()}
+    operating_point.update(get_evaluation_metrics([operating_point[key] for key in ["TN", "FP", "FN", "TP"]]))
+    return operating_point
+
+
+def print_operating_point(operating_point:dict | None, target_recall=None, target_fpr=None):
+    # print the result of find_operating_point()
+    target = f"recall >= {target_recall}" if target_recall is not None else f"false positive rate <= {target_fpr}"
+    if operating_point is None:
+        print(f"- No threshold reaches {target}.")
+        return
+    print(f"- Threshold for {target}: {operating_point['threshold']:.4f} (use --threshold {operating_point['threshold']:.4f})")
+    print(f"  Recall {operating_point['recall']:.2%}, false positive rate {operating_point['fpr']:.2%}, "
+          f"precision {operating_point['precision']:.2%}, F1 score {operating_point['f1_score']:.2%} "
+          f"(TN {operating_point['TN']}, FP {operating_point['FP']}, FN {operating_point['FN']}, TP {operating_point['TP']})")
+
+
 def plot_feature_importances(model, df_X: pd.DataFrame, nr_features=10):
     """
     Plot the (nr_features) most important features from a tree based model. 
@@ -188,6 +381,9 @@ def plot_feature_importances(model, df_X: pd.DataFrame, nr_features=10):
         df_X (pd.Dataframe):         DF with all the features the model was trained on.
         nr_features (int, optional): Number of most important features to plot. Defaults to 10.
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     # connect feature importances with feature names 
     feature_importances = model._final_estimator.feature_importances_
     dict_importances = {} # a dict to hold feature_name: feature_importance
@@ -17,20 +17,82 @@ def aggregate_feature_by_target(data_df: pd.DataFrame, feature: str, target, ver
     Returns:
         pd.DataFrame: grouped df
     """
+    return aggregate_feature_counts(count_feature_by_target(data_df, feature, target), feature, target, verbose)
+
+
+def aggregate_feature_by_target_chunked(data_chunks, feature: str, target, verbose=1) -> pd.DataFrame:
+    """ Same as aggregate_feature_by_target(), for data that is read in chunks (e.g. with read_data_in_chunks()
+        of preprocessing.py and the target added to every chunk), so that it never has to be held in memory at once.
+        Only the counts of the combinations of feature and target values are kept. The output is the same as 
+        for the concatenated chunks, categorical columns with different categories in the chunks get the sorted
+        union of the categories (as when reading the whole file).
+
+    Args:
+        data_chunks (iterable): DFs that contain feature and target var
+        feature (str):          name of feature to aggregate
+        target (str, optional): name of target variable to group by
+
+    Returns:
+        pd.DataFrame: grouped df
+    """
+    columns = [feature, target] if target else [feature]
+    chunk_counts = []
+    for data_df in data_chunks:
+        counts = count_feature_by_target(data_df, feature, target).rename("count").reset_index()
+        if target:
+            counts = counts[counts["count"] > 0] # combinations of unobserved categories are added again below
+        chunk_counts.append(counts)
+        if len(chunk_counts) > 1:
+            chunk_counts = [merge_feature_counts(chunk_counts, columns)]
+
+    if not chunk_counts:
+        raise ValueError("No data chunks to aggregate.")
+    counts = merge_feature_counts(chunk_counts, columns)
+    if target:
+        counts = counts.groupby(columns, observed=False, dropna=False)["count"].sum()
+    else:
+        counts = counts.set_index(feature)["count"]
+        if isinstance(counts.index.dtype, pd.CategoricalDtype):
+            # value_counts of a categorical column: all categories in their order, missing values last
+            counts = counts.groupby(level=0, observed=False, dropna=False).sum()
+    return aggregate_feature_counts(counts, feature, target, verbose)
+
+
+def count_feature_by_target(data_df: pd.DataFrame, feature: str, target) -> pd.Series:
+    # nr of rows of every combination of feature and target value (of every feature value without target),
+    # in one grouped count, before the sorting of value_counts (see aggregate_feature_counts)
+    if target:
+        return data_df.groupby([feature, target], observed=False, dropna=False).size()
+    return data_df[feature].value_counts(dropna=False, sort=False)
+
+
+def merge_feature_counts(chunk_counts: list, columns: list) -> pd.DataFrame:
+    # sum the counts (DFs with the columns and "count") of several chunks, the values keep the order they were first seen
+    for column in columns:
+        dtypes = [counts[column].dtype for counts in chunk_counts]
+        if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and len(set(dtypes)) > 1:
+            categories = pd.api.types.union_categoricals([counts[column] for counts in chunk_counts], sort_categories=True).categories
+            for counts in chunk_counts:
+                counts[column] = counts[column].cat.set_categories(categories)
+    merged = pd.concat(chunk_counts, ignore_index=True)
+    return merged.groupby(columns, observed=True, dropna=False, sort=False)["count"].sum().reset_index()
+
+
+def aggregate_feature_counts(counts: pd.Series, feature: str, target, verbose=1) -> pd.DataFrame:
+    """ Return the grouped df of aggregate_feature_by_target() from the counts of count_feature_by_target(), 
+        sorted and normalized in the same way as value_counts (without counting again).
+    """
     if target:
-        grouped_object = data_df.groupby(feature, observed=False, as_index=False, dropna=False)[target]
-         # calculate count and proportion
-        df_count = grouped_object.value_counts(dropna=False) 
-        df_proportion = grouped_object.value_counts(dropna=False, normalize=True)
-        # merge count and proportion 
-        aggregated_df = df_count.merge(df_proportion, how='inner', on=[feature, target]) 
+        # sort by count within each category, then the categories
+        counts = counts.sort_values(ascending=False, kind="stable").sort_index(level=0, sort_remaining=False)
+        group_count = counts.groupby(counts.index.droplevel(1), sort=True, dropna=False, observed=False).transform("sum")
+        aggregated_df = counts.rename("count").reset_index()
+        aggregated_df["proportion"] = (counts / group_count).fillna(0.0).to_numpy()
         aggregated_df.sort_values([target, 'proportion'], ascending=False, inplace=True)
     else:
-         # calculate count and proportion
-        df_count = data_df[feature].value_counts(dropna=False).reset_index()
-        df_proportion = data_df[feature].value_counts(dropna=False, normalize=True).reset_index()
-        # merge count and proportion 
-        aggregated_df = df_count.merge(df_proportion, how='inner', on=[feature])
+        total_count = counts.sum()
+        aggregated_df = counts.sort_values(ascending=False).rename("count").reset_index()
+        aggregated_df["proportion"] = aggregated_df["count"] / total_count
         aggregated_df.sort_values(['proportion'], ascending=False, inplace=True)
         
     #  converting to percent
@@ -38,13 +100,15 @@ def aggregate_feature_by_target(data_df: pd.DataFrame, feature: str, target, ver
     aggregated_df.rename({'proportion': 'percent'}, axis=1, inplace=True)
 
     # print statements about the relative percentage the target was 1 for each category
-    if verbose:
-        # total count 
-        tc = data_df[feature].value_counts(dropna=False).reset_index()
+    if verbose and target:
+        # total count and percent of attacks of each category
+        total_counts = aggregated_df.groupby(feature, observed=False, dropna=False, sort=False)["count"].sum()
+        attack_rows = aggregated_df[aggregated_df[target] == 1]
+        attack_percents = pd.Series(attack_rows["percent"].to_numpy(), index=attack_rows[feature].to_numpy())
 
         for feature_category in aggregated_df[feature].unique():
-            abs_freq = tc[tc[feature] == feature_category]["count"].values[0]
-            rel_percent = aggregated_df[(aggregated_df[feature] == feature_category ) & (aggregated_df[target] == 1)].percent.values[0]
+            abs_freq = total_counts[feature_category]
+            rel_percent = attack_percents.get(feature_category, 0.0)
             print(f"For {feature} { feature_category} {round(rel_percent,2)}% of traffic was an attack (based on {abs_freq} data points).")
 
     return aggregated_df
@@ -0,0 +1,201 @@
+############################################################################
+### deduplication of rows and persistent cache of predictions (--dedup) ###
+############################################################################
+
+# Network traffic is very repetitive (e.g. thousands of identical neptune or smurf rows of a flood),
+# so only the unique feature vectors are predicted and the results are copied back to all rows.
+# With a cache directory, the predictions of the unique rows are also kept across runs:
+# one file per model (key: hash of the model and schema file), rows are found by the hash of their features.
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------- variables ----------------------------------------
+
+CACHE_FORMAT_VERSION = 1        # change when the arrays of the cache file or the row hashes change
+CACHE_MAX_ENTRIES = 1_000_000   # default nr of rows kept in a cache file, the least recently used are removed
+HASH_BLOCK_BYTES = 1024**2      # block size for hashing the model file
+
+# ------------------------------------ dedup functions ------------------------------------
+
+def new_dedup_state(cache=None) -> dict:
+    """
+    Create the state of the deduplication, which is updated by predict_unique_rows()
+    with the nr of rows, unique rows and cache hits. cache is the result of load_prediction_cache() or None.
+    """
+    return {"cache": cache, "rows": 0, "unique_rows": 0, "cache_hits": 0}
+
+
+def hash_rows(df_X:pd.DataFrame) -> np.ndarray:
+    """
+    Return a 64 bit hash of every row of df_X (the features the model predicts from).
+    Categorical columns are hashed by their values, not their codes, so the hashes do not
+    depend on the categories of a chunk. Different rows get the same hash only with a
+    probability of about 1e-19 per pair, which is ignored.
+    """
+    return pd.util.hash_pandas_object(df_X, index=False).to_numpy()
+
+
+def predict_unique_rows(predict_function, df_X:pd.DataFrame, dedup:dict) -> tuple:
+    """
+    Return the predictions and the probabilities (see predict_function) for all rows of df_X,
+    but run predict_function only for the unique rows that are not in the cache.
+    The results are copied back to the rows in their original order.
+    """
+    if len(df_X) == 0:
+        return predict_function(df_X)
+
+    hashes = hash_rows(df_X)
+    unique_hashes, first_index, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+
+    cache = dedup["cache"]
+    if cache is None:
+        found = np.zeros(len(unique_hashes), dtype=bool)
+        predictions, probabilities = predict_function(df_X.iloc[first_index])
+    else:
+        found, predictions, probabilities = lookup_predictions(cache, unique_hashes)
+
+    if not found.all() and cache is not None:
+        new_predictions, new_probabilities = predict_function(df_X.iloc[first_index[~found]])
+        store_predictions(cache, unique_hashes[~found], new_predictions, new_probabilities)
+        cached_predictions, cached_probabilities = predictions, probabilities
+        predictions = np.empty(len(unique_hashes), dtype=np.result_type(new_predictions, cached_predictions))
+        probabilities = np.empty(len(unique_hashes), dtype=np.float64)
+        predictions[found], predictions[~found] = cached_predictions, new_predictions
+        probabilities[found], probabilities[~found] = cached_probabilities, new_probabilities
+
+    dedup["rows"] += len(df_X)
+    dedup["unique_rows"] += len(unique_hashes)
+    dedup["cache_hits"] += int(found.sum())
+    return predictions[inverse], probabilities[inverse]
+
+
+def merge_dedup_stats(dedup:dict | None, stats:dict):
+    # add the counts of another process (e.g. a worker of --workers) to dedup
+    if dedup is None:
+        return
+    for key in ["rows", "unique_rows", "cache_hits"]:
+        dedup[key] += stats[key]
+
+
+def get_dedup_stats(dedup:dict) -> dict:
+    """
+    Return the counts of the deduplication with the share of unique rows
+    and the hit rate of the cache (share of the unique rows found in the cache).
+    Note: with chunks, the rows are unique per chunk.
+    """
+    stats = {key: dedup[key] for key in ["rows", "unique_rows", "cache_hits"]}
+    stats["unique_share"] = round(dedup["unique_rows"] / dedup["rows"], 4) if dedup["rows"] else None
+    stats["cache_hit_rate"] = round(dedup["cache_hits"] / dedup["unique_rows"], 4) if dedup["unique_rows"] else None
+    stats["predicted_rows"] = dedup["unique_rows"] - dedup["cache_hits"]
+    return stats
+
+
+def print_dedup_stats(dedup:dict):
+    stats = get_dedup_stats(dedup)
+    if not stats["rows"]:
+        return
+    print(f"- Dedup: {stats['rows']} rows, {stats['unique_rows']} unique ({stats['unique_share']:.1%}), "
+          f"{stats['predicted_rows']} predicted by the model.")
+    if dedup["cache"] is not None:
+        print(f"- Cache: {stats['cache_hits']} of {stats['unique_rows']} unique rows found "
+              f"(hit rate {stats['cache_hit_rate']:.1%}), {len(dedup['cache']['hashes'])} rows in {dedup['cache']['path']}")
+
+# ------------------------------------ cache functions ------------------------------------
+
+def get_model_hash(model_files:list) -> str:
+    """
+    Return the SHA-256 hash of the files of a model (model file and feature schema),
+    files that do not exist are skipped. A new model (or schema) gets a new cache file.
+    """
+    digest = hashlib.sha256(str(CACHE_FORMAT_VERSION).encode())
+    for path_to_file in model_files:
+        if not os.path.isfile(path_to_file):
+            continue
+        with open(path_to_file, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_prediction_cache(cache_dir:str, model_files:list, max_entries=CACHE_MAX_ENTRIES) -> dict | None:
+    """
+    Load the cache of the model from cache_dir (one .npz file per model hash, see get_model_hash).
+    Returns an empty cache if there is no file yet, or None if cache_dir cannot be created.
+
+    Arrays of the cache (sorted by hash):
+    - hashes:           hash of the features of a row (see hash_rows)
+    - predictions:      predicted class
+    - probabilities:    probability of class 1 (malicious)
+    - last_used:        nr of the run in which the row was last predicted or found (for the LRU order)
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as error:
+        print(f"- Error: Cannot create the cache directory {cache_dir}: {error}")
+        return
+
+    cache = {"path": os.path.join(cache_dir, get_model_hash(model_files) + ".npz"),
+             "max_entries": max_entries,
+             "run": 1,
+             "hashes": np.empty(0, dtype=np.uint64),
+             "predictions": np.empty(0, dtype=np.int64),
+             "probabilities": np.empty(0, dtype=np.float64),
+             "last_used": np.empty(0, dtype=np.int64)}
+
+    if os.path.isfile(cache["path"]):
+        try:
+            with np.load(cache["path"]) as stored:
+                if int(stored["version"]) == CACHE_FORMAT_VERSION:
+                    for key in ["hashes", "predictions", "probabilities", "last_used"]:
+                        cache[key] = stored[key]
+                    cache["run"] = int(stored["run"]) + 1
+        except (OSError, ValueError, KeyError) as error:
+            print(f"- Warning: Cannot read the cache file {cache['path']} ({error}), starting with an empty cache.")
+    return cache
+
+
+def lookup_predictions(cache:dict, hashes:np.ndarray) -> tuple:
+    """
+    Find the (sorted, unique) hashes in the cache. Returns a mask of the hashes that were found
+    and their predictions and probabilities. The found rows are marked as used in this run.
+    """
+    positions = np.searchsorted(cache["hashes"], hashes).clip(0, max(len(cache["hashes"]) - 1, 0))
+    if len(cache["hashes"]) == 0:
+        return np.zeros(len(hashes), dtype=bool), cache["predictions"], cache["probabilities"]
+
+    found = cache["hashes"][positions] == hashes
+    positions = positions[found]
+    cache["last_used"][positions] = cache["run"]
+    return found, cache["predictions"][positions], cache["probabilities"][positions]
+
+
+def store_predictions(cache:dict, hashes:np.ndarray, predictions:np.ndarray, probabilities:np.ndarray):
+    # add the predictions of new rows (hashes not in the cache) and keep the arrays sorted by hash
+    order = np.argsort(np.concatenate([cache["hashes"], hashes]), kind="stable")
+    cache["hashes"] = np.concatenate([cache["hashes"], hashes])[order]
+    cache["predictions"] = np.concatenate([cache["predictions"], np.asarray(predictions)])[order]
+    cache["probabilities"] = np.concatenate([cache["probabilities"], np.asarray(probabilities, dtype=np.float64)])[order]
+    cache["last_used"] = np.concatenate([cache["last_used"], np.full(len(hashes), cache["run"], dtype=np.int64)])[order]
+
+
+def save_prediction_cache(cache:dict):
+    """
+    Write the cache file, with at most max_entries rows: the rows used least recently are removed.
+    The file is replaced at once, so an interrupted run does not leave a broken cache.
+    """
+    keep = np.arange(len(cache["hashes"]))
+    if len(keep) > cache["max_entries"]:
+        # most recently used first, then in hash order
+        keep = np.sort(np.argsort(-cache["last_used"], kind="stable")[:cache["max_entries"]])
+
+    for key in ["hashes", "predictions", "probabilities", "last_used"]:
+        cache[key] = cache[key][keep]
+
+    temp_path = cache["path"] + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, version=CACHE_FORMAT_VERSION, run=cache["run"], hashes=cache["hashes"], predictions=cache["predictions"],
+                 probabilities=cache["probabilities"], last_used=cache["last_used"])
+    os.replace(temp_path, cache["path"])
@@ -0,0 +1,236 @@
+############################################################################
+### prediction server: keep a model loaded and answer requests via HTTP  ###
+############################################################################
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import read_data_from_text
+
+# ---------------------------------------- variables ----------------------------------------
+
+DEFAULT_HOST = "127.0.0.1"    # only accept requests from the local machine
+DEFAULT_PORT = 8000
+BATCH_WINDOW_MS = 5.0         # max. time the first request of a batch waits for further requests
+MAX_BATCH_ROWS = 50000        # start predicting once a batch has this many rows
+LATENCY_WINDOW = 1000         # nr of most recent requests used for the latency percentiles
+REQUEST_QUEUE_SIZE = 128      # nr of connections that can wait to be accepted (default 5 is too small for bursts)
+
+# ------------------------------------ server functions ------------------------------------
+
+def create_server(predict_fn,
+                  host=DEFAULT_HOST,
+                  port=DEFAULT_PORT,
+                  batch_window_ms=BATCH_WINDOW_MS,
+                  max_batch_rows=MAX_BATCH_ROWS) -> "PredictionServer":
+    """
+    Create a HTTP server that answers prediction requests with predict_fn.
+
+    Endpoints:
+    - POST /predict:  body with CSV rows in the format of read_data_to_df (42 or 43 columns),
+                      returns JSON {"predictions": [...], "probabilities": [...]}
+    - GET /metrics:   returns JSON with request, row, batch and latency counters
+
+    Requests are handled in parallel threads, but the rows of all requests that arrive
+    within batch_window_ms are predicted together in a single call of predict_fn.
+
+    Args:
+        predict_fn (callable):   function(pd.DataFrame) -> (predictions, probabilities)
+        host (str, optional):    Defaults to DEFAULT_HOST (localhost only).
+        port (int, optional):    Defaults to DEFAULT_PORT.
+        batch_window_ms (float, optional):  Defaults to BATCH_WINDOW_MS.
+        max_batch_rows (int, optional):     Defaults to MAX_BATCH_ROWS.
+
+    Returns:
+        PredictionServer: call serve_forever() to start, the batching thread is already running
+    """
+    server = PredictionServer((host, port), PredictionRequestHandler)
+    server.batch_queue = queue.Queue()
+    server.metrics = new_metrics()
+    server.metrics_lock = threading.Lock()
+
+    batcher = threading.Thread(target=run_batcher,
+                               args=(server, predict_fn, batch_window_ms / 1000, max_batch_rows),
+                               daemon=True)
+    batcher.start()
+    return server
+
+
+def run_server(predict_fn, host=DEFAULT_HOST, port=DEFAULT_PORT, batch_window_ms=BATCH_WINDOW_MS):
+    # start the server and block until it is stopped with Ctrl+C
+    server = create_server(predict_fn, host, port, batch_window_ms)
+    print(f"- Serving predictions on http://{host}:{server.server_port}/predict (metrics on /metrics) ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("- Server stopped.")
+    finally:
+        server.server_close()
+
+
+def run_batcher(server, predict_fn, batch_window:float, max_batch_rows:int):
+    """
+    Collect pending requests from server.batch_queue into micro batches and predict
+    all rows of a batch at once. Runs in its own thread for the lifetime of the server.
+
+    Each queued request is a dict with the DF ('data') and an event ('done') that is set
+    once the result ('predictions' and 'probabilities', or 'error') was added to the dict.
+    """
+    while True:
+        batch = [server.batch_queue.get()] # wait for the first request
+        nr_rows = len(batch[0]["data"])
+        deadline = time.perf_counter() + batch_window
+
+        # add requests until the batch window is over or the batch is full
+        while nr_rows < max_batch_rows:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = server.batch_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            nr_rows += len(request["data"])
+
+        predict_batch(batch, predict_fn)
+
+        with server.metrics_lock:
+            server.metrics["batches_total"] += 1
+            server.metrics["rows_total"] += nr_rows
+
+
+def predict_batch(batch:list, predict_fn):
+    # predict the rows of all requests in the batch together and split the results per request
+    try:
+        df_batch = pd.concat([request["data"] for request in batch], ignore_index=True)
+        predictions, probabilities = predict_fn(df_batch)
+        predictions = np.asarray(predictions).astype(int)
+        probabilities = np.asarray(probabilities, dtype=float)
+
+        start = 0
+        for request in batch:
+            end = start + len(request["data"])
+            request["predictions"] = predictions[start:end].tolist()
+            request["probabilities"] = probabilities[start:end].tolist()
+            start = end
+    except Exception as e:
+        for request in batch:
+            request["error"] = f"Prediction failed: {e}"
+    finally:
+        for request in batch:
+            request["done"].set()
+
+
+def new_metrics() -> dict:
+    # counters exposed on /metrics
+    return {
+        "started_at": time.time(),
+        "requests_total": 0,
+        "request_errors_total": 0,
+        "rows_total": 0,
+        "batches_total": 0,
+        "latency_seconds_sum": 0.0,
+        "latency_seconds_recent": deque(maxlen=LATENCY_WINDOW),
+        }
+
+
+def summarize_metrics(metrics:dict) -> dict:
+    """
+    Return the server metrics as a JSON serializable dict,
+    with mean and percentiles of the recent request latencies in milliseconds.
+    """
+    summary = {key: value for key, value in metrics.items() if key != "latency_seconds_recent"}
+    summary["uptime_seconds"] = round(time.time() - metrics["started_at"], 3)
+    if metrics["batches_total"]:
+        summary["rows_per_batch"] = round(metrics["rows_total"] / metrics["batches_total"], 2)
+
+    latencies = np.array(metrics["latency_seconds_recent"]) * 1000
+    if len(latencies):
+        summary["latency_ms"] = {
+            "mean": round(float(latencies.mean()), 3),
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+            "max": round(float(latencies.max()), 3),
+            }
+    return summary
+
+
+class PredictionServer(ThreadingHTTPServer):
+    # one thread per request, threads do not block the server from stopping
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    # handles one HTTP request per thread, the prediction itself is done by run_batcher()
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_json(404, {"error": f"Unknown path {self.path}, use POST /predict or GET /metrics."})
+            return
+
+        with self.server.metrics_lock:
+            summary = summarize_metrics(self.server.metrics)
+        self.send_json(200, summary)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        if self.path != "/predict":
+            self.send_json(404, {"error": f"Unknown path {self.path}, use POST /predict or GET /metrics."})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        text = self.rfile.read(length).decode("utf-8")
+
+        try:
+            df_data = read_data_from_text(text)
+        except Exception as e:
+            df_data = None
+            print(f"- Error: Cannot read request data: {e}")
+
+        if df_data is None:
+            self.finish_request(start, 400, {"error": "Rows must have the format of read_data_to_df (42 or 43 columns)."})
+            return
+
+        request = {"data": df_data, "done": threading.Event()}
+        self.server.batch_queue.put(request)
+        request["done"].wait()
+
+        if "error" in request:
+            self.finish_request(start, 500, {"error": request["error"]})
+        else:
+            self.finish_request(start, 200, {"predictions": request["predictions"],
+                                             "probabilities": request["probabilities"]})
+
+    def finish_request(self, start:float, status:int, body:dict):
+        # send the response and update the request counters
+        self.send_json(status, body)
+
+        latency = time.perf_counter() - start
+        with self.server.metrics_lock:
+            metrics = self.server.metrics
+            metrics["requests_total"] += 1
+            metrics["request_errors_total"] += status != 200
+            metrics["latency_seconds_sum"] += latency
+            metrics["latency_seconds_recent"].append(latency)
+
+    def send_json(self, status:int, body:dict):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # no log line per request, use /metrics instead
+        return
@@ -0,0 +1,258 @@
+############################################################################
+### prediction writer: labels and scores in text and binary formats     ###
+############################################################################
+
+# The output file of predict.py is written in blocks (a whole file, chunk, shard or batch at once),
+# the text lines are created with NumPy instead of formatting every row in Python.
+# The format follows from the extension of the output file (see OUTPUT_FORMATS):
+# - text (.txt, .csv):    one line per row "label" or "label,score" (--scores), as before
+# - gzip (.gz), zstd (.zst):  the same text, compressed (zstd needs pyarrow)
+# - npy (.npy):           NumPy array of the labels (int8), with scores a structured array (label, score)
+# - parquet (.parquet):   column "label" (int8) and "score" (float64) with --scores (needs pyarrow)
+# With alerts_only, only the malicious rows are written: row nr (from 0 in the input) and score,
+# e.g. "5,0.992125" or the columns "row" and "score".
+
+import gzip
+import importlib.util
+import os
+import numpy as np
+
+# ---------------------------------------- variables ----------------------------------------
+
+OUTPUT_FORMATS = {".txt": "text", ".csv": "text", ".gz": "gzip", ".zst": "zstd", ".npy": "npy", ".parquet": "parquet"}
+SCORE_DECIMALS = 6          # decimals of the scores in the text formats
+GZIP_LEVEL = 1              # fast compression, the labels compress well anyway
+NPY_HEADER_BYTES = 128      # fixed header size, so that the shape can be written when the file is closed
+MALICIOUS_LABEL = 1
+DIGIT_TRIPLES = np.array([list(f"{i:03d}".encode()) for i in range(1000)], dtype=np.uint8)
+
+# ------------------------------------ format functions ------------------------------------
+
+def get_output_format(path_to_file:str) -> str:
+    # format of the output file by its extension, "text" for unknown extensions (e.g. prediction.out)
+    return OUTPUT_FORMATS.get(os.path.splitext(path_to_file)[1].lower(), "text")
+
+
+def to_labels(predictions) -> np.ndarray:
+    """
+    Return the predictions as integer labels, e.g. the floats 1.0 of a baseline model (np.ones) as 1.
+    Values that are not whole numbers are kept, so they are not silently changed.
+    """
+    predictions = np.asarray(predictions)
+    if predictions.dtype.kind == "f" and np.array_equal(predictions, np.round(predictions)):
+        return predictions.astype(np.int64)
+    return predictions
+
+
+def format_scores(scores:np.ndarray, decimals=SCORE_DECIMALS) -> np.ndarray | None:
+    """
+    Return the scores (between 0 and 1) as matrix of characters (rows x (decimals + 2), uint8),
+    the same as f"{score:.{decimals}f}" for every row. Returns None for scores out of range.
+    Rounding half way between two decimals is left to Python, where the binary value decides.
+    """
+    if len(scores) and not (np.isfinite(scores).all() and scores.min() >= 0 and scores.max() <= 1):
+        return
+    scale = 10**decimals
+    scaled = scores * scale
+    units = np.rint(scaled).astype(np.int64)
+    half_way = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    units[half_way] = [int(f"{score:.{decimals}f}".replace(".", "")) for score in scores[half_way]]
+
+    chars = np.empty((len(scores), decimals + 2), dtype=np.uint8)
+    chars[:, 0] = ord("0") + units // scale
+    chars[:, 1] = ord(".")
+    fraction = units % scale
+    # up to 3 digits at once from a table of the characters of 000 to 999
+    end = decimals + 2
+    while end > 2:
+        width = min(3, end - 2)
+        chars[:, end - width:end] = DIGIT_TRIPLES[fraction % 1000, 3 - width:]
+        fraction //= 10**width
+        end -= width
+    return chars
+
+
+def format_row_numbers(rows:np.ndarray) -> tuple:
+    """
+    Return the row nrs (>= 0) as matrix of characters (rows x digits of the largest nr, uint8), right-aligned,
+    and a mask of the characters that belong to the nr (without the leading zeros).
+    """
+    nr_digits = len(str(int(rows.max()))) if len(rows) else 1
+    chars = np.empty((len(rows), nr_digits), dtype=np.uint8)
+    used = np.empty((len(rows), nr_digits), dtype=bool)
+    remaining = rows.astype(np.int64)
+    for position in range(nr_digits - 1, -1, -1):
+        chars[:, position] = ord("0") + remaining % 10
+        used[:, position] = rows >= 10**(nr_digits - 1 - position)
+        remaining //= 10
+    used[:, -1] = True
+    return chars, used
+
+
+def format_prediction_text(predictions, scores=None, decimals=SCORE_DECIMALS) -> bytes:
+    """
+    Return the text of the output file for the predictions: one line "label" per row,
+    or "label,score" with scores. Labels 0 to 9 and scores between 0 and 1 are formatted with NumPy,
+    other values row by row (same text).
+    """
+    labels = to_labels(predictions)
+    if not len(labels):
+        return b""
+
+    score_chars = None
+    if scores is not None:
+        score_chars = format_scores(np.asarray(scores, dtype=np.float64), decimals)
+    if labels.dtype.kind not in "iu" or labels.min() < 0 or labels.max() > 9 or (scores is not None and score_chars is None):
+        if scores is None:
+            return "".join(f"{label}\n" for label in labels).encode()
+        return "".join(f"{label},{score:.{decimals}f}\n" for label, score in zip(labels, scores)).encode()
+
+    if score_chars is None:
+        chars = np.empty((len(labels), 2), dtype=np.uint8)
+    else:
+        chars = np.empty((len(labels), score_chars.shape[1] + 3), dtype=np.uint8)
+        chars[:, 1] = ord(",")
+        chars[:, 2:-1] = score_chars
+    chars[:, 0] = ord("0") + labels
+    chars[:, -1] = ord("\n")
+    return chars.tobytes()
+
+
+def format_alert_text(rows:np.ndarray, scores:np.ndarray, decimals=SCORE_DECIMALS) -> bytes:
+    # text of the alerts: one line "row,score" per malicious row
+    if not len(rows):
+        return b""
+    score_chars = format_scores(scores, decimals)
+    if score_chars is None:
+        return "".join(f"{row},{score:.{decimals}f}\n" for row, score in zip(rows, scores)).encode()
+    row_chars, used = format_row_numbers(rows)
+    chars = np.empty((len(rows), row_chars.shape[1] + score_chars.shape[1] + 2), dtype=np.uint8)
+    chars[:, :row_chars.shape[1]] = row_chars
+    chars[:, row_chars.shape[1]] = ord(",")
+    chars[:, row_chars.shape[1] + 1:-1] = score_chars
+    chars[:, -1] = ord("\n")
+    # only the characters of every line without the leading zeros of the row nr
+    used = np.concatenate([used, np.ones((len(rows), chars.shape[1] - used.shape[1]), dtype=bool)], axis=1)
+    return chars[used].tobytes()
+
+# ------------------------------------ writer functions ------------------------------------
+
+def open_prediction_writer(path_to_file:str, write_scores=False, alerts_only=False) -> dict | None:
+    """
+    Create (or overwrite) the output file and return the state of the writer for write_predictions(),
+    or None if the format needs pyarrow and it is not installed. Close it with close_prediction_writer().
+
+    Args:
+        path_to_file (str):     output file, the format follows from the extension (see OUTPUT_FORMATS)
+        write_scores (bool, optional):  write the score (probability of malicious) of every row. Defaults to False.
+        alerts_only (bool, optional):   only write the row nr and score of malicious rows. Defaults to False.
+    """
+    output_format = get_output_format(path_to_file)
+    if output_format in ["zstd", "parquet"] and not importlib.util.find_spec("pyarrow"):
+        print(f"- Error: Writing {output_format} files needs pyarrow (pip install pyarrow).")
+        return
+
+    writer = {"path": path_to_file, "format": output_format, "scores": write_scores or alerts_only,
+              "alerts_only": alerts_only, "rows": 0, "written": 0, "file": None, "parquet": None}
+    if alerts_only:
+        writer["dtype"] = np.dtype([("row", "<i8"), ("score", "<f8")])
+    elif write_scores:
+        writer["dtype"] = np.dtype([("label", "i1"), ("score", "<f8")])
+    else:
+        writer["dtype"] = np.dtype("i1")
+
+    if output_format == "gzip":
+        writer["file"] = gzip.open(path_to_file, "wb", compresslevel=GZIP_LEVEL)
+    elif output_format == "zstd":
+        import pyarrow as pa
+        writer["file"] = pa.CompressedOutputStream(path_to_file, "zstd")
+    elif output_format == "npy":
+        writer["file"] = open(path_to_file, "wb")
+        write_npy_header(writer)
+    elif output_format == "text":
+        writer["file"] = open(path_to_file, "wb")
+    return writer
+
+
+def write_predictions(writer:dict, predictions, scores=None, flush=False, first_row=None):
+    """
+    Write the predictions (and scores) of the next rows to the output file of the writer.
+    Scores are needed with write_scores or alerts_only (see open_prediction_writer).
+    With flush, the text is written to the file at once (e.g. for --follow).
+    first_row is the row nr of the first prediction for the alerts, by default the nr of rows written before.
+    """
+    labels = to_labels(predictions)
+    scores = None if scores is None else np.asarray(scores, dtype=np.float64)
+    first_row = writer["rows"] if first_row is None else first_row
+    writer["rows"] = first_row + len(labels)
+
+    if writer["alerts_only"]:
+        malicious = np.flatnonzero(labels == MALICIOUS_LABEL)
+        rows, scores = malicious + first_row, scores[malicious]
+        values = {"row": rows, "score": scores}
+    else:
+        values = {"label": labels, "score": scores} if writer["scores"] else {"label": labels}
+    writer["written"] += len(values["row" if writer["alerts_only"] else "label"])
+
+    if writer["format"] == "parquet":
+        write_parquet_block(writer, values)
+        return
+    if writer["format"] == "npy":
+        block = np.empty(len(scores) if writer["alerts_only"] else len(labels), dtype=writer["dtype"])
+        if writer["dtype"].names:
+            for name in writer["dtype"].names:
+                block[name] = values[name]
+        else:
+            block[:] = labels
+        writer["file"].write(block.tobytes())
+    elif writer["alerts_only"]:
+        writer["file"].write(format_alert_text(rows, scores))
+    else:
+        writer["file"].write(format_prediction_text(labels, scores if writer["scores"] else None))
+    if flush:
+        writer["file"].flush()
+
+
+def write_parquet_block(writer:dict, values:dict):
+    # one row group per block, the parquet writer is created with the first block
+    import pyarrow as pa
+    from pyarrow import parquet
+
+    table = pa.table({name: np.asarray(values[name], dtype=writer["dtype"][name] if writer["dtype"].names else "i1")
+                      for name in values})
+    if writer["parquet"] is None:
+        writer["parquet"] = parquet.ParquetWriter(writer["path"], table.schema)
+    writer["parquet"].write_table(table)
+
+
+def write_npy_header(writer:dict):
+    # header of the .npy format (version 1.0) with the nr of rows written so far, always NPY_HEADER_BYTES long
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(writer["dtype"]), writer["written"])
+    header = header.ljust(NPY_HEADER_BYTES - 10 - 1) + "\n"
+    writer["file"].write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1"))
+
+
+def close_prediction_writer(writer:dict | None) -> int:
+    # finish the output file (shape of .npy files, footer of parquet files), returns the nr of rows written
+    if writer is None:
+        return 0
+    if writer["format"] == "parquet":
+        if writer["parquet"] is None: # no rows: empty file with the columns
+            write_parquet_block(writer, {name: [] for name in (writer["dtype"].names or ["label"])})
+        writer["parquet"].close()
+    else:
+        if writer["format"] == "npy":
+            writer["file"].seek(0)
+            write_npy_header(writer)
+        writer["file"].close()
+    return writer["written"]
+
+
+def write_prediction_file(path_to_file:str, predictions, scores=None, alerts_only=False) -> int:
+    # write all predictions at once (see open_prediction_writer), returns the nr of rows written
+    writer = open_prediction_writer(path_to_file, scores is not None, alerts_only)
+    if writer is None:
+        return 0
+    write_predictions(writer, predictions, scores)
+    return close_prediction_writer(writer)
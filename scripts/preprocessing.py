@@ -4,6 +4,9 @@
 
 import pandas as pd
 import numpy as np
+import importlib.util
+import io
+import json
 import os
 import sys
 
@@ -64,10 +67,62 @@ BINARY_FEATURE_NEW_CAT = 1          # attention! add check: make sure the first
 RECODE_NUM_TO_THREE_CAT = {
     'num_compromised': 10, 
     'hot': 5} 
+FEATURE_SCHEMA_VERSION = 1          # change when the format of the feature schema file changes
+RECODING_VERSION = 1                # change when the format of the recoding statistics file changes
+RECODING_QUANTILES = [0.5, 0.75, 0.9, 0.95, 0.99]   # quantiles of the values > 0 of RECODE_NUM_TO_THREE_CAT
+THREE_CAT_QUANTILE = None           # fit the boundaries of RECODE_NUM_TO_THREE_CAT to this quantile, None: keep them
+
+# column names of the data set the models were trained on ("KDDTrain+.txt")
+COLUMN_NAMES = ["duration", "protocol_type", "service","flag", "src_bytes", "dst_bytes", "land",
+               "wrong_fragment", "urgent", "hot", "num_failed_logins", "logged_in", "num_compromised",
+               "root_shell", "su_attempted", "num_root", "num_file_creations", "num_shells", "num_access_files", 
+               "num_outbound_cmds", "is_host_login", "is_guest_login", "count", "srv_count", "serror_rate",
+               "srv_serror_rate","rerror_rate", "srv_rerror_rate", "same_srv_rate", "diff_srv_rate", 
+               "srv_diff_host_rate","dst_host_count", "dst_host_srv_count", "dst_host_same_srv_rate", 
+               "dst_host_diff_srv_rate", "dst_host_same_src_port_rate", "dst_host_srv_diff_host_rate",
+               "dst_host_serror_rate", "dst_host_srv_serror_rate", "dst_host_rerror_rate",
+               "dst_host_srv_rerror_rate", "attack_type", "difficulty_level"]
+
+# compact data types used when reading the data, so pandas does not have to infer them
+# (rates are between 0 and 1 and float32 is precise enough: the trees of sklearn compare float32 values anyway.
+#  The c engine of pandas does not check the range of integers and silently wraps too large values, 
+#  so counts and flags use int32 (far above any value in the data, int8 would turn a flag 999 into -25) 
+#  and bytes int64. pyarrow raises an error for values out of range.)
+COLUMN_DTYPES = {column: np.float32 for column in COLUMN_NAMES if "rate" in column}
+COLUMN_DTYPES.update({column: np.int32 for column in COLUMN_NAMES if column not in COLUMN_DTYPES})
+COLUMN_DTYPES.update({
+    "protocol_type": "category",
+    "service": "category",
+    "flag": "category",
+    "attack_type": "category",
+    "src_bytes": np.int64,
+    "dst_bytes": np.int64,
+    })
+# narrower data types of the compact mode (see compact_data): flags fit in 1 byte and counters in 2 bytes
+# (count, srv_count and the dst_host counts are limited by their windows, the other counters stay below 10000).
+# Only pyarrow checks the range while parsing, with the c engine the columns are parsed with COLUMN_DTYPES 
+# and converted after checking their range.
+COMPACT_DTYPES = dict(COLUMN_DTYPES)
+COMPACT_DTYPES.update({column: np.uint8 for column in ["land", "logged_in", "root_shell", "su_attempted", 
+                                                      "is_host_login", "is_guest_login", "difficulty_level"]})
+COMPACT_DTYPES.update({column: np.uint16 for column in ["wrong_fragment", "urgent", "hot", "num_failed_logins", 
+                                                       "num_compromised", "num_root", "num_file_creations", "num_shells", 
+                                                       "num_access_files", "num_outbound_cmds", "count", "srv_count",
+                                                       "dst_host_count", "dst_host_srv_count"]})
+COMPACT_DTYPES.update({"duration": np.uint32, "src_bytes": np.uint32, "dst_bytes": np.uint32})
+COMPACT_MODE = False    # read all data with COMPACT_DTYPES (set with --compact in predict.py)
+# raw columns needed by preprocessing_categories()
+PREPROCESSING_COLUMNS = CAT_FEATURES + RECODE_NUM_TO_BINARY_CAT + list(RECODE_NUM_TO_THREE_CAT.keys())
+# read csv files with the multithreaded parser of pyarrow, if pyarrow is installed (see read_data_to_df)
+CSV_ENGINE = "pyarrow" if importlib.util.find_spec("pyarrow") else "c"
+# columnar file formats besides the KDD text files (by file extension), see read_data_to_df() and write_data()
+DATA_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+NPY_COLUMNS_FILE = "columns.json"   # in a directory with one .npy file per column ("npy" format)
+NPY_FORMAT_VERSION = 1              # change when the format of NPY_COLUMNS_FILE changes
 
 # ------------------------------------ utility functions ------------------------------------
 
-def preprocessing_categories(data_df):
+def preprocessing_categories(data_df, schema=None):
     """
     Wrapper function that includes all preprocessing steps for the respective features. 
 
@@ -78,55 +133,261 @@ def preprocessing_categories(data_df):
     - 3 step: recode numerical variables to categorical with 3 categories 
         --> RECODE_NUM_TO_THREE_CAT
 
+    All steps work on whole columns with NumPy (no loops over the rows).
+    With a feature schema (see load_feature_schema()) the categories of every feature are
+    frozen to the categories of the training data, values not seen in training are set to missing.
+    Without a schema the categories are the values found in data_df.
+    With recoding statistics in the schema (key "recoding", see fit_recoding_statistics()) the most 
+    frequent values of step 2 and the boundaries of step 3 are taken from them, and their categories
+    are used for features without categories in the schema.
+
     Returns list of all categorical features included in model training. 
 
     """
-    new_categories = set([]) # all categorical features after preprocessing 
+    recoding = schema.get("recoding") if schema else None
+    frozen_categories = schema.get("categories", {}) if schema else {}
+    if recoding:
+        frozen_categories = {**recoding["categories"], **frozen_categories}
+    new_categories = [] # all categorical features after preprocessing 
 
     # --- 1 step: convert categorical variables to categories
     for feature in CAT_FEATURES:
-        data_df = convert_column_type(data_df, feature, 'category')
-        
-        # add feature to new categories 
-        if is_categorical_dtype(data_df, feature):
-            new_categories.add(feature)
+        if feature in frozen_categories:
+            data_df[feature] = data_df[feature].astype(pd.CategoricalDtype(frozen_categories[feature]))
         else:
-            print(f"Feature {new_feature} not added to categories, check preprocessing.")
+            data_df[feature] = data_df[feature].astype('category')
+        new_categories.append(feature)
 
     # --- 2 step: recode numerical variables to binary categorical
+    binary_labels = [0, BINARY_FEATURE_NEW_CAT]
     for feature in RECODE_NUM_TO_BINARY_CAT:
         new_feature = feature + "_cat"
         # note: do not use the threshold here, it was used in the training data to define the categories.
-        # from EDA: assume 0 is the most frequent values and recode all other values to 1 
-        data_df[new_feature] = [x if x == 0 else 1 for x in data_df[feature]]
-
-        # convert to categorical 
-        data_df = convert_column_type(data_df, new_feature, 'category')
-        
-        # add feature to new categories 
-        if is_categorical_dtype(data_df, new_feature):
-            new_categories.add(new_feature)
-        else:
-            print(f"Feature {new_feature} not added to categories, check preprocessing.")
+        # most frequent value of the training data (recoding statistics), otherwise from EDA: assume 0
+        # is the most frequent value, all other values are recoded to 1
+        most_frequent_value = recoding["binary"][feature]["value"] if recoding else 0
+        label_index = (data_df[feature].to_numpy() != most_frequent_value).astype(np.int8)
+        data_df[new_feature] = labels_to_categorical(label_index, binary_labels, frozen_categories.get(new_feature))
+        new_categories.append(new_feature)
 
     # --- 3 step: recode numerical variables to categorical with 3 categories
     category_labels = ["none", "low", "high"] 
     for feature, boundary in RECODE_NUM_TO_THREE_CAT.items():
-        
-        categories = get_conditions(data_df, feature, boundary)
         new_feature = feature + "_cat"
-        recode_to_categories(data_df, new_feature, categories, category_labels)
-        
-        # add feature to new categories 
-        if is_categorical_dtype(data_df, new_feature):
-            new_categories.add(new_feature)
-        else:
-            print(f"Feature {new_feature} not added to categories, check preprocessing.")
+        values = data_df[feature].to_numpy()
+        if recoding:
+            boundary = recoding["three_cat"][feature]["boundary"]
+
+        # same conditions as get_conditions(), -1 for values that fit none of them
+        label_index = np.full(len(values), -1, dtype=np.int8)
+        label_index[values == 0] = 0
+        label_index[(values >= 1) & (values <= boundary)] = 1
+        label_index[values > boundary] = 2
+        if (label_index == -1).any():
+            print(f"Warning: some values of {feature} could not be assigned to the new categories, they are set to missing.")
+
+        data_df[new_feature] = labels_to_categorical(label_index, category_labels, frozen_categories.get(new_feature))
+        new_categories.append(new_feature)
+
+    return new_categories
+
+
+def labels_to_categorical(label_index:np.ndarray, labels:list, categories=None) -> pd.Categorical:
+    """
+    Create a categorical column from an array with the index of the label for each row 
+    (-1 for missing), without comparing the labels row by row.
+
+    Args:
+        label_index (np.ndarray):   Index of the label in labels for each row, -1 for missing.
+        labels (list):              All possible labels.
+        categories (list, optional):    Frozen categories (e.g. from the training data). 
+                                        Labels not in categories are set to missing. 
+                                        Defaults to None: the labels that occur, sorted 
+                                        (same as .astype('category')).
+
+    Returns:
+        pd.Categorical: column with the labels as categories
+    """
+    if categories is None:
+        label_counts = np.bincount(label_index[label_index >= 0], minlength=len(labels))
+        categories = sorted(label for label, count in zip(labels, label_counts) if count)
+
+    # code of each label in the categories, the last entry is used for label_index -1
+    # (int8 like the codes of pandas, so from_codes does not copy them)
+    label_codes = np.array([categories.index(label) if label in categories else -1 for label in labels] + [-1], 
+                           dtype=np.int8 if len(categories) < 127 else np.int32)
+    
+    return pd.Categorical.from_codes(label_codes[label_index], categories=categories)
+
+
+def get_feature_schema(loaded_model) -> dict | None:
+    """
+    Return the feature schema (categories of all categorical features seen in training)
+    from the OneHotEncoder of a fitted model pipeline, or None if the model has no encoder.
+    The encoder was fitted on the training data, so its categories are the training categories.
+    """
+    if not hasattr(loaded_model, "steps"):
+        return
+
+    categories = {}
+    for step in loaded_model.steps:
+        for _, transformer, columns in getattr(step[1], "transformers_", []):
+            if hasattr(transformer, "steps"):
+                transformer = transformer.steps[-1][1] # encoder is the last step of a pipeline
+            if hasattr(transformer, "categories_"):
+                for column, column_categories in zip(columns, transformer.categories_):
+                    categories[column] = column_categories.tolist()
+
+    if not categories:
+        return
+    return {"version": FEATURE_SCHEMA_VERSION, "categories": categories}
+
+
+def get_model_features(loaded_model) -> list | None:
+    """
+    Return the features a fitted model pipeline uses for its predictions: the columns of all transformers 
+    of its ColumnTransformer that are not dropped. Returns None if they cannot be found.
+    """
+    if not hasattr(loaded_model, "steps"):
+        return
+
+    features = []
+    for step in loaded_model.steps:
+        for _, transformer, columns in getattr(step[1], "transformers_", []):
+            if isinstance(transformer, str) and transformer == "drop":
+                continue
+            features += [column for column in columns if isinstance(column, str)]
+
+    if not features:
+        return
+    return features
+
+
+def fit_feature_schema(data_df:pd.DataFrame, features:list) -> dict:
+    # return the feature schema from training data after preprocessing_categories() (categories of features) 
+    categories = {feature: data_df[feature].cat.categories.tolist() for feature in features}
+    return {"version": FEATURE_SCHEMA_VERSION, "categories": categories}
+
+
+def save_feature_schema(schema:dict, path_to_file:str):
+    # write the feature schema to a json file, e.g. next to the model file (see get_schema_path)
+    with open(path_to_file, "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=4)
+
+
+def load_feature_schema(path_to_file:str) -> dict | None:
+    # read a feature schema from a json file, returns None if the file is missing or has another version
+    if not os.path.exists(path_to_file):
+        return
+
+    with open(path_to_file, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+
+    if schema.get("version") != FEATURE_SCHEMA_VERSION:
+        print(f"Feature schema '{path_to_file}' has version {schema.get('version')}, expected {FEATURE_SCHEMA_VERSION}.")
+        return
+    return schema
+
+
+def get_schema_path(model_path:str) -> str:
+    # the feature schema is stored next to the model: model/name.pkl --> model/name_schema.json
+    return os.path.splitext(model_path)[0] + "_schema.json"
+
+
+def fit_recoding_statistics(data_chunks, three_cat_quantile=THREE_CAT_QUANTILE, threshold=BINARY_FEATURE_THRESHOLD) -> dict | None:
+    """
+    Fit the statistics of preprocessing_categories() to the training data in one pass over its chunks 
+    (e.g. read_data_in_chunks() with the columns PREPROCESSING_COLUMNS), only the counts of the values are kept.
+
+    - RECODE_NUM_TO_BINARY_CAT: most frequent value, its share and the nr of values 
+        (a note is printed if the share is not above threshold, as in recode_to_binary_feature())
+    - RECODE_NUM_TO_THREE_CAT: quantiles (RECODING_QUANTILES) of the values > 0 and the boundary, 
+        the quantile three_cat_quantile of the values > 0 or the boundary of RECODE_NUM_TO_THREE_CAT if it is None
+    - CAT_FEATURES: categories (sorted, as .astype('category'))
 
-    return list(new_categories)
+    Returns None if there are no rows.
+    """
+    value_counts, nr_rows = count_values_in_chunks(data_chunks, PREPROCESSING_COLUMNS)
+    if not nr_rows:
+        print("- Error: No rows to fit the recoding statistics.")
+        return
+
+    binary = {}
+    for feature in RECODE_NUM_TO_BINARY_CAT:
+        counts = value_counts[feature]
+        most_frequent_value, share = counts.idxmax(), counts.max() / counts.sum()
+        binary[feature] = {"value": to_json_value(most_frequent_value), "share": float(share), "nr_values": len(counts)}
+        if share <= threshold:
+            print(f"- Note: The most frequent value {most_frequent_value} of {feature} occurs in {share:.2%} of the rows, "
+                  f"not above the threshold {threshold}.")
+
+    three_cat = {}
+    for feature, boundary in RECODE_NUM_TO_THREE_CAT.items():
+        counts = value_counts[feature][value_counts[feature].index > 0]
+        quantiles = get_quantiles_from_counts(counts, RECODING_QUANTILES)
+        if three_cat_quantile is not None and len(counts):
+            boundary = int(get_quantiles_from_counts(counts, [three_cat_quantile])[str(three_cat_quantile)])
+        three_cat[feature] = {"boundary": boundary, "quantiles": quantiles, "nr_values": len(counts)}
+
+    categories = {feature: sorted(value_counts[feature].index.tolist()) for feature in CAT_FEATURES}
+    return {"version": RECODING_VERSION, "rows": nr_rows, "threshold": threshold, "three_cat_quantile": three_cat_quantile,
+            "binary": binary, "three_cat": three_cat, "categories": categories}
+
+
+def count_values_in_chunks(data_chunks, columns:list) -> tuple:
+    # counts of the values (without missing) of every column over all chunks, and the nr of rows
+    value_counts, nr_rows = {column: pd.Series(dtype=np.int64) for column in columns}, 0
+    for data_df in data_chunks:
+        nr_rows += len(data_df)
+        for column in columns:
+            counts = data_df[column].value_counts(sort=False)
+            if isinstance(counts.index, pd.CategoricalIndex):
+                counts.index = counts.index.astype(object) # categories differ between the chunks
+            value_counts[column] = value_counts[column].add(counts, fill_value=0)
+    return {column: counts[counts > 0].astype(np.int64) for column, counts in value_counts.items()}, nr_rows
+
+
+def get_quantiles_from_counts(counts:pd.Series, quantiles:list) -> dict:
+    # quantiles of the counted values (the smallest value with a cumulative share >= quantile), empty without values
+    if not len(counts):
+        return {}
+    counts = counts.sort_index()
+    shares = counts.cumsum().to_numpy() / counts.sum()
+    positions = np.minimum(np.searchsorted(shares, quantiles), len(counts) - 1)
+    return {str(quantile): to_json_value(counts.index[position]) for quantile, position in zip(quantiles, positions)}
+
+
+def to_json_value(value):
+    # python int or float for numpy scalars
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def save_recoding_statistics(recoding:dict, path_to_file:str):
+    # write the recoding statistics to a json file, e.g. next to the model file (see get_recoding_path)
+    with open(path_to_file, "w", encoding="utf-8") as f:
+        json.dump(recoding, f, indent=4)
 
 
-def read_data_to_df(path_to_file:str) -> pd.DataFrame | None:
+def load_recoding_statistics(path_to_file:str) -> dict | None:
+    # read recoding statistics from a json file, returns None if the file is missing or has another version
+    if not os.path.exists(path_to_file):
+        return
+
+    with open(path_to_file, "r", encoding="utf-8") as f:
+        recoding = json.load(f)
+
+    if recoding.get("version") != RECODING_VERSION:
+        print(f"Recoding statistics '{path_to_file}' have version {recoding.get('version')}, expected {RECODING_VERSION}.")
+        return
+    return recoding
+
+
+def get_recoding_path(model_path:str) -> str:
+    # the recoding statistics are stored next to the model: model/name.pkl --> model/name_recoding.json
+    return os.path.splitext(model_path)[0] + "_recoding.json"
+
+
+def read_data_to_df(path_to_file:str, columns=None) -> pd.DataFrame | None:
     """
     Read data from .txt or .csf file and return a pandas DF
     if the file can be found at 'path_to_file', otherwise return None.
@@ -134,25 +395,401 @@ def read_data_to_df(path_to_file:str) -> pd.DataFrame | None:
     Data must have the same format as the data set the models were traiend on:
     "KDDTrain+.txt" (43 columns or 42 columns without target column.)
 
+    The columns are parsed with the data types in COLUMN_DTYPES (see get_read_options),
+    with the multithreaded pyarrow parser if pyarrow is installed.
+    In the compact mode (COMPACT_MODE) they get the narrower types of COMPACT_DTYPES (see compact_data).
+
+    The same data can also be read from files written by write_data() (see get_data_format), 
+    without parsing any text: Parquet, Arrow IPC (memory-mapped) 
+    or a directory with one memory-mapped .npy file per column.
+
     Args:
         path_to_file (str): 
+        columns (list, optional):   Only read these columns (e.g. the ones a model needs). 
+                                    Defaults to None: all columns.
 
     Returns:
-        pd.DataFrame | None: DF with column names as below. 
+        pd.DataFrame | None: DF with column names as in COLUMN_NAMES. 
     """
-    # TODO: catch exceptions
+    data_format = get_data_format(path_to_file)
+    if data_format != "csv":
+        return read_columnar_data(path_to_file, data_format, columns)
 
-    col_names_full = ["duration", "protocol_type", "service","flag", "src_bytes", "dst_bytes", "land",
-               "wrong_fragment", "urgent", "hot", "num_failed_logins", "logged_in", "num_compromised",
-               "root_shell", "su_attempted", "num_root", "num_file_creations", "num_shells", "num_access_files", 
-               "num_outbound_cmds", "is_host_login", "is_guest_login", "count", "srv_count", "serror_rate",
-               "srv_serror_rate","rerror_rate", "srv_rerror_rate", "same_srv_rate", "diff_srv_rate", 
-               "srv_diff_host_rate","dst_host_count", "dst_host_srv_count", "dst_host_same_srv_rate", 
-               "dst_host_diff_srv_rate", "dst_host_same_src_port_rate", "dst_host_srv_diff_host_rate",
-               "dst_host_serror_rate", "dst_host_srv_serror_rate", "dst_host_rerror_rate",
-               "dst_host_srv_rerror_rate", "attack_type", "difficulty_level"]
+    column_names = get_column_names(path_to_file)
+    if column_names is None:
+        return
+
+    try:
+        if CSV_ENGINE == "pyarrow":
+            return read_csv_with_pyarrow(path_to_file, get_read_options(column_names, columns))
+        return compact_data(pd.read_csv(path_to_file, **get_read_options(column_names, columns)))
+    except ValueError as e:
+        print(f"Cannot read '{path_to_file}': {e}")
+        return
+
+
+def read_data_in_chunks(path_to_file:str, chunk_size:int, columns=None):
+    """
+    Read data from .txt or .csv file in chunks of chunk_size rows, 
+    so that large files never have to be held in memory at once.
+    Returns None if the file cannot be read (same checks as read_data_to_df).
+
+    Args:
+        path_to_file (str):  Path to the input data (same format as for read_data_to_df).
+        chunk_size (int):    Max. nr of rows per chunk.
+        columns (list, optional):   Only read these columns. Defaults to None: all columns.
+
+    Returns:
+        Iterator of pd.DataFrame | None: DFs with column names as in read_data_to_df.
+    """
+    data_format = get_data_format(path_to_file)
+    if data_format == "parquet":
+        return read_parquet_in_chunks(path_to_file, chunk_size, columns)
+    elif data_format != "csv":
+        # memory-mapped: only the rows of the current chunk are loaded 
+        data_df = read_columnar_data(path_to_file, data_format, columns)
+        if data_df is None:
+            return
+        return (data_df.iloc[start:start + chunk_size] for start in range(0, len(data_df), chunk_size))
+
+    column_names = get_column_names(path_to_file)
+    if column_names is None:
+        return
+
+    # the pyarrow engine cannot read in chunks
+    data_chunks = pd.read_csv(path_to_file, chunksize=chunk_size, **get_read_options(column_names, columns))
+    if COMPACT_MODE:
+        return (compact_data(df_chunk) for df_chunk in data_chunks)
+    return data_chunks
+
+
+def get_read_options(column_names:list, columns=None) -> dict:
+    """
+    Return the arguments for pd.read_csv() to read the data with the given column names:
+    only the selected columns (all if columns is None) with their data type from COLUMN_DTYPES.
+    Selected columns that are not in column_names (e.g. "attack_type" in X values) are ignored.
+    """
+    if columns is None:
+        use_columns = column_names
+    else:
+        use_columns = [column for column in column_names if column in columns]
+
+    return {"names": column_names,
+            "usecols": use_columns,
+            "dtype": {column: COLUMN_DTYPES[column] for column in use_columns}}
+
+
+def compact_data(data_df:pd.DataFrame) -> pd.DataFrame:
+    """
+    In the compact mode (COMPACT_MODE), return data_df with the numerical columns converted to the 
+    narrower types of COMPACT_DTYPES, otherwise data_df unchanged. A column with values out of the range 
+    of its compact type keeps its type (with a warning), so no value is changed.
+    Columns that already have their compact type (e.g. parsed by pyarrow) are not copied.
+    """
+    if not COMPACT_MODE:
+        return data_df
+
+    for column in data_df.columns:
+        dtype = COMPACT_DTYPES.get(column)
+        if dtype is None or dtype == "category" or data_df[column].dtype == dtype or data_df[column].dtype.kind not in "iu":
+            continue
+        values = data_df[column].to_numpy()
+        if len(values) and (values.min() < np.iinfo(dtype).min or values.max() > np.iinfo(dtype).max):
+            print(f"Warning: {column} has values out of the range of {np.dtype(dtype).name}, it keeps its type.")
+            continue
+        data_df[column] = values.astype(dtype)
+    return data_df
+
+
+def get_memory_report(data_df:pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the memory of every column of data_df (including the strings of object columns
+    and the categories of categorical columns): data type, MB, bytes per row and share of the total,
+    sorted by memory with the largest columns first.
+    """
+    memory = data_df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({"dtype": data_df.dtypes.astype(str), 
+                           "mb": memory / 1024**2, 
+                           "bytes_per_row": memory / max(len(data_df), 1),
+                           "share": memory / max(memory.sum(), 1)})
+    return report.sort_values("mb", ascending=False)
+
+
+def print_memory_report(data_df:pd.DataFrame):
+    # print the report of get_memory_report() with the total
+    report = get_memory_report(data_df)
+    print(f"\n{'column':<30}{'dtype':>10}{'MB':>10}{'bytes/row':>11}{'share':>8}")
+    for column, row in report.iterrows():
+        print(f"{column:<30}{row['dtype']:>10}{row['mb']:>10.2f}{row['bytes_per_row']:>11.1f}{row['share']:>8.1%}")
+    print(f"{'total (' + str(len(data_df)) + ' rows)':<30}{'':>10}{report['mb'].sum():>10.2f}"
+          f"{report['bytes_per_row'].sum():>11.1f}{1:>8.0%}")
+
+
+def read_csv_with_pyarrow(path_to_file:str, options:dict) -> pd.DataFrame:
+    """
+    Same as pd.read_csv(path_to_file, **options) with the options from get_read_options(), 
+    but parsed by pyarrow with several threads (pd.read_csv(engine="pyarrow") cannot combine names and usecols).
+    Categories are sorted as with pd.read_csv (pyarrow keeps them in the order they occur).
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    # compact mode: parsed with COMPACT_DTYPES, pyarrow raises an error for values out of their range
+    dtypes = {column: COMPACT_DTYPES[column] for column in options["dtype"]} if COMPACT_MODE else options["dtype"]
+    column_types = {}
+    for column, dtype in dtypes.items():
+        if dtype == "category":
+            column_types[column] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[column] = pa.from_numpy_dtype(dtype)
+
+    try:
+        table = csv.read_csv(path_to_file,
+                             read_options=csv.ReadOptions(column_names=options["names"]),
+                             convert_options=csv.ConvertOptions(include_columns=options["usecols"], column_types=column_types))
+    except pa.ArrowInvalid:
+        if not COMPACT_MODE:
+            raise
+        print("Note: Some values do not fit the compact data types, the file is read again with COLUMN_DTYPES.")
+        return compact_data(pd.read_csv(path_to_file, **options))
+
+    if COMPACT_MODE:
+        # every column keeps its own memory and the memory of pyarrow is freed column by column
+        data_df = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+    else:
+        data_df = table.to_pandas()
+
+    for column in data_df.columns:
+        if isinstance(data_df[column].dtype, pd.CategoricalDtype):
+            data_df[column] = data_df[column].cat.set_categories(sorted(data_df[column].cat.categories))
+    return data_df
+
+
+def get_input_columns(features:list) -> list:
+    """
+    Return the raw columns needed to create the given model features: 
+    the columns used by preprocessing_categories() and the features that are raw columns themselves.
+    """
+    columns = list(PREPROCESSING_COLUMNS)
+    columns += [feature for feature in features if feature in COLUMN_NAMES and feature not in columns]
+    return columns
+
+
+def get_data_format(path_to_file:str) -> str:
+    """
+    Return the format of the input data: "npy" for a directory with NPY_COLUMNS_FILE,
+    "parquet" or "arrow" for the extensions in DATA_FORMATS, otherwise "csv" (KDD text file).
+    """
+    if os.path.isdir(path_to_file):
+        return "npy"
+    return DATA_FORMATS.get(os.path.splitext(path_to_file)[1].lower(), "csv")
+
+
+def read_columnar_data(path_to_file:str, data_format:str, columns=None) -> pd.DataFrame | None:
+    """
+    Read data written by write_data() and return a pandas DF as read_data_to_df() does,
+    or None if the file cannot be read or does not have the columns of COLUMN_NAMES.
+
+    - "arrow" and "npy" files are memory-mapped: the numerical columns of the DF 
+      use the data of the file without copying, rows are only loaded when they are used.
+    - "parquet" files are compressed and have to be decoded, but only the selected columns.
+
+    In the compact mode (COMPACT_MODE) all formats return the types of compact_data(): the columns
+    that are stored with a wider type are copied, the others stay memory-mapped.
+    """
+    if not can_read_columnar_data(path_to_file, data_format):
+        return
+
+    if data_format == "npy":
+        return compact_data(read_npy_columns(path_to_file, columns))
+
+    import pyarrow as pa
+    from pyarrow import parquet
+
+    if data_format == "parquet":
+        use_columns = get_stored_columns(path_to_file, parquet.read_schema(path_to_file).names, columns)
+        if use_columns is None:
+            return
+        return compact_data(pd.read_parquet(path_to_file, columns=use_columns))
+
+    # the file is closed after reading: the buffers of the DF keep the mapped memory as long as they are used,
+    # without an open file handle per read
+    with pa.memory_map(path_to_file) as source:
+        reader = pa.ipc.open_file(source)
+        use_columns = get_stored_columns(path_to_file, reader.schema.names, columns)
+        if use_columns is None:
+            return
+        # split_blocks: every column keeps its own memory (no copy to combine columns of the same type)
+        return compact_data(reader.read_all().select(use_columns).to_pandas(split_blocks=True))
+
+
+def can_read_columnar_data(path_to_file:str, data_format:str) -> bool:
+    # the file must exist and parquet and arrow files need pyarrow
+    if not os.path.exists(path_to_file):
+        print(f"Cannot find '{path_to_file}'.")
+        return False
+
+    if data_format in ["parquet", "arrow"] and not importlib.util.find_spec("pyarrow"):
+        print(f"Reading {data_format} files needs pyarrow (pip install pyarrow).")
+        return False
+    return True
+
+
+def read_parquet_in_chunks(path_to_file:str, chunk_size:int, columns=None):
+    # same as read_data_in_chunks() for parquet files: decode only chunk_size rows at once 
+    if not can_read_columnar_data(path_to_file, "parquet"):
+        return
+
+    from pyarrow import parquet
+
+    parquet_file = parquet.ParquetFile(path_to_file)
+    use_columns = get_stored_columns(path_to_file, parquet_file.schema_arrow.names, columns)
+    if use_columns is None:
+        return
+    return (compact_data(batch.to_pandas()) for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=use_columns))
+
+
+def read_npy_columns(path_to_dir:str, columns=None) -> pd.DataFrame | None:
+    # read a directory written by write_data() in the "npy" format, see read_columnar_data()
+    columns_file = os.path.join(path_to_dir, NPY_COLUMNS_FILE)
+    if not os.path.exists(columns_file):
+        print(f"Cannot find '{columns_file}', the directory has to be written with write_data().")
+        return
+
+    with open(columns_file, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    
+    if stored.get("version") != NPY_FORMAT_VERSION:
+        print(f"'{columns_file}' has version {stored.get('version')}, expected {NPY_FORMAT_VERSION}.")
+        return
+
+    use_columns = get_stored_columns(path_to_dir, list(stored["columns"].keys()), columns)
+    if use_columns is None:
+        return
+
+    data = {}
+    for column in use_columns:
+        values = np.load(os.path.join(path_to_dir, column + ".npy"), mmap_mode="r")
+        categories = stored["columns"][column].get("categories")
+        if categories is not None:
+            # categorical columns are stored as codes
+            values = pd.Categorical.from_codes(values, categories=categories)
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def get_stored_columns(path_to_file:str, file_columns:list, columns=None) -> list | None:
+    """
+    Return the columns to read from a columnar file (in the order of the file): all, or the selected columns.
+    Returns None if the file does not have the columns of COLUMN_NAMES (43 columns or 42 without target column).
+    """
+    if file_columns not in [COLUMN_NAMES, [c for c in COLUMN_NAMES if c != "attack_type"]]:
+        print(f"Unexpected columns in '{path_to_file}', expected the columns of COLUMN_NAMES (with or without attack_type).")
+        return
+
+    if columns is None:
+        return file_columns
+    return [column for column in file_columns if column in columns]
+
+
+def write_data(data_df:pd.DataFrame, path_to_file:str):
+    """
+    Write data read with read_data_to_df() to a columnar file, so it can be read again without parsing text.
+    The format is chosen with get_data_format():
     
+    - "parquet" (.parquet):         compressed, smallest file
+    - "arrow" (.arrow, .feather):   Arrow IPC file, uncompressed, so it can be memory-mapped without copying
+    - "npy" (path without extension): directory with one .npy file per column and NPY_COLUMNS_FILE, 
+                                    categorical columns are stored as codes (no pyarrow needed)
+    """
+    data_format = get_data_format(path_to_file)
+    if data_format == "csv" and os.path.splitext(path_to_file)[1] == "":
+        data_format = "npy"
+
+    if data_format == "npy":
+        os.makedirs(path_to_file, exist_ok=True)
+        stored = {"version": NPY_FORMAT_VERSION, "nr_rows": len(data_df), "columns": {}}
+        for column in data_df.columns:
+            values = data_df[column]
+            stored["columns"][column] = {"dtype": str(values.dtype)}
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                stored["columns"][column]["categories"] = values.cat.categories.tolist()
+                values = values.cat.codes
+            np.save(os.path.join(path_to_file, column + ".npy"), values.to_numpy())
+
+        with open(os.path.join(path_to_file, NPY_COLUMNS_FILE), "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=4)
+
+    elif data_format == "parquet":
+        data_df.to_parquet(path_to_file, index=False)
+
+    elif data_format == "arrow":
+        import pyarrow as pa
+
+        # one chunk per column, so that each column can be used without copying
+        table = pa.Table.from_pandas(data_df, preserve_index=False).combine_chunks()
+        with pa.OSFile(path_to_file, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    else:
+        print(f"Unknown format for '{path_to_file}', expected one of {list(DATA_FORMATS.keys())} or a path without extension (npy).")
+        return
+    return path_to_file
+
+
+def write_text_data(data_df:pd.DataFrame, output_file):
+    """
+    Append the rows of data_df to an open file (binary mode) in the KDD text format (csv without header),
+    which can be read with read_data_to_df(). Written by pyarrow if it is installed (see CSV_ENGINE),
+    which is several times faster than DataFrame.to_csv(). pyarrow writes whole numbers without decimals (1.0 as 1).
+    """
+    if CSV_ENGINE == "pyarrow":
+        import pyarrow as pa
+        from pyarrow import csv
+
+        table = pa.Table.from_pandas(data_df, preserve_index=False)
+        csv.write_csv(table, output_file, csv.WriteOptions(include_header=False, quoting_style="none"))
+    else:
+        output_file.write(data_df.to_csv(header=False, index=False).encode())
+
+
+def find_line_shards(path_to_file:str, nr_shards:int) -> list:
+    """
+    Split a file into nr_shards byte ranges of about the same size that start and end at line boundaries,
+    so that each range can be read and predicted independently (e.g. by another process).
+    Returns a list of (start, end) byte offsets, empty ranges are left out.
+    """
+    file_size = os.path.getsize(path_to_file)
+    starts = [0]
+    with open(path_to_file, 'rb') as f:
+        for i in range(1, nr_shards):
+            f.seek(max(file_size * i // nr_shards, starts[-1]))
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                f.readline() # move to the start of the next line
+            starts.append(f.tell())
+
+    ends = starts[1:] + [file_size]
+    return [(start, end) for start, end in zip(starts, ends) if start < end]
+
+
+def read_data_range(path_to_file:str, start:int, end:int, column_names:list, columns=None) -> pd.DataFrame:
+    # read the lines between the byte offsets start and end (see find_line_shards) to a pandas DF
+    # (c engine: the shards are already read in parallel by several processes)
+    with open(path_to_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
 
+    return compact_data(pd.read_csv(io.BytesIO(data), **get_read_options(column_names, columns)))
+
+
+def get_column_names(path_to_file:str) -> list | None:
+    """
+    Return the column names for the data in 'path_to_file', depending on the number of columns
+    in the first line (43 columns or 42 columns without target column).
+    Returns None if the file cannot be found or has an unexpected number of columns.
+    """
     if not os.path.exists(path_to_file):
         print(f"Cannot find '{path_to_file}'.")
         return 
@@ -161,20 +798,65 @@ def read_data_to_df(path_to_file:str) -> pd.DataFrame | None:
     with open(path_to_file, 'r') as f:
         first_line = f.readline().strip()
  
+    return get_column_names_from_line(first_line)
+
+
+def get_column_names_from_line(first_line:str) -> list | None:
+    # return the column names that match the nr of columns in one line of the data (43 or 42)
     num_cols = len(first_line.split(","))
 
     # depending on the number of columns, adapt column_names
     if num_cols == 43:
-        column_names = col_names_full
+        return COLUMN_NAMES
     elif num_cols ==42:
-        column_names = [c for c in col_names_full if c != "attack_type"] # remove target
+        return [c for c in COLUMN_NAMES if c != "attack_type"] # remove target
     else:
         print(f"Unexpected number of columns: {num_cols}, has to be 43 or 42.")
         return
 
-    return pd.read_csv(path_to_file,  names=column_names)
+
+def read_data_from_text(text:str) -> pd.DataFrame | None:
+    """
+    Read data rows given as text (e.g. sent to the prediction server) and return a pandas DF, 
+    or None if the rows do not have the format of read_data_to_df.
+    """
+    text = text.strip()
+    if not text:
+        print("No data rows found.")
+        return
+
+    column_names = get_column_names_from_line(text.split("\n", 1)[0].strip())
+    if column_names is None:
+        return
+    
+    return compact_data(pd.read_csv(io.StringIO(text), **get_read_options(column_names)))
     
 
+def read_labels(path_to_file:str):
+    """
+    Return a reader for the attack_type labels (y values) in 'path_to_file': 
+    one label per line, or data with 43 columns (the labels are taken from the attack_type column).
+    Use reader.get_chunk(n) to read the next n labels, so the labels never have to be held in memory at once.
+    Returns None if the file cannot be found or has an unexpected number of columns.
+    """
+    if not os.path.exists(path_to_file):
+        print(f"Cannot find '{path_to_file}'.")
+        return 
+    
+    with open(path_to_file, 'r') as f:
+        num_cols = len(f.readline().strip().split(","))
+
+    if num_cols == 1:
+        column_names = ["attack_type"]
+    elif num_cols == 43:
+        column_names = COLUMN_NAMES
+    else:
+        print(f"Unexpected number of columns: {num_cols}, has to be 1 (labels) or 43.")
+        return
+    
+    return pd.read_csv(path_to_file, names=column_names, usecols=["attack_type"], 
+                       dtype={"attack_type": "category"}, iterator=True)
+
 
 def convert_column_type(df_data: pd.DataFrame, columns: list | str, to_type) -> pd.DataFrame:
     """ Convert data types of column(s) in a dataframe.
@@ -205,13 +887,18 @@ def is_categorical_dtype(data_df, feature):
 def recode_binary_target_feature(df_data: pd.DataFrame, input_feature: str, output_feature_name: str):
 
     # add a binary target variable (attack 1, no attack 0) to df_data, based on input feature 
-    df_data[output_feature_name]= [0 if x == "normal" else 1 for x in df_data[input_feature]] 
+    df_data[output_feature_name]= recode_binary_target(df_data[input_feature])
 
     # convert to category
     df_data = convert_column_type(df_data, output_feature_name, 'category')
     return
      
 
+def recode_binary_target(labels) -> np.ndarray:
+    # binary target for attack_type labels: 0 for "normal" (no attack), 1 for every attack
+    return np.where(pd.Series(labels, copy=False) == "normal", 0, 1)
+
+
 def recode_to_binary_feature(data_df: pd.DataFrame, 
                              input_feature: str, 
                              output_feature_name: str,
@@ -235,18 +922,19 @@ def recode_to_binary_feature(data_df: pd.DataFrame,
         threshold (float, optional):    Defaults to BINARY_FEATURE_THRESHOLD = 0.99.
     """
     
-    feature_proportions = data_df[input_feature].value_counts(normalize=True).reset_index()
-    most_frequent_value = feature_proportions.head(1)[input_feature].values[0] # name of the first category
+    feature_proportions = data_df[input_feature].value_counts(normalize=True)
+    most_frequent_value = feature_proportions.index[0] # name of the first category
+    most_frequent_share = feature_proportions.iloc[0]
     
     if threshold: # no threshold used for test data 
         # Sanity checks prior to recoding
         # the most frequent numerical value must occur more freq than threshold
-        if feature_proportions.head(1).proportion.values[0] > threshold:
+        if most_frequent_share > threshold:
             if verbose:
-                print(f"The most frequent value in {input_feature} is {most_frequent_value} with {feature_proportions.head(1).proportion.values[0]}%.")
+                print(f"The most frequent value in {input_feature} is {most_frequent_value} with {most_frequent_share}%.")
                 print(f"There are {len(feature_proportions)} different values in total.")
         else:
-            print(f"The value {feature_proportions.head(1)[input_feature].values[0]} occurs {feature_proportions.head(1).proportion.values[0]}%.")
+            print(f"The value {most_frequent_value} occurs {most_frequent_share}%.")
             print(f"No recoding done for {input_feature}, optionally change threshold for most frequent value: {threshold}.\n")
             return
     if verbose:
@@ -254,7 +942,8 @@ def recode_to_binary_feature(data_df: pd.DataFrame,
     
     # recode to most freq value vs all "other", here new_cat_name (1)
     # TODO: check that most_frequent_value is not 1 
-    data_df[output_feature_name] = [x if x == most_frequent_value else new_cat_name for x in data_df[input_feature]]
+    values = data_df[input_feature].to_numpy()
+    data_df[output_feature_name] = np.where(values == most_frequent_value, most_frequent_value, new_cat_name)
 
     # convert to categorical 
     data_df = convert_column_type(data_df, output_feature_name, 'category') 
@@ -316,22 +1005,26 @@ def get_conditions(df_data: pd.DataFrame, feature: str, boundary:int):
     return new_conditions
 
 
-def create_test_input(input_file, output_X:str, output_y:str, nr_lines:int) :
+def create_test_input(input_file, output_X:str, output_y:str, nr_lines:int, output_dir=".", sample=False, rseed=42) :
     """
     To test the prediction create seperate input files for X_test and y_test. 
-    Choose nr of lines from the test data. 
+    Choose nr of lines from the test data: the first lines, or a random sample of lines with sample=True.
+    The files '{output_X}_{nr_lines}.txt' and '{output_y}_{nr_lines}.txt' are written to output_dir.
+    For larger inputs than the test data see scripts/generate_data.py.
     """
     
     data_df = read_data_to_df(input_file)
+    if data_df is None:
+        return
     cols = [c for c in data_df.columns if c != "attack_type"] # remove target "attack_type"
-    df_X = data_df[cols]
-    df_y = data_df["attack_type"]
 
     if nr_lines < len(data_df):
-    
-        df_X.head(nr_lines).to_csv(f"../{output_X}_{nr_lines}.txt", index=False, header=False, sep=",")
-        df_y.head(nr_lines).to_csv(f"../{output_y}_{nr_lines}.txt", index=False, header=False, sep=",")
-        print(f"Created files '{output_X}_{nr_lines}' and '{output_y}_{nr_lines}'.")
+        rows = data_df.sample(nr_lines, random_state=rseed) if sample else data_df.head(nr_lines)
+        path_X = os.path.join(output_dir, f"{output_X}_{nr_lines}.txt")
+        path_y = os.path.join(output_dir, f"{output_y}_{nr_lines}.txt")
+        rows[cols].to_csv(path_X, index=False, header=False, sep=",")
+        rows["attack_type"].to_csv(path_y, index=False, header=False, sep=",")
+        print(f"Created files '{path_X}' and '{path_y}'.")
         return
     else:
         print(f"Number of input lines {nr_lines} exceeds available lines {len(data_df)}.")
@@ -340,5 +1033,7 @@ def create_test_input(input_file, output_X:str, output_y:str, nr_lines:int) :
 
 if __name__ == "__main__":
 
-    # create some test input 
-    create_test_input("..\\data\\" + file_name_test_data, 'test_input_X', 'test_input_y',1)
+    # create some test input in the project folder
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    create_test_input(os.path.join(project_dir, "data", file_name_test_data), 'test_input_X', 'test_input_y', 1, 
+                      output_dir=project_dir)
@@ -0,0 +1,245 @@
+############################################################################
+### time, rows and memory of the stages of the prediction (--profile)   ###
+############################################################################
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource # not available on Windows, the peak memory is not reported there
+except ImportError:
+    resource = None
+
+# ---------------------------------------- variables ----------------------------------------
+
+# the 5 steps of run_prediction() in predict.py, further stages (e.g. "evaluate") are added when they are measured
+STAGES = {
+    "load_model": "1 load model",
+    "read": "2 read data",
+    "preprocess": "3 preprocessing",
+    "predict": "4 prediction",
+    "write": "5 write output",
+    }
+PROFILE_STAGE = "predict"       # default stage for cProfile, usually the one that takes the longest
+NR_PROFILE_FUNCTIONS = 15       # nr of functions printed from the cProfile stats
+METRIC_PREFIX = "prediction_stage"  # prefix of the Prometheus metric names
+
+# ------------------------------------ metric functions ------------------------------------
+
+def new_stage_metrics(model_name:str, profile_stage=None) -> dict:
+    """
+    Create the metrics of all stages, which are updated by measure_stage().
+    With profile_stage, the code of this stage is also profiled with cProfile (see save_profile).
+    """
+    return {
+        "model": model_name,
+        "started_at": time.perf_counter(),
+        "stages": {stage: new_stage() for stage in STAGES},
+        "peak_memory_bytes": None,  # peak of the process before the last reset of the peak (see measure_stage)
+        "profile_stage": profile_stage,
+        "profiler": cProfile.Profile() if profile_stage else None,
+        }
+
+
+def new_stage() -> dict:
+    return {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "calls": 0, "peak_memory_bytes": None}
+
+
+@contextmanager
+def measure_stage(metrics:dict | None, stage:str, rows=0):
+    """
+    Add the wall and CPU time of the code in the with block to the stage, and the nr of rows it processed.
+    Does nothing if metrics is None, so the measurement can always be called.
+
+    The peak memory of the stage is the highest resident memory while it ran (the max. of all its calls):
+    on Linux the peak of the process is restarted at the start of the stage, elsewhere it is only known
+    if the stage raised the peak of the process (otherwise it stays None).
+
+    Usage:
+        with measure_stage(metrics, "read", len(df)):
+            ...
+    """
+    if metrics is None:
+        yield
+        return
+
+    profiler = metrics["profiler"] if stage == metrics["profile_stage"] else None
+    start_peak = get_peak_memory_bytes()
+    metrics["peak_memory_bytes"] = max_peak(metrics["peak_memory_bytes"], start_peak)
+    is_reset = reset_peak_memory()
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        values = metrics["stages"].setdefault(stage, new_stage())
+        values["wall_seconds"] += time.perf_counter() - start_wall
+        values["cpu_seconds"] += time.process_time() - start_cpu
+        values["rows"] += rows
+        values["calls"] += 1
+        peak = get_peak_memory_bytes()
+        if peak is not None and (is_reset or peak > start_peak):
+            values["peak_memory_bytes"] = max_peak(values["peak_memory_bytes"], peak)
+
+
+def add_stage_rows(metrics:dict | None, stage:str, rows:int):
+    # add rows to a stage, e.g. when the nr of rows is only known after the stage (reading a file)
+    if metrics is not None:
+        metrics["stages"].setdefault(stage, new_stage())["rows"] += rows
+
+
+def measure_iteration(metrics:dict | None, stage:str, iterable):
+    """
+    Yield the items (DFs) of iterable and measure the time to get each item as stage,
+    e.g. the reading of the next chunk from a file.
+    """
+    iterator = iter(iterable)
+    while True:
+        with measure_stage(metrics, stage):
+            item = next(iterator, None)
+        if item is None:
+            return
+        add_stage_rows(metrics, stage, len(item))
+        yield item
+
+
+def merge_stage_metrics(metrics:dict | None, stages:dict):
+    """
+    Add the stages measured in another process (e.g. a worker of --workers) to metrics.
+    Times and rows are summed up, the peak memory is the one of the process that used the most.
+    """
+    if metrics is None:
+        return
+
+    for stage, other in stages.items():
+        values = metrics["stages"].setdefault(stage, new_stage())
+        for key in ["wall_seconds", "cpu_seconds", "rows", "calls"]:
+            values[key] += other[key]
+        values["peak_memory_bytes"] = max_peak(values["peak_memory_bytes"], other["peak_memory_bytes"])
+
+
+def max_peak(*peaks) -> int | None:
+    # the highest of the peaks that were measured (not None), None if none was measured
+    peaks = [peak for peak in peaks if peak is not None]
+    return max(peaks) if peaks else None
+
+
+def reset_peak_memory() -> bool:
+    # Linux: restart the peak resident memory (VmHWM) of this process at the current memory, False if not possible
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def get_peak_memory_bytes() -> int | None:
+    # max. resident memory of this process since the start or the last reset_peak_memory(), 
+    # None if it cannot be measured (Windows)
+    # Linux: VmHWM of the process, ru_maxrss also includes the memory of the parent process when it was started
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) * 1024
+    except (OSError, StopIteration):
+        pass
+    if resource is None:
+        return
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # kilobytes on Linux, bytes on macOS
+
+
+def summarize_stage_metrics(metrics:dict) -> dict:
+    """
+    Return the metrics as a JSON serializable dict with rows/sec and the share of the total time
+    for every stage that was measured.
+    """
+    total_seconds = time.perf_counter() - metrics["started_at"]
+    stages = {}
+    for stage, values in metrics["stages"].items():
+        if not values["calls"]:
+            continue
+        stages[stage] = dict(values)
+        stages[stage]["wall_seconds"] = round(values["wall_seconds"], 6)
+        stages[stage]["cpu_seconds"] = round(values["cpu_seconds"], 6)
+        stages[stage]["rows_per_second"] = round(values["rows"] / values["wall_seconds"], 1) if values["wall_seconds"] and values["rows"] else None
+        stages[stage]["share"] = round(values["wall_seconds"] / total_seconds, 4) if total_seconds else None
+
+    return {"model": metrics["model"],
+            "total_wall_seconds": round(total_seconds, 6),
+            "peak_memory_bytes": max_peak(metrics["peak_memory_bytes"], get_peak_memory_bytes()),
+            "stages": stages}
+
+
+def print_stage_metrics(summary:dict):
+    # print the stage breakdown of summarize_stage_metrics() as table
+    print(f"\n- Profile of model {summary['model']} ({summary['total_wall_seconds']:.3f} sec in total):")
+    print(f"{'stage':<18}{'wall sec':>10}{'cpu sec':>10}{'rows':>12}{'rows/sec':>14}{'peak MB':>10}{'share':>8}")
+    for stage, values in summary["stages"].items():
+        rows_per_second = f"{values['rows_per_second']:,.0f}" if values["rows_per_second"] else "-"
+        peak = f"{values['peak_memory_bytes'] / 1024**2:.1f}" if values["peak_memory_bytes"] else "-"
+        print(f"{STAGES.get(stage, stage):<18}{values['wall_seconds']:>10.3f}{values['cpu_seconds']:>10.3f}"
+              f"{values['rows']:>12,}{rows_per_second:>14}{peak:>10}{values['share']:>8.1%}")
+
+
+def write_metrics_file(summary:dict, path_to_file:str):
+    """
+    Write the summary of summarize_stage_metrics() to a file:
+    JSON for files ending with .json, otherwise the Prometheus text format (e.g. for the node exporter).
+    """
+    with open(path_to_file, "w", encoding="utf-8", newline="") as f:
+        if os.path.splitext(path_to_file)[1].lower() == ".json":
+            json.dump(summary, f, indent=4)
+        else:
+            f.write(format_prometheus_metrics(summary))
+
+
+def format_prometheus_metrics(summary:dict) -> str:
+    # one gauge per stage value with the labels model and stage
+    metric_help = {
+        "wall_seconds": "Wall time of the stage in seconds.",
+        "cpu_seconds": "CPU time of the stage in seconds.",
+        "rows": "Nr of rows processed in the stage.",
+        "rows_per_second": "Rows processed per second of wall time.",
+        "peak_memory_bytes": "Peak resident memory of the process during the stage.",
+        }
+    lines = []
+    for key, help_text in metric_help.items():
+        name = f"{METRIC_PREFIX}_{key}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for stage, values in summary["stages"].items():
+            if values[key] is not None:
+                lines.append(f'{name}{{model="{summary["model"]}",stage="{stage}"}} {values[key]}')
+    lines += [f"# HELP {METRIC_PREFIX}_total_wall_seconds Wall time of the whole prediction in seconds.",
+              f"# TYPE {METRIC_PREFIX}_total_wall_seconds gauge",
+              f'{METRIC_PREFIX}_total_wall_seconds{{model="{summary["model"]}"}} {summary["total_wall_seconds"]}']
+    return "\n".join(lines) + "\n"
+
+
+def save_profile(metrics:dict, path_to_file:str):
+    """
+    Save the cProfile stats of the profiled stage (see new_stage_metrics) to path_to_file
+    (open with python -m pstats or snakeviz) and print the functions with the highest cumulative time.
+    """
+    if metrics["profiler"] is None:
+        return
+
+    metrics["profiler"].create_stats()
+    if not metrics["profiler"].stats: # e.g. the stage only ran in the workers of --workers
+        print(f"- Note: Stage '{metrics['profile_stage']}' was not run in this process, no cProfile stats saved.")
+        return
+
+    metrics["profiler"].dump_stats(path_to_file)
+    output = io.StringIO()
+    pstats.Stats(metrics["profiler"], stream=output).sort_stats("cumulative").print_stats(NR_PROFILE_FUNCTIONS)
+    print(f"\n- cProfile of stage '{metrics['profile_stage']}' saved to {path_to_file}, top {NR_PROFILE_FUNCTIONS} functions:")
+    print(output.getvalue().split("\n\n", 1)[-1].rstrip())
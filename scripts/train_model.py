@@ -0,0 +1,313 @@
+############################################################################
+### train the model with a parallel successive halving search           ###
+############################################################################
+
+# run from the project folder:
+# python scripts/train_model.py path_to_train_data [options]
+# e.g.  python scripts/train_model.py data/KDDTrain+.txt --candidates 12
+#
+# Scripted version of the training in model/model.ipynb: the data is read with read_data_to_df() and
+# preprocessed with preprocessing_categories(), the target is attack (1) vs. no attack (0).
+# Instead of a randomized search with all candidates on all rows (25 fits of up to 2000 trees), the candidates
+# (random forests and a histogram-based gradient boosting) compete in rounds of a successive halving search:
+# all candidates start on a small sample of the rows, only the best third continues with three times the rows.
+# The fits of a round run on all cores, the boosting stops early when the validation loss does not improve.
+# The best candidate is fitted on all rows and saved as pipeline (encoder --> model) to --output,
+# by default the file of MODELS["RF"], together with its feature schema, recoding statistics, compiled model and training log.
+# The recoding statistics of the preprocessing (most frequent values, boundaries, categories, see fit_recoding_statistics()
+# in preprocessing.py) are fitted to the training data, or taken from --recoding-file (e.g. fitted to a larger capture in
+# chunks with scripts/fit_recoding.py). predict.py loads them from the file next to the model.
+#
+# The encoded training matrices are kept in the feature cache (see scripts/feature_cache.py, key: content of the
+# training file, preprocessing settings and encoders), so further searches on the same data skip reading and encoding.
+#
+# options:
+#   --output FILE           trained model (default model/random_forest_model.pkl)
+#   --candidates N          nr of candidates of the search (default 24)
+#   --recoding-file FILE    recoding statistics of scripts/fit_recoding.py (default: fitted to the training data)
+
+import json
+import math
+import os
+import pickle
+import sys
+import time
+import joblib
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import predict
+from feature_cache import FEATURE_CACHE_DIR, get_feature_cache_key, load_feature_entry, save_feature_entry
+from preprocessing import read_data_to_df, preprocessing_categories, recode_binary_target, \
+    fit_feature_schema, save_feature_schema, get_schema_path, fit_recoding_statistics, load_recoding_statistics, \
+    save_recoding_statistics, get_recoding_path, PREPROCESSING_COLUMNS
+from tree_engine import compile_pipeline, save_compiled_model, get_compiled_model_path
+
+# ---------------------------------------- variables ----------------------------------------
+
+OUTPUT_MODEL = os.path.join("model", "random_forest_model.pkl")    # file of MODELS["RF"] in predict.py
+TRAINING_CACHE_DIR = os.path.join(PROJECT_DIR, FEATURE_CACHE_DIR)
+TARGET_COLUMN = "attack_type"
+RSEED = 42                      # same random seed as in model/model.ipynb
+N_JOBS = -1                     # parallel fits of a round, -1: all cores
+
+# successive halving: nr of candidates, rows of the first round = all rows / FACTOR**(nr of rounds - 1)
+NR_CANDIDATES = 24
+HGB_SHARE = 0.25                # share of the candidates that are histogram-based gradient boosting models
+FACTOR = 3                      # 1 / FACTOR of the candidates continue with FACTOR times the rows
+MIN_ROWS = 2000                 # min. nr of rows of the first round
+NR_FOLDS = 3                    # cross validation folds of each round
+SCORING = "f1"                  # score of attacks (class 1) to rank the candidates, the boosting stops early on its loss
+TRAIN_OPTIONS = {
+    "--output": OUTPUT_MODEL,
+    "--candidates": NR_CANDIDATES,
+    "--recoding-file": "",
+    }
+
+# parameters drawn for the candidates (param_grid2 of the notebook, with fewer trees)
+RF_PARAMETERS = {
+    "n_estimators": [25, 50, 75, 100, 150, 200, 300],
+    "max_depth": [None, 5, 9, 15, 20, 30],
+    "max_features": ["sqrt", "log2", None, 0.5, 0.7, 0.9],
+    "max_leaf_nodes": [None, 21, 50, 100, 500],
+    "min_samples_split": [2, 5, 10],
+    "criterion": ["gini", "entropy"],
+    }
+HGB_PARAMETERS = {
+    "learning_rate": [0.03, 0.1, 0.3],
+    "max_iter": [100, 300, 1000],   # upper limit, the fit stops early
+    "max_leaf_nodes": [15, 31, 63],
+    "min_samples_leaf": [10, 20, 50],
+    "l2_regularization": [0.0, 0.1, 1.0],
+    }
+# the models get the categories as one-hot columns (random forest, as the model of the notebook)
+# or as category codes (boosting, which splits categories natively).
+# The one-hot columns are dense float32: the forest fits faster than on a sparse matrix and converts to float32 anyway.
+ENCODERS = {
+    "RF": lambda: OneHotEncoder(handle_unknown="ignore", sparse_output=False, dtype=np.float32),
+    "HGB": lambda: OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1, encoded_missing_value=-1),
+    }
+
+# ------------------------------------ data functions ------------------------------------
+
+def encode_training_data(path_to_file:str, recoding=None) -> dict | None:
+    """
+    Read and preprocess the training data and encode the features for every model type (see ENCODERS).
+    The recoding statistics are fitted to the training data if recoding is None.
+    Returns a dict with the target y, the feature schema, the recoding statistics, and per model type the fitted 
+    encoder (ColumnTransformer) and the encoded matrix, or None if the file cannot be read or has no target.
+    """
+    df_train = read_data_to_df(path_to_file)
+    if df_train is None:
+        return
+    if TARGET_COLUMN not in df_train.columns:
+        print(f"- Error: The training data needs the target column '{TARGET_COLUMN}' (43 columns, as KDDTrain+.txt).")
+        return
+
+    if recoding is None:
+        recoding = fit_recoding_statistics([df_train[PREPROCESSING_COLUMNS]])
+    features = preprocessing_categories(df_train, {"recoding": recoding})
+    data = {"y": recode_binary_target(df_train[TARGET_COLUMN]).astype(np.int8),
+            "features": features,
+            "schema": fit_feature_schema(df_train, features),
+            "recoding": recoding,
+            "encoded": {}}
+    for name, create_encoder in ENCODERS.items():
+        preprocessor = ColumnTransformer([("cat", Pipeline([("encoder", create_encoder())]), features)])
+        matrix = preprocessor.fit_transform(df_train[features])
+        data["encoded"][name] = {"preprocessor": preprocessor, "matrix": matrix}
+    return data
+
+
+def load_training_data(path_to_file:str, cache_dir=TRAINING_CACHE_DIR, recoding=None) -> dict | None:
+    """
+    Encoded training data (see encode_training_data) from the feature cache (memory-mapped),
+    encoded and saved to the cache if it is not there yet.
+    """
+    if not os.path.exists(path_to_file):
+        print(f"- Error: Cannot find the training data '{path_to_file}'.")
+        return
+
+    key = get_feature_cache_key(path_to_file, ["training", TARGET_COLUMN, recoding] + 
+                                [repr(create_encoder()) for create_encoder in ENCODERS.values()])
+    entry = load_feature_entry(cache_dir, key)
+    if entry is not None:
+        print(f"- Using the encoded training data from the cache {os.path.join(cache_dir, key)}")
+        return {"y": entry["arrays"]["y"], "features": entry["metadata"]["features"], "schema": entry["metadata"]["schema"],
+                "recoding": entry["metadata"]["recoding"],
+                "encoded": {name: {"preprocessor": entry["objects"][name], "matrix": entry["arrays"][name]} for name in ENCODERS}}
+
+    data = encode_training_data(path_to_file, recoding)
+    if data is not None:
+        arrays = {name: encoded["matrix"] for name, encoded in data["encoded"].items()}
+        save_feature_entry(cache_dir, key, dict(arrays, y=data["y"]),
+                           metadata={"features": data["features"], "schema": data["schema"], "recoding": data["recoding"]},
+                           objects={name: encoded["preprocessor"] for name, encoded in data["encoded"].items()})
+    return data
+
+# ------------------------------------ search functions ------------------------------------
+
+def draw_candidates(nr_candidates:int, rseed=RSEED) -> list:
+    # random parameters for nr_candidates models: (model type, parameters)
+    nr_boosting = round(nr_candidates * HGB_SHARE)
+    candidates = [("RF", params) for params in ParameterSampler(RF_PARAMETERS, nr_candidates - nr_boosting, random_state=rseed)]
+    candidates += [("HGB", params) for params in ParameterSampler(HGB_PARAMETERS, nr_boosting, random_state=rseed)]
+    return candidates
+
+
+def create_estimator(candidate:tuple, nr_features:int, n_jobs=1):
+    # unfitted model of a candidate, the fits of the search run in parallel processes with n_jobs=1 each
+    name, params = candidate
+    if name == "HGB":
+        return HistGradientBoostingClassifier(**params, categorical_features=np.ones(nr_features, dtype=bool),
+                                              early_stopping=True, random_state=RSEED)
+    return RandomForestClassifier(**params, n_jobs=n_jobs, random_state=RSEED)
+
+
+def fit_and_score(candidate:tuple, X, y:np.ndarray, train_index:np.ndarray, test_index:np.ndarray) -> float:
+    estimator = create_estimator(candidate, X.shape[1])
+    estimator.fit(X[train_index], y[train_index])
+    return f1_score(y[test_index], estimator.predict(X[test_index]))
+
+
+def get_round_rows(nr_rows:int, nr_candidates:int) -> list:
+    """
+    Return the nr of rows of every round of the search: the last round uses all rows,
+    every round before it 1 / FACTOR of the rows of the next one (at least MIN_ROWS).
+    """
+    nr_rounds = max(math.ceil(math.log(nr_candidates, FACTOR)), 1) if nr_candidates > 1 else 1
+    return [max(nr_rows // FACTOR**(nr_rounds - 1 - i), min(MIN_ROWS, nr_rows)) for i in range(nr_rounds)]
+
+
+def successive_halving(candidates:list, data:dict, n_jobs=N_JOBS, rseed=RSEED) -> tuple:
+    """
+    Find the best candidate with successive halving: every round scores the remaining candidates with
+    NR_FOLDS cross validation on a random sample of the rows (all fits of a round in parallel),
+    the best 1 / FACTOR of them continue to the next round with more rows.
+    Returns the best candidate and the log of the rounds (nr of candidates, rows, seconds, best score).
+    """
+    y = data["y"]
+    order = np.random.default_rng(rseed).permutation(len(y))
+    remaining = list(range(len(candidates)))
+    rounds = []
+
+    print(f"{'round':>6}{'candidates':>12}{'rows':>10}{'fits':>7}{'seconds':>10}{'best ' + SCORING:>10}  best candidate")
+    for round_nr, nr_rows in enumerate(get_round_rows(len(y), len(candidates))):
+        start = time.perf_counter()
+        rows = np.sort(order[:nr_rows])
+        folds = list(StratifiedKFold(NR_FOLDS, shuffle=True, random_state=rseed).split(rows, y[rows]))
+        fits = [(index, rows[train], rows[test]) for index in remaining for train, test in folds]
+
+        scores = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(fit_and_score)(candidates[index], data["encoded"][candidates[index][0]]["matrix"], y, train, test)
+            for index, train, test in fits)
+        mean_scores = {index: np.mean(scores[i * NR_FOLDS:(i + 1) * NR_FOLDS]) for i, index in enumerate(remaining)}
+
+        remaining = sorted(remaining, key=lambda index: -mean_scores[index])
+        best = remaining[0]
+        rounds.append({"round": round_nr + 1, "candidates": len(mean_scores), "rows": int(nr_rows), "fits": len(fits),
+                       "seconds": round(time.perf_counter() - start, 3), "best_score": round(float(mean_scores[best]), 6),
+                       "scores": [{"candidate": candidates[index], "score": round(float(mean_scores[index]), 6)}
+                                  for index in remaining]})
+        print(f"{round_nr + 1:>6}{len(mean_scores):>12}{nr_rows:>10}{len(fits):>7}{rounds[-1]['seconds']:>10.2f}"
+              f"{mean_scores[best]:>10.4f}  {candidates[best][0]} {candidates[best][1]}")
+        remaining = remaining[:max(math.ceil(len(remaining) / FACTOR), 1)]
+
+    return candidates[remaining[0]], rounds
+
+# ------------------------------------ model functions ------------------------------------
+
+def fit_final_model(candidate:tuple, data:dict) -> Pipeline:
+    """
+    Fit the candidate on all rows (random forest on all cores) and return the pipeline
+    of the fitted encoder and the model, as the pipeline of the notebook: it predicts from the DF
+    of preprocessing_categories(). n_jobs of the forest is reset, as in the pickled models before.
+    """
+    encoded = data["encoded"][candidate[0]]
+    estimator = create_estimator(candidate, encoded["matrix"].shape[1], n_jobs=N_JOBS)
+    estimator.fit(encoded["matrix"], data["y"])
+    if candidate[0] == "RF":
+        estimator.set_params(n_jobs=None)
+    step_name = "forest" if candidate[0] == "RF" else "boosting"
+    return Pipeline([("preprocessor", encoded["preprocessor"]), (step_name, estimator)])
+
+
+def save_model(pipeline:Pipeline, data:dict, output_path:str, log:dict):
+    """
+    Save the pipeline to output_path (pickle, as loaded by predict.py), its feature schema, recoding statistics and training log,
+    and the compiled model for --engine numpy. A compiled model of a previous forest is removed
+    if the new model cannot be compiled (boosting), otherwise it would predict instead of the new one.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "wb") as f:
+        pickle.dump(pipeline, f)
+    save_feature_schema(data["schema"], get_schema_path(output_path))
+    save_recoding_statistics(data["recoding"], get_recoding_path(output_path))
+
+    compiled_path = get_compiled_model_path(output_path)
+    compiled = compile_pipeline(pipeline)
+    if compiled is not None:
+        save_compiled_model(compiled, compiled_path)
+    elif os.path.exists(compiled_path):
+        os.remove(compiled_path)
+
+    with open(os.path.splitext(output_path)[0] + "_training.json", "w", encoding="utf-8") as f:
+        json.dump(log, f, indent=4)
+
+
+def train_model(path_to_file:str, output_path=OUTPUT_MODEL, nr_candidates=NR_CANDIDATES, recoding_file=None) -> bool:
+    # run the whole training (see header), returns True if the model was saved
+    start = time.perf_counter()
+    recoding = None
+    if recoding_file:
+        recoding = load_recoding_statistics(recoding_file)
+        if recoding is None:
+            print(f"- Error: Cannot load the recoding statistics '{recoding_file}'.")
+            return False
+    data = load_training_data(path_to_file, recoding=recoding)
+    if data is None:
+        return False
+    load_seconds = time.perf_counter() - start
+    print(f"- {len(data['y'])} training rows ({data['y'].mean():.1%} attacks), {len(data['features'])} features, "
+          f"loaded and encoded in {load_seconds:.2f} sec")
+
+    candidates = draw_candidates(nr_candidates)
+    print(f"- Successive halving search over {len(candidates)} candidates, {NR_FOLDS} folds, factor {FACTOR}:")
+    best, rounds = successive_halving(candidates, data)
+
+    fit_start = time.perf_counter()
+    pipeline = fit_final_model(best, data)
+    fit_seconds = time.perf_counter() - fit_start
+
+    log = {"training_data": path_to_file, "rows": len(data["y"]), "best_candidate": best,
+           "load_seconds": round(load_seconds, 3), "final_fit_seconds": round(fit_seconds, 3),
+           "total_seconds": round(time.perf_counter() - start, 3), "rounds": rounds}
+    save_model(pipeline, data, output_path, log)
+    print(f"- Final fit of {best[0]} on all rows in {fit_seconds:.2f} sec, total {log['total_seconds']:.2f} sec")
+    print(f"- Saved the model to {output_path}")
+    return True
+
+
+if __name__ == "__main__":
+
+    parsed_arguments = predict.parse_options(sys.argv, TRAIN_OPTIONS)
+    if parsed_arguments is None:
+        sys.exit(1)
+    arguments, options = parsed_arguments
+    if len(arguments) != 2:
+        print("- Error: Expects the training data, e.g. 'python scripts/train_model.py data/KDDTrain+.txt'.")
+        sys.exit(1)
+    if options["--candidates"] < 1:
+        print(f"- Error: Option --candidates expects at least 1 candidate, got {options['--candidates']}.")
+        sys.exit(1)
+
+    if not train_model(arguments[1], options["--output"], options["--candidates"], options["--recoding-file"] or None):
+        sys.exit(1)
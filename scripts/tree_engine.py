@@ -0,0 +1,496 @@
+############################################################################
+### NumPy inference engine for the random forest pipeline               ###
+############################################################################
+
+# Compile the pickled sklearn pipeline (one-hot encoding + random forest) into flat arrays
+# and predict with a vectorized tree traversal that needs neither pandas nor sklearn.
+#
+# export step: python scripts/tree_engine.py model/random_forest_model.pkl
+#              --> writes model/random_forest_model.npz
+
+import json
+import os
+import pickle
+import sys
+import numpy as np
+
+# ---------------------------------------- variables ----------------------------------------
+
+COMPILED_MODEL_VERSION = 1      # change when the arrays of the compiled model change
+BATCH_ROWS = 1024               # rows predicted at once, keeps the intermediate arrays in the cache
+MASK_TYPES = [np.uint32, np.uint64]  # leaf bit masks, for trees with up to 32 or 64 leaves
+# early exit (see predict_proba_early_exit): the trees are evaluated in batches and a row is retired
+# as soon as its class is decided, set with --early-exit and --threshold in predict.py
+EARLY_EXIT_MODES = ["exact", "bound"]
+EARLY_EXIT_MODE = ""            # "exact", "bound" or "" (all trees for every row)
+EARLY_EXIT_THRESHOLD = None     # probability of malicious from which a row is malicious, None: highest probability
+EARLY_EXIT_DELTA = 0.01         # "bound": max. probability that the remaining trees would change the class of a row
+TREE_BATCH = 16                 # trees evaluated for the remaining rows between two checks
+EARLY_EXIT_MARGIN = 1e-9        # per tree, votes closer to the decision are not retired (rounding of the sums)
+early_exit_stats = {"rows": 0, "tree_evaluations": 0, "trees": 0}  # counts of all predictions with early exit
+
+# ------------------------------------- compile model -------------------------------------
+
+def compile_pipeline(pipeline) -> dict | None:
+    """
+    Compile a fitted pipeline (ColumnTransformer with OneHotEncoder --> RandomForestClassifier)
+    into flat arrays. The one-hot encoding is folded into the trees: a split on the one-hot
+    column of (feature, category) becomes the test 'category code of feature == category',
+    so the engine only needs the category codes of the input features (see encode_categories).
+
+    Arrays of the compiled model (nodes of all trees in one array, numbered so that the
+    right child of a node directly follows its left child):
+    - node_column:     one-hot column tested at the node, a row goes right if it is 1 
+                       (leaves test the extra column that is always 0)
+    - node_left:       index of the left child node (leaves point to themselves)
+    - node_value:      class probabilities of the node (used at leaves)
+    - tree_roots:      index of the root node of each tree
+    - column_offsets:  first one-hot column of each input feature 
+    - classes:         class labels of the forest
+
+    If no tree has more than 64 leaves, the model also gets the arrays for the faster bit mask
+    prediction (see add_leaf_masks).
+
+    Returns None if the pipeline contains steps the engine does not support.
+    """
+    from sklearn.ensemble import RandomForestClassifier # only needed to compile, not to predict
+    if not hasattr(pipeline, "steps") or len(pipeline.steps) != 2 or not isinstance(pipeline.steps[1][1], RandomForestClassifier):
+        print("Only pipelines with a ColumnTransformer and a random forest can be compiled.")
+        return
+
+    transformer, forest = pipeline.steps[0][1], pipeline.steps[1][1]
+    features, categories = get_encoded_features(transformer)
+    if features is None:
+        return
+    column_offsets = np.cumsum([0] + [len(c) for c in categories])
+    zero_column = column_offsets[-1]
+
+    node_column, node_left, node_value, tree_roots = [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+
+        # a one-hot column is 0 or 1, sklearn goes left if value <= threshold
+        thresholds = tree.threshold[tree.children_left >= 0]
+        if ((thresholds < 0) | (thresholds >= 1)).any():
+            print("Only splits with thresholds between 0 and 1 on one-hot columns can be compiled.")
+            return
+
+        value = get_node_probabilities(tree)
+
+        # renumber the nodes breadth first, so that the children of a node are next to each other
+        order = [0]
+        new_left = {}
+        for node in order:
+            if tree.children_left[node] >= 0:
+                new_left[node] = len(order)
+                order += [tree.children_left[node], tree.children_right[node]]
+
+        for new_index, node in enumerate(order):
+            is_split = node in new_left
+            node_column.append(tree.feature[node] if is_split else zero_column)
+            node_left.append(offset + (new_left[node] if is_split else new_index))
+            node_value.append(value[node])
+
+        tree_roots.append(offset)
+        offset += len(order)
+
+    compiled = {
+        "version": COMPILED_MODEL_VERSION,
+        "features": features,
+        "categories": categories,
+        "classes": forest.classes_,
+        "max_depth": max(estimator.tree_.max_depth for estimator in forest.estimators_),
+        "node_column": np.array(node_column, dtype=np.intp),
+        "node_left": np.array(node_left, dtype=np.intp),
+        "node_value": np.array(node_value),
+        "tree_roots": np.array(tree_roots, dtype=np.intp),
+        "column_offsets": column_offsets.astype(np.intp),
+        }
+    add_leaf_masks(compiled, forest)
+    return compiled
+
+
+def add_leaf_masks(compiled:dict, forest):
+    """
+    Add the arrays for the bit mask prediction, if no tree has more than 64 leaves
+    (same idea as the QuickScorer algorithm for tree ensembles):
+
+    - The leaves of each tree are numbered from left to right and represented by one bit.
+    - A row goes right at a node if the tested one-hot column is 1, so none of the leaves 
+      in the left subtree can be reached. The mask of a node has 0 bits for these leaves.
+    - leaf_masks: one mask per one-hot column and tree (columns x trees), the AND of the
+      masks of all nodes that test the column. The last row (unknown categories) is all 1.
+    - The leaf of a row is the lowest bit that remains after the AND of the leaf_masks 
+      of all one-hot columns that are 1 for this row (only one column per feature).
+    - leaf_value: class probabilities of the leaves (trees * bits of the mask x classes)
+    """
+    max_leaves = max(estimator.tree_.n_leaves for estimator in forest.estimators_)
+    mask_type = next((t for t in MASK_TYPES if max_leaves <= np.iinfo(t).bits), None)
+    if mask_type is None:
+        return
+
+    nr_bits = np.iinfo(mask_type).bits
+    nr_trees = len(forest.estimators_)
+    all_leaves = (1 << nr_bits) - 1
+    leaf_masks = np.full((compiled["column_offsets"][-1] + 1, nr_trees), all_leaves, dtype=mask_type)
+    leaf_value = np.zeros((nr_trees * nr_bits, compiled["node_value"].shape[1]))
+
+    for i, estimator in enumerate(forest.estimators_):
+        tree = estimator.tree_
+        leaves = [] # leaves from left to right
+
+        def add_node(node):
+            # number the leaves below the node, add the mask of the node, return its first and last leaf + 1
+            if tree.children_left[node] < 0:
+                leaves.append(node)
+                return len(leaves) - 1, len(leaves)
+            first, middle = add_node(tree.children_left[node])
+            _, last = add_node(tree.children_right[node])
+            left_leaves = (1 << middle) - (1 << first)
+            leaf_masks[tree.feature[node], i] &= mask_type(all_leaves ^ left_leaves)
+            return first, last
+
+        add_node(0)
+        leaf_value[i * nr_bits:i * nr_bits + len(leaves)] = get_node_probabilities(tree)[leaves]
+
+    compiled["leaf_masks"] = leaf_masks
+    compiled["leaf_value"] = leaf_value
+
+
+def get_node_probabilities(tree) -> np.ndarray:
+    # class probabilities of all nodes of a sklearn tree, same normalization as DecisionTreeClassifier.predict_proba
+    value = tree.value[:, 0, :]
+    normalizer = value.sum(axis=1)
+    normalizer[normalizer == 0.0] = 1.0
+    return value / normalizer[:, np.newaxis]
+
+
+def get_encoded_features(transformer) -> tuple:
+    """
+    Return the input features and their categories (lists) from a fitted ColumnTransformer
+    whose only used transformer is a OneHotEncoder (optionally the last step of a pipeline).
+    Returns (None, None) if the transformer cannot be compiled.
+    """
+    features, categories = [], []
+    for name, encoder, columns in getattr(transformer, "transformers_", []):
+        if encoder == "drop":
+            continue
+        if hasattr(encoder, "steps"):
+            encoder = encoder.steps[-1][1]
+        if not hasattr(encoder, "categories_") or getattr(encoder, "drop_idx_", None) is not None \
+                or getattr(encoder, "_infrequent_enabled", False):
+            print(f"Transformer '{name}' is not supported, only one-hot encoding without dropped categories.")
+            return None, None
+
+        features += list(columns)
+        categories += [c.tolist() for c in encoder.categories_]
+
+    if not features:
+        print("No one-hot encoded features found.")
+        return None, None
+    return features, categories
+
+
+def save_compiled_model(compiled:dict, path_to_file:str):
+    # write the arrays to a .npz file, the feature names and categories are stored as json
+    metadata = {key: compiled[key] for key in ["version", "features", "categories", "max_depth"]}
+    arrays = {key: value for key, value in compiled.items() if key not in metadata}
+    np.savez(path_to_file, metadata=json.dumps(metadata), **arrays)
+
+
+def load_compiled_model(path_to_file:str) -> dict | None:
+    # read a compiled model from a .npz file, returns None if the file is missing or has another version
+    if not os.path.exists(path_to_file):
+        return
+
+    with np.load(path_to_file) as f:
+        compiled = json.loads(str(f["metadata"]))
+        compiled.update({key: f[key] for key in f.files if key != "metadata"})
+
+    if compiled["version"] != COMPILED_MODEL_VERSION:
+        print(f"Compiled model '{path_to_file}' has version {compiled['version']}, expected {COMPILED_MODEL_VERSION}.")
+        return
+    return compiled
+
+
+def get_compiled_model_path(model_path:str) -> str:
+    # the compiled model is stored next to the model: model/name.pkl --> model/name.npz
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def is_compiled_model(model) -> bool:
+    return isinstance(model, dict) and "node_left" in model
+
+# --------------------------------------- prediction ---------------------------------------
+
+def encode_categories(compiled:dict, data_df) -> np.ndarray:
+    """
+    Return the category codes of the compiled model's input features as matrix (rows x features),
+    -1 for values that are missing or not in the categories (ignored like in the one-hot encoding).
+    Columns that are already categorical with the same categories (preprocessing with the
+    feature schema of the model) are used without conversion.
+    """
+    codes = np.empty((len(data_df), len(compiled["features"])), dtype=np.int32)
+    for i, (feature, categories) in enumerate(zip(compiled["features"], compiled["categories"])):
+        column = data_df[feature]
+        if hasattr(column, "cat") and column.cat.categories.tolist() == categories:
+            codes[:, i] = column.cat.codes.to_numpy()
+        else:
+            codes[:, i] = category_codes(column.to_numpy(), categories)
+    return codes
+
+
+def category_codes(values:np.ndarray, categories:list) -> np.ndarray:
+    # position of each value in the (sorted) categories, -1 if it is not a category
+    categories = np.asarray(categories)
+    if values.dtype == object or categories.dtype.kind in "US":
+        values = values.astype(str)
+        categories = categories.astype(str)
+
+    positions = np.searchsorted(categories, values).clip(0, len(categories) - 1)
+    return np.where(categories[positions] == values, positions, -1)
+
+
+def encode_one_hot(compiled:dict, codes:np.ndarray) -> np.ndarray:
+    # one-hot matrix (rows x one-hot columns + 1 column that is always 0) from the category codes
+    nr_rows = len(codes)
+    nr_columns = compiled["column_offsets"][-1] + 1
+    one_hot = np.zeros((nr_rows, nr_columns), dtype=np.intp)
+
+    rows = np.arange(nr_rows)
+    for i, column_offset in enumerate(compiled["column_offsets"][:-1]):
+        known = codes[:, i] >= 0 # unknown categories have no one-hot column
+        one_hot[rows[known], column_offset + codes[known, i]] = 1
+    return one_hot
+
+
+def find_leaves(compiled:dict, codes:np.ndarray, trees=None) -> np.ndarray:
+    """
+    Traverse all trees (or the trees first to last - 1 of trees=(first, last)) for all rows at once 
+    and return the leaf index of each row and tree (rows x trees). Leaves point to themselves, 
+    so every row can take max_depth steps.
+    A step goes to the left child + 1 (= right child) if the tested one-hot column of the row is 1.
+    """
+    node_column, node_left = compiled["node_column"], compiled["node_left"]
+
+    one_hot = encode_one_hot(compiled, codes)
+    nr_rows, nr_columns = one_hot.shape
+    flat_one_hot = one_hot.ravel()
+    row_offsets = (np.arange(nr_rows) * nr_columns)[:, np.newaxis]
+
+    tree_roots = compiled["tree_roots"] if trees is None else compiled["tree_roots"][trees[0]:trees[1]]
+    nodes = np.repeat(tree_roots[np.newaxis, :], nr_rows, axis=0)
+    for _ in range(compiled["max_depth"]):
+        nodes = node_left[nodes] + flat_one_hot[row_offsets + node_column[nodes]]
+    return nodes
+
+
+def find_leaves_with_masks(compiled:dict, codes:np.ndarray, trees=None) -> np.ndarray:
+    """
+    Return the leaf of each row and tree (rows x trees) as index in leaf_value, 
+    with the bit masks from add_leaf_masks(). trees: see find_leaves().
+    """
+    first, last = (0, compiled["leaf_masks"].shape[1]) if trees is None else trees
+    leaf_masks = compiled["leaf_masks"] if trees is None else np.ascontiguousarray(compiled["leaf_masks"][:, first:last])
+    nr_bits = leaf_masks.itemsize * 8
+
+    # one-hot column of each feature that is 1, unknown categories use the last row (all 1)
+    columns = np.where(codes >= 0, codes + compiled["column_offsets"][:-1], len(leaf_masks) - 1)
+    masks = leaf_masks[columns[:, 0]]
+    for i in range(1, columns.shape[1]):
+        np.bitwise_and(masks, leaf_masks[columns[:, i]], out=masks)
+
+    # index of the lowest bit: isolate it and take the exponent of the power of 2
+    lowest_bit = masks & (~masks + masks.dtype.type(1))
+    leaf_bits = np.frexp(lowest_bit.astype(np.float64))[1] - 1
+    return leaf_bits + np.arange(first, last) * nr_bits
+
+
+def predict_proba_compiled(compiled:dict, codes:np.ndarray, batch_rows=BATCH_ROWS) -> np.ndarray:
+    """
+    Return the class probabilities (rows x classes) for the category codes from encode_categories().
+    Identical to RandomForestClassifier.predict_proba: the tree probabilities are added up
+    in the order of the trees and divided by the nr of trees.
+
+    Uses the bit masks (find_leaves_with_masks) if the compiled model has them, 
+    otherwise the tree traversal (find_leaves).
+    With EARLY_EXIT_MODE, see predict_proba_early_exit() (the trees per row are counted in early_exit_stats).
+    """
+    if EARLY_EXIT_MODE and len(compiled["classes"]) == 2:
+        probabilities, trees_per_row = predict_proba_early_exit(compiled, codes, EARLY_EXIT_MODE, EARLY_EXIT_THRESHOLD, 
+                                                                batch_rows=batch_rows)
+        early_exit_stats["rows"] += len(codes)
+        early_exit_stats["tree_evaluations"] += int(trees_per_row.sum())
+        early_exit_stats["trees"] = len(compiled["tree_roots"])
+        return probabilities
+
+    find_leaves_function, leaf_value = get_leaf_function(compiled)
+
+    # one array per class, the probabilities of a row are added up tree by tree
+    class_values = [np.ascontiguousarray(leaf_value[:, k]) for k in range(leaf_value.shape[1])]
+    probabilities = np.zeros((len(class_values), len(codes)))
+
+    for start in range(0, len(codes), batch_rows):
+        leaves = find_leaves_function(compiled, codes[start:start + batch_rows]).T.copy()
+        for values, class_probabilities in zip(class_values, probabilities[:, start:start + batch_rows]):
+            for tree_leaves in leaves:
+                class_probabilities += values[tree_leaves]
+
+    probabilities /= len(compiled["tree_roots"])
+    return probabilities.T
+
+
+def get_leaf_function(compiled:dict) -> tuple:
+    # find_leaves function and the class probabilities of its leaf indices
+    if "leaf_masks" in compiled:
+        return find_leaves_with_masks, compiled["leaf_value"]
+    return find_leaves, compiled["node_value"]
+
+
+def get_tree_vote_ranges(compiled:dict, leaf_votes:np.ndarray) -> tuple:
+    # min. and max. vote of the leaves of every tree (leaf_votes: one vote per index of get_leaf_function)
+    nr_trees = len(compiled["tree_roots"])
+    if "leaf_masks" in compiled:
+        # unused bits of the masks have no leaf (probabilities 0)
+        is_leaf = compiled["leaf_value"].sum(axis=1) > 0
+        tree_of_leaf = np.arange(len(leaf_votes)) // (compiled["leaf_masks"].itemsize * 8)
+    else:
+        is_leaf = compiled["node_left"] == np.arange(len(leaf_votes))
+        tree_of_leaf = np.searchsorted(compiled["tree_roots"], np.arange(len(leaf_votes)), side="right") - 1
+    tree_min, tree_max = np.full(nr_trees, np.inf), np.full(nr_trees, -np.inf)
+    np.minimum.at(tree_min, tree_of_leaf[is_leaf], leaf_votes[is_leaf])
+    np.maximum.at(tree_max, tree_of_leaf[is_leaf], leaf_votes[is_leaf])
+    return tree_min, tree_max
+
+
+def predict_proba_early_exit(compiled:dict, codes:np.ndarray, mode="exact", threshold=None, delta=EARLY_EXIT_DELTA, 
+                             tree_batch=TREE_BATCH, batch_rows=BATCH_ROWS) -> tuple:
+    """
+    Same as predict_proba_compiled() for a model with 2 classes, but the trees are evaluated in batches
+    and a row is retired when its class is decided. Returns the probabilities (rows x classes) and the nr
+    of trees evaluated per row.
+
+    The class follows from the sum of the votes of all trees: probability of class 1 - probability of class 0 
+    (> 0: class 1, as the highest probability) or, with threshold, the probability of class 1 (>= threshold * trees).
+    - "exact":  retired if the min. (max.) vote of every remaining tree cannot change the class,
+                the classes are always the same as with all trees.
+    - "bound":  also retired if the mean vote of the remaining trees would have to differ from the mean 
+                of the evaluated trees by more than the Hoeffding bound for delta (the trees as random samples), 
+                stops earlier, but the class can differ for a share of about delta of the rows.
+    Rows that are evaluated by all trees get the same probabilities as predict_proba_compiled(), retired rows
+    the probability that follows from the mean vote of their evaluated trees (limited to the range of the decision).
+    """
+    find_leaves_function, leaf_value = get_leaf_function(compiled)
+    nr_trees = len(compiled["tree_roots"])
+    class_values = [np.ascontiguousarray(leaf_value[:, k]) for k in range(leaf_value.shape[1])]
+    leaf_votes = class_values[1] - (class_values[0] if threshold is None else 0)
+    decision = 0.0 if threshold is None else threshold * nr_trees
+    margin = EARLY_EXIT_MARGIN * nr_trees
+
+    # bounds of the votes of the trees after the first t trees (index t)
+    tree_min, tree_max = get_tree_vote_ranges(compiled, leaf_votes)
+    rest_min = np.concatenate([np.cumsum(tree_min[::-1])[::-1], [0.0]])
+    rest_max = np.concatenate([np.cumsum(tree_max[::-1])[::-1], [0.0]])
+    vote_range = (tree_max - tree_min).max()
+
+    # the first check when the class of a row can be decided at all (all evaluated trees vote max. or min.)
+    first_trees = np.arange(nr_trees + 1)
+    decidable = ((np.concatenate([[0.0], np.cumsum(tree_max)]) + rest_min[first_trees] > decision + margin)
+                 | (np.concatenate([[0.0], np.cumsum(tree_min)]) + rest_max[first_trees] < decision - margin))
+    checks = [max(int(np.argmax(decidable)), 1) if mode == "exact" and decidable.any() else min(tree_batch, nr_trees)]
+    while checks[-1] < nr_trees:
+        checks.append(min(checks[-1] + tree_batch, nr_trees))
+
+    # all remaining rows are evaluated by the next batch of trees (in blocks of rows x trees 
+    # as large as batch_rows x all trees), then the decided rows are retired
+    probabilities = np.zeros((len(class_values), len(codes)))
+    trees_per_row = np.full(len(codes), nr_trees, dtype=np.int64)
+    active = np.arange(len(codes))
+    first = 0
+    for last in checks:
+        block_rows = batch_rows * nr_trees // (last - first)
+        for start in range(0, len(active), block_rows):
+            rows = active[start:start + block_rows]
+            leaves = find_leaves_function(compiled, codes[rows], (first, last)).T.copy()
+            for values, class_probabilities in zip(class_values, probabilities):
+                row_probabilities = class_probabilities[rows]
+                for tree_leaves in leaves:
+                    row_probabilities += values[tree_leaves]
+                class_probabilities[rows] = row_probabilities
+        first = last
+        if last == nr_trees:
+            break
+
+        votes = probabilities[1, active] - (probabilities[0, active] if threshold is None else 0)
+        lower, upper = votes + rest_min[last], votes + rest_max[last]
+        estimate = votes + votes / last * (nr_trees - last)
+        if mode == "bound":
+            deviation = vote_range * np.sqrt(np.log(1 / delta) / (2 * last)) * (nr_trees - last)
+            lower = np.maximum(lower, estimate - deviation)
+            upper = np.minimum(upper, estimate + deviation)
+        decided = (lower > decision + margin) | (upper < decision - margin)
+        if decided.any():
+            # probability of class 1 from the estimated sum of the votes of all trees
+            total_votes = np.clip(estimate[decided], lower[decided], upper[decided])
+            probability = total_votes / nr_trees if threshold is not None else (1 + total_votes / nr_trees) / 2
+            retired = active[decided]
+            probabilities[1, retired] = probability * nr_trees
+            probabilities[0, retired] = (1 - probability) * nr_trees
+            trees_per_row[retired] = last
+            active = active[~decided]
+        if not len(active):
+            break
+
+    probabilities /= nr_trees
+    return probabilities.T, trees_per_row
+
+
+def get_early_exit_summary(stats=early_exit_stats) -> dict | None:
+    # mean nr of trees evaluated per row and the share of tree evaluations saved, None without predictions
+    if not stats["rows"]:
+        return
+    mean_trees = stats["tree_evaluations"] / stats["rows"]
+    return {"rows": stats["rows"], "trees": stats["trees"], "mean_trees_per_row": mean_trees, 
+            "saved_share": 1 - mean_trees / stats["trees"]}
+
+
+def merge_early_exit_stats(stats:dict | None):
+    # add the counts of another process (e.g. a worker of predict.py) to early_exit_stats
+    if stats:
+        early_exit_stats["rows"] += stats["rows"]
+        early_exit_stats["tree_evaluations"] += stats["tree_evaluations"]
+        early_exit_stats["trees"] = max(early_exit_stats["trees"], stats["trees"])
+
+
+def print_early_exit_stats():
+    summary = get_early_exit_summary()
+    if summary is not None:
+        print(f"- Early exit ({EARLY_EXIT_MODE}): {summary['mean_trees_per_row']:.1f} of {summary['trees']} trees per row "
+              f"on average, {summary['saved_share']:.1%} fewer tree evaluations.")
+
+
+def predict_compiled(compiled:dict, codes:np.ndarray) -> np.ndarray:
+    # class with the highest probability, same as RandomForestClassifier.predict
+    probabilities = predict_proba_compiled(compiled, codes)
+    return compiled["classes"][np.argmax(probabilities, axis=1)]
+
+
+if __name__ == "__main__":
+
+    # compile a pickled model pipeline and save it next to the model file
+    if len(sys.argv) != 2:
+        print("- Error: Expects the path to a pickled model, e.g. 'python scripts/tree_engine.py model/random_forest_model.pkl'.")
+        sys.exit(1)
+
+    model_path = sys.argv[1]
+    with open(model_path, "rb") as f:
+        pipeline = pickle.load(f)
+
+    compiled = compile_pipeline(pipeline)
+    if compiled is None:
+        sys.exit(1)
+
+    compiled_path = get_compiled_model_path(model_path)
+    save_compiled_model(compiled, compiled_path)
+    print(f"- Compiled {len(compiled['tree_roots'])} trees with {len(compiled['node_left'])} nodes to '{compiled_path}'.")